@@ -0,0 +1,194 @@
+"""Load test of the WSGI app under gunicorn against the ASGI app under uvicorn.
+
+Starts each server on a Riyaz site, opens a number of idle tabs, like
+learners with a lesson open, and then measures the latency of page
+requests from concurrent clients.
+
+The tabs watch the version of the course as the pages do: on the WSGI app
+they poll it every second, and on the ASGI app, which keeps open streams
+on the event loop, they open event streams. The WSGI app has no event
+streams, as each open stream would hold one of its threads.
+
+    $ pip install gunicorn uvicorn
+    $ python benchmarks/asgi_vs_wsgi.py -d riyaz-school \\
+        --url /courses/hello-world --course hello-world \\
+        --idle 100 --concurrency 8 --duration 10
+"""
+import argparse
+import http.client
+import shlex
+import socket
+import statistics
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+
+SERVERS = {
+    "wsgi": "gunicorn -k gthread --workers 2 --threads 8 "
+            "-b 127.0.0.1:{port} riyaz.app:app",
+    "asgi": "gunicorn -k uvicorn.workers.UvicornWorker --workers 2 "
+            "-b 127.0.0.1:{port} riyaz.asgi:app",
+}
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server didn't start on port {port}")
+
+
+def open_event_streams(port, path, count):
+    streams = []
+    for _ in range(count):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n"
+                     f"Accept: text/event-stream\r\n\r\n".encode())
+        streams.append(sock)
+    return streams
+
+
+def start_polling(port, path, count, stop):
+    """Starts `count` threads that GET `path` every second until `stop` is
+    set, and returns a list with the number of polls of each thread.
+    """
+    polls = [0] * count
+
+    def poll(i):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while not stop.wait(1.0):
+            try:
+                conn.request("GET", path)
+                conn.getresponse().read()
+                polls[i] += 1
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        conn.close()
+
+    for i in range(count):
+        threading.Thread(target=poll, args=(i,), daemon=True).start()
+    return polls
+
+
+def run_clients(port, url, concurrency, duration):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while time.time() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request("GET", url)
+                response = conn.getresponse()
+                response.read()
+                error = response.status != 200 and f"status {response.status}"
+            except (OSError, http.client.HTTPException) as e:
+                error = str(e)
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            elapsed = time.perf_counter() - start
+
+            with lock:
+                if error:
+                    errors.append(error)
+                else:
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+
+def count_live(streams):
+    """Returns the number of streams that got events from the server.
+    """
+    count = 0
+    for sock in streams:
+        sock.setblocking(False)
+        try:
+            count += b"event: version" in sock.recv(65536)
+        except OSError:
+            pass
+    return count
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def benchmark(name, command, args):
+    port = args.port
+    process = subprocess.Popen(
+        shlex.split(command.format(port=port)), cwd=args.root_directory,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        stop = threading.Event()
+        if name == "asgi":
+            streams = open_event_streams(
+                port, f"/api/courses/{args.course}/events", args.idle)
+        else:
+            polls = start_polling(
+                port, f"/api/courses/{args.course}/version", args.idle, stop)
+        time.sleep(1)
+
+        latencies, errors = run_clients(
+            port, args.url, args.concurrency, args.duration)
+        if name == "asgi":
+            live_tabs = count_live(streams)
+            for sock in streams:
+                sock.close()
+        else:
+            live_tabs = sum(1 for count in polls if count)
+            stop.set()
+    finally:
+        process.terminate()
+        process.wait()
+
+    if latencies:
+        print(f"{name:6} {len(latencies) / args.duration:8.1f} "
+              f"{statistics.median(latencies) * 1000:8.1f} "
+              f"{percentile(latencies, 99) * 1000:8.1f} "
+              f"{len(errors):7d} {live_tabs:5d}/{args.idle}")
+    else:
+        print(f"{name:6} no successful requests, {len(errors)} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-d", "--root-directory", type=Path, default=Path("."),
+                        help="riyaz site with imported courses")
+    parser.add_argument("--url", default="/")
+    parser.add_argument("--course", default="hello-world",
+                        help="course of the idle tabs")
+    parser.add_argument("--idle", type=int, default=100,
+                        help="number of idle tabs")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    for name, command in SERVERS.items():
+        parser.add_argument(f"--{name}-command", default=command,
+                            help=f"command to start the {name} server")
+    args = parser.parse_args()
+
+    print(f"{'server':6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'tabs':>7}")
+    for name in SERVERS:
+        benchmark(name, getattr(args, f"{name}_command"), args)
+
+
+if __name__ == "__main__":
+    main()
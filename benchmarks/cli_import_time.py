@@ -0,0 +1,65 @@
+"""Import time of riyaz.cli and wall time of `riyaz --help`.
+
+Runs `python -X importtime -c "import riyaz.cli"` in fresh processes and
+prints the cumulative import time of riyaz.cli and of the slowest modules
+it imports, and the time of a whole `riyaz --help`:
+
+    $ python benchmarks/cli_import_time.py --runs 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def get_import_times(module):
+    """Returns the cumulative import time in seconds of every module imported
+    by `import module` in a new interpreter, from `python -X importtime`.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True)
+
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def time_help():
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "from riyaz.cli import main; main()", "--help"],
+        capture_output=True, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10,
+                        help="number of the slowest modules to print")
+    args = parser.parse_args()
+
+    runs = [get_import_times("riyaz.cli") for _ in range(args.runs)]
+    help_times = [time_help() for _ in range(args.runs)]
+
+    medians = {name: statistics.median(run.get(name, 0) for run in runs)
+               for name in runs[0]}
+    print(f"import riyaz.cli: {medians['riyaz.cli'] * 1000:.1f} ms")
+    print(f"riyaz --help:     {statistics.median(help_times) * 1000:.1f} ms")
+    print()
+    print(f"{'module':40} {'cumulative (ms)':>16}")
+    slowest = sorted(((name, seconds) for name, seconds in medians.items()
+                      if name != "riyaz.cli"), key=lambda item: -item[1])
+    for name, seconds in slowest[:args.top]:
+        print(f"{name:40} {seconds * 1000:16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Cold-start latency of a new worker.
+
+Starts fresh Python processes on a Riyaz site, like new gunicorn workers,
+and measures the time to import the app and the latency of the first
+request to the index, a course page and a lesson page:
+
+    - cold: templates are compiled on first use
+    - bytecode: templates are loaded from a warm template_cache_dir
+    - warmup: riyaz.warmup.warmup() runs before the first request
+
+    $ python benchmarks/cold_start.py -d riyaz-school --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+
+WORKER_SCRIPT = """
+import json, sys, time
+
+start = time.perf_counter()
+from riyaz import config
+config.template_cache_dir = sys.argv[1] or None
+from riyaz.app import app
+from riyaz.db import Course
+timings = {"import": time.perf_counter() - start}
+
+if sys.argv[2] == "warmup":
+    from riyaz.warmup import warmup
+    start = time.perf_counter()
+    warmup()
+    timings["warmup"] = time.perf_counter() - start
+
+course = Course.find_published()[0]
+lesson = course.get_modules()[0].get_lessons()[0]
+client = app.test_client()
+for name, url in [("index", "/"),
+                  ("course", f"/courses/{course.key}"),
+                  ("lesson", lesson.get_url())]:
+    start = time.perf_counter()
+    assert client.get(url).status_code == 200
+    timings[name] = time.perf_counter() - start
+
+print(json.dumps(timings))
+"""
+
+
+def run_worker(root_directory, template_cache_dir, mode):
+    output = subprocess.check_output(
+        [sys.executable, "-c", WORKER_SCRIPT, template_cache_dir, mode],
+        cwd=root_directory)
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-d", "--root-directory", type=Path, default=Path("."),
+                        help="riyaz site with imported courses")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="riyaz_templates_") as cache_dir:
+        # fill the template cache
+        run_worker(args.root_directory, cache_dir, "warmup")
+
+        modes = {
+            "cold": ("", "none"),
+            "bytecode": (cache_dir, "none"),
+            "warmup": (cache_dir, "warmup"),
+        }
+        columns = ["import", "warmup", "index", "course", "lesson"]
+        print(f"{'mode':10}" + "".join(f"{c + ' ms':>12}" for c in columns))
+        for mode, (template_cache_dir, warmup) in modes.items():
+            runs = [run_worker(args.root_directory, template_cache_dir, warmup)
+                    for _ in range(args.runs)]
+            row = f"{mode:10}"
+            for column in columns:
+                values = [run[column] for run in runs if column in run]
+                row += (f"{statistics.median(values) * 1000:12.1f}"
+                        if values else f"{'-':>12}")
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Memory and latency of the in-memory course graph.
+
+Imports a synthetic course, measures the memory of its course graph with
+tracemalloc, and compares the latency of the course and lesson pages and
+the SQL queries per page when they are read from the database and from the
+graph. The response cache is off, so that every request renders its page.
+
+    $ python benchmarks/course_graph.py --modules 100 --lessons 10
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+
+def measure(client, url, requests):
+    client.get(url)  # warm up
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p99": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+    }
+
+
+def count_queries(client, url):
+    from riyaz.db import get_db
+
+    db = get_db()
+    queries = []
+    query = db.query
+
+    def counting_query(*args, **kwargs):
+        queries.append(args[0])
+        return query(*args, **kwargs)
+
+    db.query = counting_query
+    try:
+        client.get(url)
+    finally:
+        del db.query
+    return len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", type=int, default=100)
+    parser.add_argument("--lessons", type=int, default=10,
+                        help="lessons per module")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="riyaz_bench_") as tempdir:
+        from riyaz import config
+        from riyaz.app import app
+        from riyaz.disk import CourseLoader
+        from riyaz.graph import CourseGraph, course_graph
+        from riyaz.migrate import migrate
+        from riyaz.synthetic import generate_course
+
+        config.database_path = str(Path(tempdir) / "riyaz.db")
+        config.assets_path = str(Path(tempdir) / "assets")
+        config.response_cache = False
+        migrate()
+
+        course_dir = generate_course(
+            Path(tempdir), modules=args.modules, lessons=args.lessons,
+            lesson_size_kb=1)
+        CourseLoader(course_dir).load()
+
+        graph = CourseGraph()
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        lessons = graph.load_all()
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        size = after - before
+
+        client = app.test_client()
+        course = graph.get_course("synthetic")
+        urls = {
+            "course": "/courses/synthetic",
+            "lesson": course.get_outline()[0].lessons[1].get_url(),
+        }
+
+        results = {}
+        for enabled in [False, True]:
+            config.course_graph = enabled
+            course_graph.clear()
+            for name, url in urls.items():
+                results[name, enabled] = {
+                    **measure(client, url, args.requests),
+                    "queries": count_queries(client, url),
+                }
+
+    print(f"course graph of {lessons} lessons: {size / 1024:.0f} KB, "
+          f"{size / lessons * 1000 / 1024 / 1024:.2f} MB per 1,000 lessons")
+    print(f"{'':20} {'p50 (ms)':>10} {'p99 (ms)':>10} {'queries':>8}")
+    for (name, enabled), r in results.items():
+        label = f"{name} ({'graph' if enabled else 'database'})"
+        print(f"{label:20} {r['p50']:10.2f} {r['p99']:10.2f} {r['queries']:8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Throughput of the markdown renderers in riyaz.render.
+
+Renders a corpus made of the sample courses and a synthetic lesson with
+every installed renderer, and reports MB/s and whether the fenced code
+blocks match the output of the default renderer.
+
+    $ python benchmarks/renderers.py --size 1024
+"""
+import argparse
+import re
+import time
+from pathlib import Path
+
+from view_lesson import make_lesson
+
+root = Path(__file__).parent.parent
+
+
+def get_corpus(size_kb):
+    sample = "\n\n".join(
+        path.read_text() for path in sorted(root.glob("sample_courses/**/*.md")))
+    return sample + "\n\n" + make_lesson(size_kb)
+
+
+def get_code_blocks(html):
+    return re.findall(r"<pre>.*?</pre>", html, re.DOTALL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=1024,
+                        help="size of the synthetic lesson in KB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from riyaz import render
+
+    corpus = get_corpus(args.size)
+    size_mb = len(corpus.encode()) / 1024 / 1024
+    expected = get_code_blocks(render.get_renderer("python-markdown")(corpus))
+
+    print(f"corpus: {size_mb:.2f} MB")
+    print(f"{'renderer':20} {'MB/s':>10} {'code blocks':>12}")
+    for name in render.renderers:
+        try:
+            render_fn = render.get_renderer(name)
+        except ImportError:
+            print(f"{name:20} {'not installed':>10}")
+            continue
+
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            html = render_fn(corpus)
+            best = min(best, time.perf_counter() - start)
+
+        same = "identical" if get_code_blocks(html) == expected else "DIFFERENT"
+        print(f"{name:20} {size_mb / best:10.2f} {same:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Benchmark suite on a synthetic course.
+
+Generates a course with riyaz.synthetic, imports it into a temporary site
+and times the import, the course outline, the course and lesson pages,
+and the version endpoint. Results are written as JSON, and two results,
+like from two commits, can be compared to find regressions.
+
+    $ python benchmarks/suite.py run -o before.json
+    $ git checkout my-branch
+    $ python benchmarks/suite.py run -o after.json
+    $ python benchmarks/suite.py compare before.json after.json
+
+compare exits with status 1 when the median of a benchmark is slower by
+more than --threshold (10% by default).
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, text=True,
+            stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(f, repeat):
+    f()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    return {
+        "runs": repeat,
+        "min": timings[0],
+        "median": statistics.median(timings),
+        "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+    }
+
+
+def run_suite(args):
+    from riyaz import config
+    from riyaz.synthetic import generate_course
+
+    with tempfile.TemporaryDirectory(prefix="riyaz_bench_") as tempdir:
+        config.database_path = str(Path(tempdir) / "riyaz.db")
+        config.assets_path = str(Path(tempdir) / "assets")
+
+        from riyaz.app import app
+        from riyaz.db import Course
+        from riyaz.disk import CourseLoader
+        from riyaz.migrate import migrate
+
+        migrate()
+        course_dir = generate_course(
+            Path(tempdir), name="synthetic", modules=args.modules,
+            lessons=args.lessons, authors=args.authors,
+            lesson_size_kb=args.lesson_size)
+        loader = CourseLoader(course_dir)
+        loader.load()
+
+        client = app.test_client()
+        lesson_url = (f"/courses/synthetic/module-{(args.modules + 1) // 2}"
+                      f"/lesson-{(args.lessons + 1) // 2}")
+
+        def get(url):
+            def f():
+                assert client.get(url).status_code == 200
+            return f
+
+        benchmarks = {
+            "load": (loader.load, args.load_repeat),
+            "outline": (
+                lambda: Course.find(key="synthetic").get_outline(),
+                args.repeat),
+            "view_course": (get("/courses/synthetic"), args.repeat),
+            "view_lesson": (get(lesson_url), args.repeat),
+            "version": (get("/api/courses/synthetic/version"), args.repeat),
+        }
+
+        results = {}
+        for name, (f, repeat) in benchmarks.items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = measure(f, repeat)
+            print(f"{name:12} {results[name]['median'] * 1000:10.2f} ms",
+                  file=sys.stderr)
+
+    return {
+        "commit": get_git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "course": {
+            "modules": args.modules,
+            "lessons": args.lessons,
+            "authors": args.authors,
+            "lesson_size_kb": args.lesson_size,
+        },
+        "benchmarks": results,
+    }
+
+
+def compare(base, new, threshold):
+    """Prints the change of every benchmark from base to new, and returns
+    the names of the benchmarks that got slower by more than threshold.
+    """
+    if base["course"] != new["course"]:
+        print(f"warning: different courses {base['course']} and "
+              f"{new['course']}")
+
+    print(f"{'benchmark':12} {base['commit'] or 'base':>10} "
+          f"{new['commit'] or 'new':>10} {'change':>8}   (median ms)")
+    regressions = []
+    for name, result in new["benchmarks"].items():
+        if name not in base["benchmarks"]:
+            continue
+        before = base["benchmarks"][name]["median"]
+        after = result["median"]
+        change = after / before - 1
+        flag = ""
+        if change > threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "faster"
+        print(f"{name:12} {before * 1000:10.2f} {after * 1000:10.2f} "
+              f"{change:+8.1%}   {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="run the benchmarks")
+    run.add_argument("-o", "--output", type=Path,
+                     help="JSON file to write the results to")
+    run.add_argument("--modules", type=int, default=20)
+    run.add_argument("--lessons", type=int, default=20,
+                     help="number of lessons in each module")
+    run.add_argument("--authors", type=int, default=3)
+    run.add_argument("--lesson-size", type=float, default=8,
+                     help="size of each lesson in KB")
+    run.add_argument("--repeat", type=int, default=50)
+    run.add_argument("--load-repeat", type=int, default=5,
+                     help="number of times to import the course")
+    run.add_argument("--only", nargs="+", help="benchmarks to run")
+
+    cmp = subparsers.add_parser("compare", help="compare two results")
+    cmp.add_argument("base", type=Path)
+    cmp.add_argument("new", type=Path)
+    cmp.add_argument("--threshold", type=float, default=0.1,
+                     help="slowdown of the median to flag as a regression")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_suite(args)
+        output = json.dumps(results, indent=2)
+        if args.output:
+            args.output.write_text(output + "\n")
+        else:
+            print(output)
+    else:
+        regressions = compare(json.loads(args.base.read_text()),
+                              json.loads(args.new.read_text()),
+                              args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
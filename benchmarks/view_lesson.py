@@ -0,0 +1,72 @@
+"""Benchmark of view_lesson latency for a large lesson.
+
+Compares rendering the lesson markdown on every request (as before HTML was
+stored at import) with serving the HTML rendered at import.
+
+    $ python benchmarks/view_lesson.py --size 200 --requests 200
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+
+def measure(client, url, requests):
+    client.get(url)  # warm up
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p99": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=200,
+                        help="size of the lesson in KB")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="riyaz_bench_") as tempdir:
+        from riyaz import config, render
+        from riyaz.app import app
+        from riyaz.db import get_db
+        from riyaz.disk import CourseLoader
+        from riyaz.migrate import migrate
+        from riyaz.synthetic import generate_course
+
+        config.database_path = str(Path(tempdir) / "riyaz.db")
+        config.assets_path = str(Path(tempdir) / "assets")
+        migrate()
+
+        course_dir = generate_course(
+            Path(tempdir), name="bench-course", modules=1, lessons=1,
+            lesson_size_kb=args.size)
+        CourseLoader(course_dir).load()
+        client = app.test_client()
+        url = "/courses/bench-course/module-1/lesson-1"
+
+        after = measure(client, url, args.requests)
+
+        # render on every request, like before the HTML was stored
+        get_db().update("lesson", where="1=1", content_html=None)
+        render.render_cache.maxsize = 0
+        render.render_cache.clear()
+        before = measure(client, url, args.requests)
+
+    print(f"view_lesson, {args.size} KB lesson, {args.requests} requests")
+    print(f"{'':20} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    print(f"{'render per request':20} {before['p50']:10.2f} {before['p99']:10.2f}")
+    print(f"{'rendered at import':20} {after['p50']:10.2f} {after['p99']:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,293 @@
 from flask import (
-    Flask, abort, render_template, send_from_directory
+    Flask, abort, g, make_response, render_template, request,
+    send_from_directory
 )
+from jinja2 import FileSystemBytecodeCache, Template
 
+import functools
 import importlib
-import markdown
-from typing import List
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 
-from . import config
+from . import config, metrics
+from .assets import AssetBundle, load_asset_bundle
+from .cache import (
+    CachedResponse, FragmentCacheExtension, ResponseCache, SharedCache
+)
+from .compression import compress, is_compressible, negotiate_encoding
 from .db import Course, Store
+from .graph import course_graph
+from .highlight import (
+    get_fingerprint, get_stylesheet, get_stylesheet_filename
+)
+from .jobs import Job
+from .profiling import ProfilerMiddleware
+from .render import render_cache, render_markdown_cached
+
+
+class TimedTemplate(Template):
+    """Template that records its render time in the metrics.
+    """
+
+    def render(self, *args, **kwargs):
+        if not config.metrics:
+            return super().render(*args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            metrics.template_render_duration.observe(
+                time.perf_counter() - start, self.name or "<string>")
 
 
 app = Flask("riyaz")
+app.jinja_env.template_class = TimedTemplate
+app.jinja_env.add_extension(FragmentCacheExtension)
+app.wsgi_app = ProfilerMiddleware(app.wsgi_app, app)
+
+
+def configure_template_cache():
+    """Keeps compiled templates in `template_cache_dir`, if it is set.
+    """
+    if config.template_cache_dir:
+        os.makedirs(config.template_cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+            config.template_cache_dir)
+    else:
+        app.jinja_env.bytecode_cache = None
+
+
+configure_template_cache()
+
+
+def configure_fragment_cache():
+    """Keeps at most `fragment_cache_size` template fragments in memory.
+    """
+    app.jinja_env.fragment_cache.maxsize = config.fragment_cache_size
+
+
+configure_fragment_cache()
 
 javascript_urls: List[str] = []
 stylesheet_urls: List[str] = []
+lesson_javascript_urls: List[str] = []
+lesson_stylesheet_urls: List[str] = []
+lesson_javascript_hooks: List[Callable[[List[str]], List[str]]] = []
 plugins: List[str] = [
     "riyaz.plugins.feather",
 ]
 
 
+_response_cache: Optional[ResponseCache] = None
+_shared_cache: Optional[SharedCache] = None
+
+
+def configure_shared_cache():
+    """Shares cached pages and template fragments between the workers in
+    `shared_cache_path`, if it is set.
+    """
+    global _shared_cache, _response_cache
+    if config.shared_cache_path:
+        _shared_cache = SharedCache(
+            config.shared_cache_path,
+            maxsize=config.shared_cache_size * 1024 * 1024)
+    else:
+        _shared_cache = None
+
+    app.jinja_env.shared_cache = _shared_cache
+    _response_cache = None
+
+
+configure_shared_cache()
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        # with a shared cache, pages are read from it instead of being
+        # copied into the memory of every worker
+        maxsize = config.response_cache_size
+        if _shared_cache is not None:
+            maxsize = 0
+
+        _response_cache = ResponseCache(
+            maxsize=maxsize,
+            directory=config.response_cache_dir,
+            shared=_shared_cache)
+    return _response_cache
+
+
+def cached_page(course_arg: str):
+    """Decorator to cache the page rendered by a view for a course, until
+    the version of the course changes. `course_arg` is the name of the view
+    argument with the course key.
+
+    Cached pages are served with ETag and Last-Modified headers, and a
+    request with matching validators gets a 304. Compressed bodies are
+    cached with the page.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(**kwargs):
+            if not config.response_cache:
+                return f(**kwargs)
+
+            course_key = kwargs[course_arg]
+            version = Store.get(course_key)
+            if version is None:
+                return f(**kwargs)
+
+            cache = get_response_cache()
+            cached = cache.get(course_key, version, request.path)
+            if cached is None:
+                response = make_response(f(**kwargs))
+                if response.status_code != 200:
+                    return response
+
+                cached = CachedResponse.from_body(
+                    response.get_data(), response.mimetype)
+                cache.set(course_key, version, request.path, cached)
+
+            body, etag = cached.body, cached.etag
+            encoding = get_response_encoding(cached.mimetype, len(body))
+            if encoding:
+                if encoding not in cached.encoded:
+                    cached.encoded[encoding] = compress(
+                        cached.body, encoding, config.compression_level)
+                    # save the compressed body along with the page
+                    cache.set(course_key, version, request.path, cached)
+                body, etag = cached.encoded[encoding], f"{etag}-{encoding}"
+
+            response = app.response_class(body, mimetype=cached.mimetype)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+            response.set_etag(etag)
+            response.last_modified = cached.last_modified
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+
+        return wrapper
+    return decorator
+
+
+def get_response_encoding(mimetype: str, size: int) -> Optional[str]:
+    """Returns the encoding to compress a response to the current request
+    with, or None if it shouldn't be compressed.
+    """
+    if (not config.compression
+            or size < config.compression_min_size
+            or not is_compressible(mimetype)):
+        return None
+
+    return negotiate_encoding(request.headers.get("Accept-Encoding", ""))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Records the request in the metrics. It is registered before the
+    other after_request functions, so it runs last and times them too.
+    """
+    start = g.get("request_start")
+    if config.metrics and start is not None:
+        route = request.endpoint or "unmatched"
+        metrics.http_requests.inc(
+            route, request.method, str(response.status_code))
+        metrics.http_request_duration.observe(
+            time.perf_counter() - start, route)
+        metrics.maybe_flush()
+    return response
+
+
+@metrics.registry.add_collector
+def collect_cache_metrics():
+    caches = {
+        "render": render_cache,
+        "fragment": app.jinja_env.fragment_cache,
+    }
+    if _response_cache is not None:
+        caches["response"] = _response_cache.memory
+    if _shared_cache is not None:
+        caches["shared"] = _shared_cache
+    if config.course_graph:
+        caches["graph"] = course_graph
+
+    for name, cache in caches.items():
+        if cache.hits:
+            yield metrics.cache_hits.name, (name,), cache.hits
+        if cache.misses:
+            yield metrics.cache_misses.name, (name,), cache.misses
+
+
+@app.route("/metrics")
+def get_metrics():
+    """Metrics of all workers in the Prometheus text format, see
+    riyaz.metrics.
+    """
+    if not config.metrics:
+        abort(404)
+
+    return app.response_class(
+        metrics.render_metrics(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.after_request
+def compress_response(response):
+    """Compresses responses that are not cached pages.
+    """
+    if (response.status_code != 200
+            or response.is_streamed
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = get_response_encoding(
+        response.mimetype or "", response.calculate_content_length() or 0)
+    if encoding:
+        response.set_data(compress(
+            response.get_data(), encoding, config.compression_level))
+        response.headers["Content-Encoding"] = encoding
+
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
+
+
 @app.template_filter("markdown")
 def md_to_html(md: str):
-    return markdown.markdown(md, extensions=["fenced_code"])
+    return render_markdown_cached(md or "")
 
 
 @app.route("/")
 def index():
-    courses = Course.find_all()
+    courses = Course.find_published()
     return render_template("index.html", courses=courses)
 
 
+def find_course(key: str):
+    """Returns the published course `key`, from the course graph if it is
+    enabled, or None.
+    """
+    if config.course_graph:
+        return course_graph.get_course(key)
+    return Course.find(key=key)
+
+
 @app.route("/courses/<name>")
+@cached_page("name")
 def view_course(name: str):
-    course = Course.find(key=name)
+    course = find_course(name)
     if not course:
         abort(404)
 
@@ -40,8 +295,9 @@ def view_course(name: str):
 
 
 @app.route("/courses/<course_name>/<module_name>/<lesson_name>")
+@cached_page("course_name")
 def view_lesson(course_name: str, module_name: str, lesson_name: str):
-    course = Course.find(key=course_name)
+    course = find_course(course_name)
     lesson = course and course.get_lesson(module_name, lesson_name)
     if not lesson:
         abort(404)
@@ -51,6 +307,8 @@ def view_lesson(course_name: str, module_name: str, lesson_name: str):
 
 @app.route("/api/courses/<name>/version")
 def get_course_version(name: str):
+    if config.metrics:
+        metrics.version_polls.inc("poll")
     version = Store.get(name)
     status_code = 404 if version is None else 200
     response = {"version": version}
@@ -58,25 +316,167 @@ def get_course_version(name: str):
     return response, status_code
 
 
+# The event stream of the version of a course, which reloads open lessons
+# when the course is imported again, is only served by riyaz.asgi. Here,
+# every open stream would hold a worker thread until its tab is closed, so
+# pages poll the version instead, unless `event_stream` is set in riyaz.yml.
+
+# seconds between checks for a new version of a course in the event stream
+VERSION_CHECK_INTERVAL = 1.0
+
+
+# comment line, which keeps proxies from closing an idle stream
+KEEPALIVE_EVENT = ":\n\n"
+
+EVENT_STREAM_HEADERS = {
+    "Content-Type": "text/event-stream",
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_version_event(version: Optional[str]) -> str:
+    return f"event: version\ndata: {json.dumps({'version': version})}\n\n"
+
+
+@app.route("/api/jobs/<int:job_id>")
+def get_job_status(job_id: int):
+    job = Job.find(id=job_id)
+    if not job:
+        return {"error": "job not found"}, 404
+
+    return job.get_status()
+
+
+@app.route("/static/highlight.<fingerprint>.css")
+def serve_highlight_stylesheet(fingerprint: str):
+    if fingerprint != get_fingerprint(config.highlight_style):
+        abort(404)
+
+    response = app.response_class(
+        get_stylesheet(config.highlight_style), mimetype="text/css")
+    # the URL changes with the stylesheet
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response
+
+
+@app.context_processor
+def inject_highlight_stylesheet():
+    url = None
+    if config.highlight_code:
+        url = "/static/" + get_stylesheet_filename()
+    return dict(highlight_stylesheet_url=url)
+
+
 @app.route("/assets/<path:path>")
 def serve_assets(path):
     return send_from_directory(config.assets_path, path)
 
 
 # plugins
+#
+# A plugin is a module with an `init()` function, which registers the
+# assets of the plugin. Assets registered with include_stylesheet and
+# include_javascript are on every page. Assets registered with
+# include_lesson_stylesheet and include_lesson_javascript are only on the
+# pages of lessons with code blocks, along with the javascripts returned by
+# the functions registered with add_lesson_javascripts for the languages of
+# the lesson. Plugins are initialized once, when this module is loaded.
+
+_plugins_initialized = False
+
+# asset bundles built with `riyaz build-assets`, "plugins" for the assets on
+# every page and "lesson" for the assets of lessons with code
+asset_bundles: Dict[str, AssetBundle] = {}
+
+
+@app.context_processor
+def inject_event_stream():
+    return dict(event_stream=config.event_stream)
+
 
 @app.context_processor
 def inject_plugins():
     return dict(
-        javascript_urls=javascript_urls,
-        stylesheet_urls=stylesheet_urls,
+        javascript_urls=get_javascript_urls(),
+        stylesheet_urls=get_stylesheet_urls(),
+        get_lesson_javascript_urls=get_lesson_javascript_urls,
+        get_lesson_stylesheet_urls=get_lesson_stylesheet_urls,
     )
 
 
-@app.before_request
-def load_plugins():
+def get_javascript_urls() -> List[str]:
+    if "plugins" in asset_bundles:
+        return asset_bundles["plugins"].get_javascript_urls()
+    return javascript_urls
+
+
+def get_stylesheet_urls() -> List[str]:
+    if "plugins" in asset_bundles:
+        return asset_bundles["plugins"].get_stylesheet_urls()
+    return stylesheet_urls
+
+
+def get_lesson_javascript_urls(lesson) -> List[str]:
+    languages = lesson.get_languages()
+    if not languages:
+        return []
+
+    urls = list(lesson_javascript_urls)
+    if "lesson" in asset_bundles:
+        urls = asset_bundles["lesson"].get_javascript_urls()
+
+    for f in lesson_javascript_hooks:
+        urls.extend(url for url in f(languages) if url not in urls)
+    return urls
+
+
+def get_lesson_stylesheet_urls(lesson) -> List[str]:
+    if not lesson.get_languages():
+        return []
+
+    if "lesson" in asset_bundles:
+        return asset_bundles["lesson"].get_stylesheet_urls()
+    return lesson_stylesheet_urls
+
+
+@app.route("/static/bundles/<path:filename>")
+def serve_asset_bundle(filename: str):
+    response = send_from_directory(config.bundles_path, filename)
+    # bundles are named by the hash of their content
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response
+
+
+def init_plugins():
+    """Initializes the plugins, and picks up the asset bundles built with
+    `riyaz build-assets` if they have the assets of these plugins.
+    """
+    global _plugins_initialized
+    if _plugins_initialized:
+        return
+    _plugins_initialized = True
+
     for plugin_module in plugins:
-        importlib.import_module(plugin_module)
+        importlib.import_module(plugin_module).init()
+
+    for name, sources in get_asset_bundle_sources().items():
+        bundle = load_asset_bundle(Path(config.bundles_path), name)
+        if bundle and bundle.sources == [*sources[0], *sources[1]]:
+            asset_bundles[name] = bundle
+
+
+def get_asset_bundle_sources() -> Dict[str, Tuple[List[str], List[str]]]:
+    """Returns the stylesheets and javascripts of each asset bundle.
+    """
+    return {
+        "plugins": (stylesheet_urls, javascript_urls),
+        "lesson": (lesson_stylesheet_urls, lesson_javascript_urls),
+    }
 
 
 def include_stylesheet(url):
@@ -85,3 +485,22 @@ def include_stylesheet(url):
 
 def include_javascript(url):
     javascript_urls.append(url)
+
+
+def include_lesson_stylesheet(url):
+    lesson_stylesheet_urls.append(url)
+
+
+def include_lesson_javascript(url):
+    lesson_javascript_urls.append(url)
+
+
+def add_lesson_javascripts(f: Callable[[List[str]], List[str]]):
+    """Registers a function that returns the javascripts needed by lessons
+    with code in the given languages.
+    """
+    lesson_javascript_hooks.append(f)
+    return f
+
+
+init_plugins()
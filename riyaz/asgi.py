@@ -0,0 +1,218 @@
+"""ASGI entry point of the Riyaz app.
+
+    $ uvicorn riyaz.asgi:app
+
+It serves the same routes as the WSGI app in riyaz.app, and the event
+stream of the version of a course, which the WSGI app doesn't serve. The
+version and its event stream are served here, with the database queries on
+a bounded thread pool, so an open event stream waits without holding a
+thread. Every other request runs the Flask app on the same thread pool.
+
+Pages use the event stream instead of polling the version with
+`event_stream: true` in riyaz.yml.
+
+The size of the pool is `asgi_threads` in riyaz.yml. Requests beyond it
+wait for a free thread, while the server keeps accepting connections.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from . import config, metrics
+from .app import (
+    EVENT_STREAM_HEADERS, KEEPALIVE_EVENT, VERSION_CHECK_INTERVAL,
+    app as wsgi_app, format_version_event
+)
+from .db import Store
+
+
+VERSION_RE = re.compile(r"^/api/courses/([^/]+)/version$")
+EVENTS_RE = re.compile(r"^/api/courses/([^/]+)/events$")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=config.asgi_threads, thread_name_prefix="riyaz")
+    return _executor
+
+
+async def run_in_thread(f, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), f, *args)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await handle_lifespan(receive, send)
+    elif scope["type"] == "http":
+        await handle_http(scope, receive, send)
+
+
+async def handle_lifespan(receive, send):
+    global _executor
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            get_executor()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+                _executor = None
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def handle_http(scope, receive, send):
+    path = scope["path"]
+    if scope["method"] == "GET":
+        if match := VERSION_RE.match(path):
+            return await get_course_version(match.group(1), send)
+        if match := EVENTS_RE.match(path):
+            return await get_course_events(match.group(1), receive, send)
+
+    await call_wsgi(scope, receive, send)
+
+
+async def get_course_version(name: str, send):
+    if config.metrics:
+        metrics.version_polls.inc("poll")
+    version = await run_in_thread(Store.get, name)
+    body = json.dumps({"version": version}).encode()
+    await send_response(send, 404 if version is None else 200,
+                        [("Content-Type", "application/json")], body)
+
+
+async def get_course_events(name: str, receive, send):
+    """Server-sent events with the version of the course, sent when the
+    page connects and whenever the course is imported again.
+    """
+    if config.metrics:
+        metrics.version_polls.inc("events")
+
+    disconnected = asyncio.Event()
+
+    async def wait_for_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": encode_headers(EVENT_STREAM_HEADERS.items()),
+    })
+
+    try:
+        version = None
+        while not disconnected.is_set():
+            new_version = await run_in_thread(Store.get, name)
+            if new_version != version:
+                version = new_version
+                event = format_version_event(version)
+            else:
+                event = KEEPALIVE_EVENT
+            await send({"type": "http.response.body",
+                        "body": event.encode(), "more_body": True})
+
+            try:
+                await asyncio.wait_for(
+                    disconnected.wait(), VERSION_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        watcher.cancel()
+
+
+async def call_wsgi(scope, receive, send):
+    """Runs the Flask app for the request on the thread pool.
+    """
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+    environ = build_environ(scope, body)
+    status, headers, content = await run_in_thread(run_wsgi, environ)
+    await send_response(send, status, headers, content)
+
+
+def run_wsgi(environ: dict) -> Tuple[int, List[Tuple[str, str]], bytes]:
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+
+    result = wsgi_app(environ, start_response)
+    try:
+        content = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+    return response["status"], response["headers"], content
+
+
+def build_environ(scope, body: bytes) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    return environ
+
+
+async def send_response(send, status: int, headers, body: bytes):
+    headers = [(name, value) for name, value in headers
+               if name.lower() != "content-length"]
+    headers.append(("Content-Length", str(len(body))))
+    await send({"type": "http.response.start", "status": status,
+                "headers": encode_headers(headers)})
+    await send({"type": "http.response.body", "body": body})
+
+
+def encode_headers(headers) -> List[Tuple[bytes, bytes]]:
+    return [(name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers]
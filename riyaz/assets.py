@@ -0,0 +1,156 @@
+"""Bundling of plugin assets.
+
+Plugins register their stylesheets and javascripts as separate /static/
+URLs, for every page and for lessons with code. `riyaz build-assets`
+concatenates and minifies each group into one stylesheet and one
+javascript, named by the hash of their content, in the `bundles_path` of
+the site:
+
+    bundles/
+    |-- plugins.<fingerprint>.css
+    |-- plugins.<fingerprint>.js
+    |-- lesson.<fingerprint>.css
+    |-- lesson.<fingerprint>.js
+    |__ manifest.json
+
+When the app starts and finds a bundle built from the same assets that
+the plugins registered, pages link to the bundle at /static/bundles/
+instead of the separate files.
+
+The javascript is minified with rjsmin when it is installed, and only
+concatenated otherwise.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+MANIFEST_FILENAME = "manifest.json"
+STATIC_URL_PREFIX = "/static/"
+
+# a quoted string, which minify_css keeps as it is, or a comment
+CSS_TOKEN_RE = re.compile(
+    r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/""", re.DOTALL)
+
+
+@dataclass
+class AssetBundle:
+    stylesheet: str
+    javascript: str
+    # URLs of the bundled assets, in order
+    sources: List[str]
+    # URLs of the registered assets that don't exist in the static directory
+    missing: List[str] = field(default_factory=list)
+
+    def get_stylesheet_urls(self) -> List[str]:
+        return [f"{STATIC_URL_PREFIX}bundles/{self.stylesheet}"]
+
+    def get_javascript_urls(self) -> List[str]:
+        return [f"{STATIC_URL_PREFIX}bundles/{self.javascript}"]
+
+
+def build_asset_bundle(name: str,
+                       stylesheet_urls: List[str], javascript_urls: List[str],
+                       static_dir: Path, out_dir: Path) -> AssetBundle:
+    """Writes the bundle `name` of the assets at `stylesheet_urls` and
+    `javascript_urls` to `out_dir`, and returns the bundle.
+    """
+    missing = []
+
+    def read_sources(urls):
+        contents = []
+        for url in urls:
+            path = get_static_path(static_dir, url)
+            if path is None or not path.is_file():
+                missing.append(url)
+            else:
+                contents.append(path.read_text())
+        return contents
+
+    css = "\n".join(minify_css(c) for c in read_sources(stylesheet_urls))
+    # a script may leave out the last semicolon
+    js = "\n;".join(minify_js(c) for c in read_sources(javascript_urls))
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for path in out_dir.glob(f"{name}.*"):
+        path.unlink()
+
+    bundle = AssetBundle(
+        stylesheet=_write_fingerprinted(out_dir, name, "css", css),
+        javascript=_write_fingerprinted(out_dir, name, "js", js),
+        sources=[*stylesheet_urls, *javascript_urls],
+        missing=missing,
+    )
+
+    manifest = _read_manifest(out_dir)
+    manifest[name] = asdict(bundle)
+    (out_dir / MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=2))
+    return bundle
+
+
+def load_asset_bundle(bundles_dir: Path, name: str) -> Optional[AssetBundle]:
+    """Returns the bundle `name` built in `bundles_dir`, or None if there
+    isn't one.
+    """
+    manifest = _read_manifest(bundles_dir)
+    return AssetBundle(**manifest[name]) if name in manifest else None
+
+
+def get_static_path(static_dir: Path, url: str) -> Optional[Path]:
+    if not url.startswith(STATIC_URL_PREFIX):
+        return None
+    return static_dir / url[len(STATIC_URL_PREFIX):]
+
+
+def minify_css(css: str) -> str:
+    """Removes comments and whitespace from `css`, outside of strings, like
+    the content of a `content` property or of an attribute selector.
+    """
+    parts = []
+    code = ""
+    for i, part in enumerate(CSS_TOKEN_RE.split(css)):
+        if i % 2 == 0:
+            code += part
+        elif part is None:
+            # a comment separates tokens like whitespace
+            code += " "
+        else:
+            parts += [_minify_css_code(code), part]
+            code = ""
+    parts.append(_minify_css_code(code))
+    return "".join(parts).strip()
+
+
+def _minify_css_code(css: str) -> str:
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    return css.replace(";}", "}")
+
+
+def minify_js(js: str) -> str:
+    try:
+        import rjsmin
+    except ImportError:
+        return js
+
+    return rjsmin.jsmin(js)
+
+
+def _read_manifest(bundles_dir: Path) -> Dict[str, dict]:
+    try:
+        return json.loads((bundles_dir / MANIFEST_FILENAME).read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def _write_fingerprinted(out_dir: Path, name: str, ext: str,
+                         content: str) -> str:
+    fingerprint = hashlib.sha1(content.encode()).hexdigest()[:12]
+    filename = f"{name}.{fingerprint}.{ext}"
+    (out_dir / filename).write_text(content)
+    return filename
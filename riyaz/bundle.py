@@ -0,0 +1,179 @@
+"""Course bundles: a course directory compiled into a single file.
+
+A bundle is a sqlite database with the parsed course - titles already
+extracted from the lessons, the outline in order, author photos inlined and
+a hash of every lesson. Importing a bundle doesn't read, parse or validate
+any of the course files again.
+
+    $ riyaz build courses/how-to-python -o how-to-python.riyaz
+    $ riyaz import-course how-to-python.riyaz
+"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from . import models
+
+
+# bump this when the layout of the bundle changes
+FORMAT_VERSION = 1
+
+schema = """
+create table meta (
+    key text primary key,
+    value text
+);
+
+create table course (
+    name text,
+    title text,
+    short_description text,
+    description text
+);
+
+create table author (
+    index_ integer primary key,
+    key text,
+    name text,
+    about text,
+    photo_name text,
+    photo blob
+);
+
+create table chapter (
+    index_ integer primary key,
+    name text,
+    title text
+);
+
+create table lesson (
+    chapter_index integer references chapter,
+    index_ integer,
+    name text,
+    title text,
+    content text,
+    sha1 text,
+
+    primary key (chapter_index, index_)
+);
+"""
+
+
+def is_bundle(path: Path) -> bool:
+    if not path.is_file():
+        return False
+
+    with open(path, "rb") as f:
+        return f.read(16) == b"SQLite format 3\x00"
+
+
+def write_bundle(course: models.Course, path: Path) -> str:
+    """Writes the parsed course to a bundle at `path`, replacing any
+    existing file. Returns the hash of the bundled course.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.unlink(missing_ok=True)
+    course_hash = hashlib.sha1()
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        with conn:
+            conn.executescript(schema)
+            conn.execute(
+                "insert into course values (?, ?, ?, ?)",
+                (course.name, course.title, course.short_description,
+                 course.description))
+
+            for idx, author in enumerate(course.authors):
+                photo = author.photo and author.photo.read_bytes()
+                conn.execute(
+                    "insert into author values (?, ?, ?, ?, ?, ?)",
+                    (idx, author.key, author.name, author.about,
+                     author.photo and author.photo.name, photo))
+
+            for c_idx, chapter in enumerate(course.outline):
+                conn.execute(
+                    "insert into chapter values (?, ?, ?)",
+                    (c_idx, chapter.name, chapter.title))
+
+                rows = []
+                for l_idx, lesson in enumerate(chapter.lessons):
+                    sha1 = hashlib.sha1(lesson.content.encode()).hexdigest()
+                    course_hash.update(sha1.encode())
+                    rows.append((c_idx, l_idx, lesson.name, lesson.title,
+                                 lesson.content, sha1))
+                conn.executemany(
+                    "insert into lesson values (?, ?, ?, ?, ?, ?)", rows)
+
+            meta = {
+                "format_version": FORMAT_VERSION,
+                "name": course.name,
+                "built": datetime.now().isoformat(),
+                "hash": course_hash.hexdigest(),
+            }
+            conn.executemany(
+                "insert into meta values (?, ?)",
+                [(key, str(value)) for key, value in meta.items()])
+    finally:
+        conn.close()
+
+    tmp_path.replace(path)
+    return meta["hash"]
+
+
+def read_bundle(path: Path) -> models.Course:
+    """Reads the course from the bundle at `path`.
+
+    The course was validated when the bundle was built, so the models are
+    constructed without validating them again.
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        meta = dict(conn.execute("select key, value from meta"))
+        if int(meta.get("format_version", 0)) != FORMAT_VERSION:
+            raise ValueError(
+                f"{path} is a bundle of format version "
+                f"{meta.get('format_version')}, expected {FORMAT_VERSION}. "
+                "Build it again with `riyaz build`.")
+
+        name, title, short_description, description = conn.execute(
+            "select name, title, short_description, description from course"
+        ).fetchone()
+
+        authors = [
+            models.Author.construct(
+                key=key, name=name_, about=about,
+                photo=photo_name and Path(photo_name), photo_content=photo)
+            for key, name_, about, photo_name, photo in conn.execute(
+                "select key, name, about, photo_name, photo"
+                " from author order by index_")
+        ]
+
+        lessons = {}
+        for chapter_index, name_, title_, content in conn.execute(
+                "select chapter_index, name, title, content from lesson"
+                " order by chapter_index, index_"):
+            lessons.setdefault(chapter_index, []).append(
+                models.Lesson.construct(
+                    name=name_, title=title_, content=content))
+
+        outline = [
+            models.Chapter.construct(
+                name=name_, title=title_, lessons=lessons.get(index, []))
+            for index, name_, title_ in conn.execute(
+                "select index_, name, title from chapter order by index_")
+        ]
+    finally:
+        conn.close()
+
+    return models.Course.construct(
+        name=name,
+        title=title,
+        short_description=short_description,
+        description=description,
+        authors=authors,
+        outline=outline,
+    )
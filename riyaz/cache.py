@@ -0,0 +1,470 @@
+"""Caches used by riyaz.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+class LRUCache:
+    """A thread-safe, bounded mapping that evicts the least recently used
+    entries once it holds more than `maxsize` of them.
+
+    A maxsize of 0 disables the cache.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, f: Callable[[], Any]) -> Any:
+        """Returns the value of `key`, calling `f` to compute and cache it
+        when it isn't cached.
+        """
+        marker = _missing
+        value = self.get(key, marker)
+        if value is marker:
+            value = f()
+            self.set(key, value)
+        return value
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+_missing = object()
+
+
+class CachedResponse:
+    """Body and validators of a cached page, and the compressed bodies of
+    the page by encoding.
+    """
+    __slots__ = ("body", "mimetype", "etag", "last_modified", "encoded")
+
+    def __init__(self, body: bytes, mimetype: str, etag: str,
+                 last_modified: datetime,
+                 encoded: Optional[Dict[str, bytes]] = None):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.last_modified = last_modified
+        self.encoded = encoded or {}
+
+    @classmethod
+    def from_body(cls, body: bytes, mimetype: str) -> CachedResponse:
+        etag = hashlib.sha1(body).hexdigest()
+        last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        return cls(body, mimetype, etag, last_modified)
+
+    def to_bytes(self) -> bytes:
+        """Returns a line of JSON with the validators and the sizes of the
+        bodies, followed by the bodies, to store the page outside of the
+        memory of the process.
+        """
+        bodies = [self.body, *self.encoded.values()]
+        header = {
+            "mimetype": self.mimetype,
+            "etag": self.etag,
+            "last_modified": self.last_modified.isoformat(),
+            "encodings": list(self.encoded),
+            "sizes": [len(body) for body in bodies],
+        }
+        return json.dumps(header).encode() + b"\n" + b"".join(bodies)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> CachedResponse:
+        """Reads a page written by `to_bytes`. Raises ValueError, KeyError or
+        TypeError when `data` is not one.
+        """
+        header_line, _, data = data.partition(b"\n")
+        header = json.loads(header_line)
+        if sum(header["sizes"]) != len(data):
+            raise ValueError("truncated page")
+
+        bodies, offset = [], 0
+        for size in header["sizes"]:
+            bodies.append(data[offset:offset + size])
+            offset += size
+        return cls(
+            bodies[0], header["mimetype"], header["etag"],
+            datetime.fromisoformat(header["last_modified"]),
+            dict(zip(header["encodings"], bodies[1:])))
+
+
+class ResponseCache:
+    """Cache of rendered pages, keyed by course, course version and path.
+
+    Pages are kept in memory, up to `maxsize` of them, in the `shared`
+    cache of all workers, and in `directory` when one is given, so that
+    they survive restarts. When a course is found to have a new version,
+    all its pages of older versions are dropped.
+    """
+
+    def __init__(self, maxsize: int = 1000, directory: Optional[str] = None,
+                 shared: Optional[SharedCache] = None):
+        self.memory = LRUCache(maxsize=maxsize)
+        self.directory = directory and Path(directory)
+        self.shared = shared
+
+        # course key -> version of the course the cached pages belong to
+        self._versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, course_key: str, version: str,
+            path: str) -> Optional[CachedResponse]:
+        self._check_version(course_key, version)
+
+        key = (course_key, version, path)
+        if (response := self.memory.get(key)) is not None:
+            return response
+
+        if self.shared is not None:
+            response = self.shared.get("page", _get_shared_key(*key))
+            if response is not None:
+                self.memory.set(key, response)
+                return response
+
+        if response := self._read_file(course_key, version, path):
+            self.memory.set(key, response)
+            if self.shared is not None:
+                self.shared.set("page", _get_shared_key(*key), response,
+                                course_key=course_key, version=version)
+        return response
+
+    def set(self, course_key: str, version: str, path: str,
+            response: CachedResponse):
+        self._check_version(course_key, version)
+
+        self.memory.set((course_key, version, path), response)
+        if self.shared is not None:
+            self.shared.set(
+                "page", _get_shared_key(course_key, version, path), response,
+                course_key=course_key, version=version)
+        self._write_file(course_key, version, path, response)
+
+    def _check_version(self, course_key: str, version: str):
+        if self._versions.get(course_key) == version:
+            return
+
+        with self._lock:
+            old_version = self._versions.get(course_key)
+            self._versions[course_key] = version
+
+        if old_version != version:
+            self.evict(course_key, keep_version=version)
+
+    def evict(self, course_key: str, keep_version: Optional[str] = None):
+        """Drops all cached pages of a course, except those of
+        `keep_version`.
+        """
+        for key in self.memory.keys():
+            if key[0] == course_key and key[1] != keep_version:
+                self.memory.delete(key)
+
+        if self.shared is not None:
+            self.shared.evict(course_key, keep_version=keep_version)
+
+        if self.directory:
+            course_dir = self.directory / _safe_name(course_key)
+            if course_dir.is_dir():
+                for version_dir in course_dir.iterdir():
+                    if version_dir.name != _safe_name(keep_version or ""):
+                        shutil.rmtree(version_dir, ignore_errors=True)
+
+    def _get_file_path(self, course_key: str, version: str, path: str) -> Path:
+        filename = hashlib.sha1(path.encode()).hexdigest()
+        return (self.directory / _safe_name(course_key) / _safe_name(version)
+                / filename)
+
+    def _read_file(self, course_key: str, version: str,
+                   path: str) -> Optional[CachedResponse]:
+        if not self.directory:
+            return None
+
+        try:
+            with open(self._get_file_path(course_key, version, path), "rb") as f:
+                return CachedResponse.from_bytes(f.read())
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_file(self, course_key: str, version: str, path: str,
+                    response: CachedResponse):
+        if not self.directory:
+            return
+
+        file_path = self._get_file_path(course_key, version, path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = file_path.with_name(f"{file_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(response.to_bytes())
+        os.replace(tmp_path, file_path)
+
+
+def _get_shared_key(course_key: str, version: str, path: str) -> str:
+    return f"{course_key}\n{version}\n{path}"
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+class SharedCache:
+    """Cache in an SQLite file, shared by all the processes that open it,
+    like the gunicorn workers of a site.
+
+    Values are bytes, strings, like template fragments, or cached pages,
+    and are stored by namespace and key. Values of a course
+    also have the course key and version, to drop them when the course has
+    a new version, see `evict`. The file is read through a memory map, so
+    reads come from the OS page cache, which all processes share, and the
+    oldest values are dropped once they take more than `maxsize` bytes.
+
+    The cache never fails a request: errors of SQLite, like a write that
+    waits too long for another process, and values that can't be read,
+    like those written by another version of riyaz, count as misses or
+    skip the write.
+    """
+
+    # writes between checks of the size of the cache
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path: str, maxsize: int = 512 * 1024 * 1024,
+                 mmap_size: Optional[int] = None):
+        self.path = path
+        self.maxsize = maxsize
+        self.mmap_size = maxsize if mmap_size is None else mmap_size
+        self.hits = 0
+        self.misses = 0
+
+        # a connection per thread, opened again after a fork
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # autocommit, every statement is a transaction
+        conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+        conn.execute("pragma journal_mode = wal")
+        # losing the last writes on a power failure is fine for a cache
+        conn.execute("pragma synchronous = off")
+        conn.execute(f"pragma mmap_size = {int(self.mmap_size)}")
+        conn.execute(
+            "create table if not exists cache ("
+            " namespace text not null, key text not null,"
+            " course_key text, version text,"
+            " value blob not null, size integer not null, created real not null,"
+            " primary key (namespace, key))")
+        conn.execute(
+            "create index if not exists cache_course"
+            " on cache (course_key, version)")
+
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        try:
+            row = self._connect().execute(
+                "select value from cache where namespace = ? and key = ?",
+                (namespace, key)).fetchone()
+            if row is not None:
+                value = _decode(row[0])
+                self.hits += 1
+                return value
+        except Exception:
+            pass
+
+        self.misses += 1
+        return default
+
+    def set(self, namespace: str, key: str, value: Any,
+            course_key: Optional[str] = None, version: Optional[str] = None):
+        data = _encode(value)
+        try:
+            self._connect().execute(
+                "insert or replace into cache"
+                " (namespace, key, course_key, version, value, size, created)"
+                " values (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, course_key, version, data, len(data),
+                 time.time()))
+        except sqlite3.Error:
+            return
+
+        self._writes += 1
+        if self._writes % self.PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def evict(self, course_key: str, keep_version: Optional[str] = None):
+        """Drops all values of a course, except those of `keep_version`.
+        """
+        try:
+            self._connect().execute(
+                "delete from cache where course_key = ? and version is not ?",
+                (course_key, keep_version))
+        except sqlite3.Error:
+            pass
+
+    def prune(self):
+        """Drops the oldest values until the values take less than 90% of
+        maxsize, if they take more than maxsize.
+        """
+        try:
+            conn = self._connect()
+            total = conn.execute(
+                "select coalesce(sum(size), 0) from cache").fetchone()[0]
+            if total <= self.maxsize:
+                return
+
+            excess = total - int(self.maxsize * 0.9)
+            rowids = []
+            for rowid, size in conn.execute(
+                    "select rowid, size from cache order by created"):
+                rowids.append((rowid,))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany("delete from cache where rowid = ?", rowids)
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        try:
+            self._connect().execute("delete from cache")
+        except sqlite3.Error:
+            pass
+
+    def __len__(self):
+        try:
+            return self._connect().execute(
+                "select count(*) from cache").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+
+def _encode(value: Any) -> bytes:
+    """Returns `value` as bytes, prefixed with a byte that tells its type.
+    """
+    if isinstance(value, bytes):
+        return b"b" + value
+    if isinstance(value, str):
+        return b"s" + value.encode()
+    if isinstance(value, CachedResponse):
+        return b"r" + value.to_bytes()
+    raise TypeError(f"can't cache a {type(value).__name__}")
+
+
+def _decode(data: bytes) -> Any:
+    kind, value = data[:1], data[1:]
+    if kind == b"b":
+        return value
+    if kind == b"s":
+        return value.decode()
+    if kind == b"r":
+        return CachedResponse.from_bytes(value)
+    raise ValueError(f"unknown value type {kind!r}")
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja extension that adds a `{% cache %}` tag to cache a fragment of
+    a template.
+
+        {% cache "outline", course.key, course.get_version() %}
+            ... expensive to render ...
+        {% endcache %}
+
+    The rendered fragment is shared by all templates and requests that use
+    the same key, so the key must have everything the fragment depends on.
+    Fragments are kept in `environment.fragment_cache`, a bounded LRU cache,
+    and in `environment.shared_cache`, a SharedCache, when it is set.
+    """
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=LRUCache(maxsize=500),
+                           shared_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key.append(parser.parse_expression())
+
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        call = self.call_method("_render", [nodes.List(key)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        shared_cache = self.environment.shared_cache
+        if shared_cache is None:
+            return self.environment.fragment_cache.get_or_set(tuple(key), caller)
+
+        return self.environment.fragment_cache.get_or_set(
+            tuple(key), lambda: self._render_shared(shared_cache, key, caller))
+
+    def _render_shared(self, shared_cache: SharedCache, key, caller):
+        shared_key = repr(tuple(key))
+        value = shared_cache.get("fragment", shared_key)
+        if value is None:
+            value = caller()
+            shared_cache.set("fragment", shared_key, value)
+        return value
@@ -9,20 +9,21 @@ The CLI can run these commands:
                     server
     - `riyaz pull`: Pull a Riyaz course from a remote server
 """
+import glob
+import json
 import os
+import shutil
 import sys
 import tempfile
 from pathlib import Path
 
 import click
 import yaml
-from cookiecutter.main import cookiecutter
 
 from riyaz import config
-from riyaz.app import app
-from riyaz.disk import CourseLoader
-from riyaz.migrate import migrate
-from .livereload import live_reload
+
+# Flask, pydantic, cookiecutter and watchdog take most of the startup time
+# of the CLI, so commands import the modules that need them when they run.
 
 
 class fmt:
@@ -30,14 +31,14 @@ class fmt:
     success_style = {"fg": "green", "bold": True}
 
     @classmethod
-    def error(cls, message, exit=False, exit_code=1):
-        click.echo(click.style(message, **cls.error_style))
+    def error(cls, message, exit=False, exit_code=1, err=False):
+        click.echo(click.style(message, **cls.error_style), err=err)
         if exit:
             sys.exit(exit_code)
 
     @classmethod
-    def success(cls, message):
-        click.echo(click.style(message, **cls.success_style))
+    def success(cls, message, err=False):
+        click.echo(click.style(message, **cls.success_style), err=err)
 
 
 @click.group()
@@ -49,21 +50,56 @@ def main():
 
 
 @main.command(short_help="start serving course from local directory")
-def serve():
+@click.option("--profile", is_flag=True,
+              help="profile every request")
+@click.option("--profile-dir", default=Path("riyaz-profiles"), show_default=True,
+              type=click.Path(path_type=Path, file_okay=False),
+              help="directory to write the profiles to")
+@click.option("--profiler", default="cprofile", show_default=True,
+              type=click.Choice(["cprofile", "sample"]),
+              help="cProfile stats, or sampled stacks for flame graphs")
+@click.option("--local-execution", is_flag=True,
+              help="run the code of feather editors on this machine")
+def serve(profile, profile_dir, profiler, local_execution):
     """Start serving course from local directory
 
     Starts a live server that loads course from current directory,
     and watches for file changes to reload.
+
+    With --local-execution, code in feather editors runs on this machine,
+    with limits on its CPU time and memory but with the access to files
+    and the network of the user running riyaz, see riyaz.sandbox.
+
+    With --profile, a profile of every request is written to
+    PROFILE_DIR/<endpoint>/, see riyaz.profiling.
     """
+    from riyaz.app import app
+    from riyaz.disk import CourseLoader
+    from riyaz.plugins import feather
+    from .livereload import DEFAULT_IGNORE_PATTERNS, live_reload
+
     course_dir = Path.cwd()
     loader = CourseLoader(course_dir)
 
+    if local_execution:
+        config.feather = {**config.feather, "local_execution": True}
+    if feather.is_local_execution_enabled():
+        feather.get_pool()
+
+    ignore_patterns = DEFAULT_IGNORE_PATTERNS
+    if profile:
+        config.profile = True
+        config.profiler = profiler
+        config.profile_dir = str(profile_dir.resolve())
+        ignore_patterns = [*ignore_patterns, profile_dir.name]
+        fmt.success(f"Writing request profiles to {config.profile_dir}")
+
     with tempfile.TemporaryDirectory(prefix="riyaz_") as tempdir:
         setup_db(tempdir)
         setup_assets(tempdir)
 
         loader.load()
-        with live_reload(loader, course_dir):
+        with live_reload(loader, course_dir, ignore_patterns=ignore_patterns):
             app.run()
 
 
@@ -71,6 +107,8 @@ def serve():
 def new():
     """Setup a new Riyaz course from default template.
     """
+    from cookiecutter.main import cookiecutter
+
     template_path = Path(__file__).parent.parent / "cookiecutter-course/"
     cookiecutter(str(template_path))
 
@@ -117,16 +155,43 @@ def new_site(path):
     fmt.success(f"New Riyaz site created at {path}")
 
 
-@main.command("import-course", short_help="load course into a riyaz site")
+@main.command("import-course", short_help="load courses into a riyaz site")
 @click.option("-d", "--root-directory", default=Path("."), show_default=True,
               type=click.Path(path_type=Path),
               help="path to riyaz root directory (created with `riyaz new-site`)")
-@click.argument("course_dir", type=click.Path(path_type=Path))
-def import_course(root_directory, course_dir):
-    """Import a course into a Riyaz site.
-
-    COURSE_DIR should be path to a course directory (containing course.yml,
-    modules, authors, etc.)
+@click.option("-j", "--jobs", default=None, type=click.IntRange(min=1),
+              help="number of processes to parse courses with  [default: number of CPUs]")
+@click.option("--batch-size", default=10, show_default=True,
+              type=click.IntRange(min=1),
+              help="number of courses to write in a single transaction")
+@click.option("--background", is_flag=True,
+              help="queue the imports for `riyaz worker` instead of importing")
+@click.option("--timings", is_flag=True,
+              help="print the time, rows and bytes of every stage of the imports")
+@click.option("--json", "json_file", default=None, type=click.File("w"),
+              help="write the results and timings of the imports as JSON to "
+                   "this file, or - for stdout and the rest of the output to "
+                   "stderr")
+@click.argument("course_dirs", nargs=-1, required=True)
+def import_course(root_directory, jobs, batch_size, background, timings,
+                  json_file, course_dirs):
+    """Import one or more courses into a Riyaz site.
+
+    COURSE_DIRS should be paths to course directories (containing course.yml,
+    modules, authors, etc.), course bundles (built with `riyaz build`), or
+    glob patterns matching them.
+
+    Courses are parsed in parallel and written to the database in batches.
+    A summary of time taken and rows written is printed for every course.
+
+    With --background, the imports are added to the job queue of the site
+    and run by `riyaz worker`. Their status is available at
+    /api/jobs/<id>.
+
+    With --timings, the import of every course is broken down into stages,
+    like reading lesson files, rendering markdown and inserting lessons,
+    with the time, rows and bytes of each. --json writes the same numbers
+    for scripts.
 
     \b
     Example usage with `riyaz new-site`:
@@ -135,6 +200,7 @@ def import_course(root_directory, course_dir):
     $ ls
     assets riyaz.db riyaz.yml
     $ riyaz import-course ../courses/how-to-python
+    $ riyaz import-course '../courses/*'
     ```
 
     \b
@@ -147,17 +213,423 @@ def import_course(root_directory, course_dir):
     if not root_directory.is_dir():
         fmt.error(f"'{root_directory}' is not a directory", exit=True)
 
-    if not course_dir.is_dir():
-        fmt.error(f"'{course_dir}' is not a directory", exit=True)
+    from riyaz.bundle import is_bundle
+    from riyaz.disk import load_courses
+
+    paths = expand_course_dirs(course_dirs)
+    for path in paths:
+        if not path.is_dir() and not is_bundle(path):
+            fmt.error(f"'{path}' is not a directory or a course bundle",
+                      exit=True)
 
     # set configuration - database_path, assets_path
     config.load_config(root_directory / "riyaz.yml")
-    course = CourseLoader(course_dir).load()
 
-    fmt.success(f"Successfully loaded course '{course.title}'")
+    if background:
+        from riyaz.jobs import enqueue_import_course
+
+        for path in paths:
+            job = enqueue_import_course(path)
+            fmt.success(f"Queued import of '{path}' as job {job.id}")
+        return
+
+    # keep stdout for the JSON with --json -
+    err = json_file is not None and json_file.name == "<stdout>"
+
+    def on_loaded(result):
+        if result.error:
+            fmt.error(f"Failed to load course at '{result.path}': {result.error}",
+                      err=err)
+        else:
+            fmt.success(f"Successfully loaded course '{result.title}'", err=err)
+
+    results = load_courses(
+        paths, workers=jobs, batch_size=batch_size, on_loaded=on_loaded)
+    print_import_summary(results, err=err)
+    if timings:
+        for result in results:
+            print_import_timings(result, err=err)
+    if json_file:
+        json.dump([get_import_result_dict(result) for result in results],
+                  json_file, indent=2)
+        json_file.write("\n")
+
+    if any(result.error for result in results):
+        sys.exit(1)
+
+
+@main.command("rollback-course", short_help="publish previous version of a course")
+@click.option("-d", "--root-directory", default=Path("."), show_default=True,
+              type=click.Path(path_type=Path),
+              help="path to riyaz root directory (created with `riyaz new-site`)")
+@click.argument("course_key")
+def rollback_course(root_directory, course_key):
+    """Publish the previous version of the course COURSE_KEY.
+
+    Every import keeps the previously published version of the course
+    around (see `keep_releases` in riyaz.yml). Rolling back publishes it
+    again, and rolling back twice undoes the rollback.
+    """
+    config.load_config(root_directory / "riyaz.yml")
+
+    from riyaz.db import Course
+
+    course = Course.find(key=course_key)
+    if course is None:
+        fmt.error(f"Course '{course_key}' not found", exit=True)
+
+    release = course.get_release()
+    previous = release and release.rollback()
+    if previous is None:
+        fmt.error(f"No previous version of course '{course_key}'", exit=True)
+
+    fmt.success(f"Rolled back course '{course_key}' to version "
+                f"{previous.version} (imported {previous.created:%Y-%m-%d %H:%M})")
+
+
+@main.command(short_help="compile a course into a bundle")
+@click.option("-o", "--output", default=None, type=click.Path(path_type=Path),
+              help="path of the bundle  [default: <course name>.riyaz]")
+@click.argument("course_dir", default=Path("."),
+                type=click.Path(path_type=Path, file_okay=False, exists=True))
+def build(output, course_dir):
+    """Compile the course at COURSE_DIR into a single bundle file.
+
+    The bundle has the parsed and validated course, and it can be imported
+    with `riyaz import-course` without reading the course files again.
+
+    \b
+    Example usage:
+    ```
+    $ riyaz build courses/how-to-python
+    Built bundle how-to-python.riyaz
+    $ riyaz import-course -d riyaz-school how-to-python.riyaz
+    ```
+    """
+    from riyaz.bundle import write_bundle
+    from riyaz.disk import get_course_from_directory
+
+    course = get_course_from_directory(course_dir)
+    output = output or Path(f"{course.name}.riyaz")
+    course_hash = write_bundle(course, output)
+
+    fmt.success(f"Built bundle {output} ({course_hash[:12]})")
+
+
+@main.command("build-assets", short_help="bundle the assets of the plugins")
+@click.option("-d", "--root-directory", default=Path("."), show_default=True,
+              type=click.Path(path_type=Path),
+              help="path to riyaz root directory (created with `riyaz new-site`)")
+def build_assets(root_directory):
+    """Bundle the stylesheets and javascripts of the plugins.
+
+    The assets on every page, and the assets of lessons with code, are
+    concatenated and minified into one stylesheet and one javascript each
+    in the `bundles_path` of the site, and the pages link to them instead
+    of the separate files once the server is restarted. Run it again after
+    upgrading riyaz or changing the plugins; until then, pages keep using
+    the separate files.
+
+    \b
+    Example usage:
+    ```
+    $ riyaz build-assets -d riyaz-school
+    ```
+    """
+    config.load_config(root_directory / "riyaz.yml")
+
+    from riyaz import app as app_module
+    from riyaz.assets import build_asset_bundle
+
+    sources = app_module.get_asset_bundle_sources()
+    for name, (stylesheet_urls, javascript_urls) in sources.items():
+        if not stylesheet_urls and not javascript_urls:
+            continue
+
+        bundle = build_asset_bundle(
+            name, stylesheet_urls, javascript_urls,
+            static_dir=Path(app_module.app.static_folder),
+            out_dir=Path(config.bundles_path))
+
+        for url in bundle.missing:
+            fmt.error(f"Skipped missing asset {url}")
+        fmt.success(f"Built {bundle.stylesheet} and {bundle.javascript} "
+                    f"in {config.bundles_path}")
+
+
+@main.command(short_help="export the site as static files")
+@click.option("-d", "--root-directory", default=Path("."), show_default=True,
+              type=click.Path(path_type=Path),
+              help="path to riyaz root directory (created with `riyaz new-site`)")
+@click.option("-j", "--jobs", default=None, type=click.IntRange(min=1),
+              help="number of processes to render pages with  [default: number of CPUs]")
+@click.option("--force", is_flag=True,
+              help="export all courses, even those that haven't changed")
+@click.argument("out_dir", type=click.Path(path_type=Path, file_okay=False))
+def export(root_directory, jobs, force, out_dir):
+    """Export all pages and assets of a Riyaz site to OUT_DIR.
+
+    The exported site can be served by any static file server. Courses
+    whose version hasn't changed since the last export to OUT_DIR are
+    skipped.
+
+    \b
+    Example usage:
+    ```
+    $ riyaz export -d riyaz-school /var/www/riyaz-school
+    ```
+
+    \b
+    To serve version polling from nginx, serve `/api/` as JSON:
+    ```
+    location /api/ { default_type application/json; }
+    ```
+    """
+    config.load_config(root_directory / "riyaz.yml")
+
+    from riyaz.export import export_site
+
+    summary = export_site(out_dir, workers=jobs, force=force)
+
+    for key in summary.removed:
+        click.echo(f"removed course '{key}'")
+    fmt.success(
+        f"Exported {summary.pages} pages of {len(summary.exported)} courses "
+        f"to {out_dir} ({len(summary.skipped)} unchanged courses skipped)")
+
+
+@main.command(short_help="compile templates and warm up caches")
+@click.option("-d", "--root-directory", default=Path("."), show_default=True,
+              type=click.Path(path_type=Path),
+              help="path to riyaz root directory (created with `riyaz new-site`)")
+@click.option("--pages/--no-pages", default=True, show_default=True,
+              help="also render the index and the page of every course")
+def warmup(root_directory, pages):
+    """Compile all templates and render the main pages of a Riyaz site.
+
+    With `template_cache_dir` in riyaz.yml, the compiled templates are kept
+    in that directory for the workers of the site to load, and with
+    `response_cache_dir`, the rendered pages are kept for them too. Run it
+    after upgrading riyaz and before starting the workers.
+
+    \b
+    To warm up every gunicorn worker when it starts:
+    ```
+    $ gunicorn -c python:riyaz.warmup riyaz.app:app
+    ```
+    """
+    config.load_config(root_directory / "riyaz.yml")
+
+    from riyaz.warmup import warmup as warmup_site
+
+    summary = warmup_site(pages=pages)
+    fmt.success(
+        f"Compiled {summary.templates} templates in "
+        f"{summary.template_time:.3f}s and rendered {summary.pages} pages "
+        f"in {summary.page_time:.3f}s")
+
+
+@main.command(short_help="measure latency and throughput under load")
+@click.option("-d", "--root-directory", default=None,
+              type=click.Path(path_type=Path, file_okay=False, exists=True),
+              help="riyaz site to test  [default: a site with synthetic courses]")
+@click.option("-w", "--workers", multiple=True, type=click.IntRange(min=1),
+              default=[2], show_default=True,
+              help="number of server workers, can be given more than once")
+@click.option("-t", "--threads", multiple=True, type=click.IntRange(min=1),
+              default=[8], show_default=True,
+              help="number of threads per worker, can be given more than once")
+@click.option("--readers", default=8, show_default=True,
+              help="number of readers browsing courses without pause")
+@click.option("--tabs", default=50, show_default=True,
+              help="number of open lessons polling the course version every second")
+@click.option("--duration", default=10.0, show_default=True,
+              help="seconds to run each test for")
+@click.option("--courses", default=3, show_default=True,
+              help="number of synthetic courses")
+@click.option("--modules", default=10, show_default=True,
+              help="number of modules in each synthetic course")
+@click.option("--lessons", default=10, show_default=True,
+              help="number of lessons in each synthetic module")
+@click.option("--lesson-size", default=4.0, show_default=True,
+              help="size of each synthetic lesson in KB")
+@click.option("--server-command", default=None,
+              help="command to start the server, with {workers}, {threads} "
+                   "and {port} placeholders  [default: gunicorn with gthread workers]")
+@click.option("--json", "json_path", default=None, type=click.Path(path_type=Path),
+              help="also write the results to this JSON file")
+def loadtest(root_directory, workers, threads, readers, tabs, duration,
+             courses, modules, lessons, lesson_size, server_command, json_path):
+    """Measure the throughput and latency of a Riyaz site under load.
+
+    Starts the server for every combination of --workers and --threads and
+    runs a mix of readers, who go from the catalog to a course page and
+    through a few lessons, and of open lessons polling the version of
+    their course. Prints requests per second and p50/p95/p99 latency for
+    each route.
+
+    \b
+    Example usage:
+    ```
+    $ pip install gunicorn
+    $ riyaz loadtest -w 1 -w 2 -w 4 -t 8 --tabs 200
+    ```
+    """
+    from riyaz import loadtest as lt
+
+    if server_command is None:
+        server_command = lt.SERVER_COMMAND
+        if shutil.which("gunicorn") is None:
+            fmt.error("gunicorn is not installed, install it with "
+                      "`pip install gunicorn` or pass --server-command", exit=True)
+
+    with tempfile.TemporaryDirectory(prefix="riyaz_loadtest_") as tempdir:
+        if root_directory is None:
+            click.echo(f"Generating {courses} courses of {modules}x{lessons} "
+                       f"lessons ...")
+            root_directory = lt.create_site(
+                Path(tempdir), courses=courses, modules=modules,
+                lessons=lessons, lesson_size_kb=lesson_size)
+
+        results = []
+        for n_workers in workers:
+            for n_threads in threads:
+                port = lt.get_free_port()
+                command = server_command.format(
+                    workers=n_workers, threads=n_threads, port=port)
+                try:
+                    with lt.run_server(command, root_directory, port):
+                        site = lt.crawl_site(port)
+                        result = lt.run_load(
+                            port, site, readers=readers, tabs=tabs,
+                            duration=duration)
+                except RuntimeError as e:
+                    fmt.error(f"Load test failed: {e}", exit=True)
+
+                result.workers, result.threads = n_workers, n_threads
+                print_loadtest_result(result)
+                results.append(result)
+
+    if json_path:
+        json_path.write_text(json.dumps(
+            [result.to_dict() for result in results], indent=2) + "\n")
+
+
+@main.command(short_help="run queued background jobs")
+@click.option("-d", "--root-directory", default=Path("."), show_default=True,
+              type=click.Path(path_type=Path),
+              help="path to riyaz root directory (created with `riyaz new-site`)")
+@click.option("--poll-interval", default=1.0, show_default=True,
+              help="seconds to wait between checks of an empty queue")
+@click.option("--once", is_flag=True,
+              help="exit when the queue is empty")
+def worker(root_directory, poll_interval, once):
+    """Run the background jobs of a Riyaz site, one at a time.
+
+    Jobs are queued with `riyaz import-course --background`. Run a single
+    worker per site, next to the web server.
+    """
+    config.load_config(root_directory / "riyaz.yml")
+
+    from riyaz.jobs import DONE, run_worker
+
+    def on_finished(job):
+        if job.status == DONE:
+            fmt.success(f"Job {job.id} ({job.kind}) finished in "
+                        f"{job.get_duration():.2f}s: {job.message}")
+        else:
+            fmt.error(f"Job {job.id} ({job.kind}) failed:\n{job.message}")
+
+    run_worker(poll_interval=poll_interval, once=once, on_finished=on_finished)
+
+
+def expand_course_dirs(patterns):
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths.extend(Path(p) for p in sorted(glob.glob(pattern)))
+        else:
+            paths.append(Path(pattern))
+
+    if not paths:
+        fmt.error("No course directories matched", exit=True)
+
+    return paths
+
+
+def print_import_summary(results, err=False):
+    click.echo(err=err)
+    click.echo(f"{'course':30} {'parse':>8} {'load':>8} {'rows':>8}", err=err)
+    for result in results:
+        name = result.key or str(result.path)
+        status = "  FAILED" if result.error else f"{result.rows:8d}"
+        click.echo(
+            f"{name:30} {result.parse_time:7.2f}s {result.load_time:7.2f}s"
+            f" {status}", err=err)
+
+    total_parse = sum(result.parse_time for result in results)
+    total_load = sum(result.load_time for result in results)
+    total_rows = sum(result.rows for result in results)
+    click.echo(
+        f"{'total':30} {total_parse:7.2f}s {total_load:7.2f}s"
+        f" {total_rows:8d}", err=err)
+
+
+def print_loadtest_result(result):
+    click.echo()
+    fmt.success(
+        f"{result.workers} workers, {result.threads} threads: "
+        f"{result.get_rps():.1f} req/s, {result.get_errors()} errors")
+    click.echo(f"{'route':10} {'requests':>9} {'req/s':>8} {'p50 ms':>8} "
+               f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, stats in result.routes.items():
+        d = stats.to_dict(result.duration)
+        percentiles = "".join(
+            f" {d[p] * 1000:8.1f}" if d[p] is not None else f" {'-':>8}"
+            for p in ("p50", "p95", "p99"))
+        click.echo(f"{name:10} {d['requests']:9d} {d['rps']:8.1f}"
+                   f"{percentiles} {d['errors']:7d}")
+
+
+def print_import_timings(result, err=False):
+    if result.error:
+        return
+
+    total = result.parse_time + result.load_time
+    click.echo(err=err)
+    click.echo(f"{result.key or result.path}: {total:.3f}s", err=err)
+    click.echo(f"  {'stage':16} {'seconds':>9} {'%':>6} {'count':>7} "
+               f"{'rows':>7} {'bytes':>11}", err=err)
+
+    stages = dict(result.timings.stages)
+    # parse and load time that isn't in a stage, like pydantic's argument
+    # checks, or time spent waiting for a parse worker
+    other = total - result.timings.get_total()
+    for name, stage in stages.items():
+        click.echo(
+            f"  {name:16} {stage.seconds:9.4f} "
+            f"{stage.seconds / total if total else 0:6.1%} {stage.count:7d} "
+            f"{stage.rows:7d} {stage.bytes:11d}", err=err)
+    click.echo(f"  {'other':16} {max(other, 0):9.4f} "
+               f"{max(other, 0) / total if total else 0:6.1%}", err=err)
+
+
+def get_import_result_dict(result):
+    return {
+        "path": str(result.path),
+        "key": result.key,
+        "title": result.title,
+        "error": result.error and str(result.error),
+        "parse_time": result.parse_time,
+        "load_time": result.load_time,
+        "row_counts": result.row_counts,
+        "stages": result.timings.to_dict(),
+    }
 
 
 def setup_db(base_dir):
+    from riyaz.migrate import migrate
+
     config.database_path = os.path.join(base_dir, "riyaz.db")
     migrate()
 
@@ -1,25 +1,130 @@
 import contextlib
+import fnmatch
+import threading
+import traceback
+from pathlib import Path
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
 
+# editor swap/backup files, vcs churn and caches never need a reload.
+# patterns are matched against every component of the path relative to the
+# course directory, and against the relative path itself.
+DEFAULT_IGNORE_PATTERNS = [
+    ".git",
+    ".hg",
+    "__pycache__",
+    "*.pyc",
+    "*.swp",
+    "*.swx",
+    "*~",
+    ".#*",
+    "#*#",
+    "4913",  # vim checks if a directory is writable by creating this
+    ".DS_Store",
+]
+
+# seconds to wait for the file system to go quiet before reloading
+DEFAULT_DEBOUNCE = 0.3
+
+
 @contextlib.contextmanager
-def live_reload(loader, path):
+def live_reload(loader, path, debounce=DEFAULT_DEBOUNCE,
+                ignore_patterns=DEFAULT_IGNORE_PATTERNS):
+    reloader = Reloader(loader, path, debounce=debounce,
+                        ignore_patterns=ignore_patterns)
 
     def callback(event):
         if event.is_directory:
             return
 
-        loader.load()
+        reloader.notify(event.src_path)
+        if dest_path := getattr(event, "dest_path", None):
+            reloader.notify(dest_path)
 
     observer = get_observer(callback, path)
 
+    reloader.start()
     observer.start()
     try:
         yield observer
     finally:
         observer.stop()
         observer.join()
+        reloader.stop()
+
+
+class Reloader:
+    """Coalesces file change notifications and reloads the course.
+
+    Changes are collected until no new change has arrived for `debounce`
+    seconds, and then `loader.reload` is called with all the changed paths.
+    Reloads happen one at a time in a single worker thread, so a reload never
+    overlaps with another one.
+    """
+
+    def __init__(self, loader, path, debounce=DEFAULT_DEBOUNCE,
+                 ignore_patterns=DEFAULT_IGNORE_PATTERNS):
+        self.loader = loader
+        self.path = Path(path).resolve()
+        self.debounce = debounce
+        self.ignore_patterns = list(ignore_patterns)
+
+        self._changed_paths = set()
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="riyaz-reloader", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._changed.set()
+        self._thread.join()
+
+    def is_ignored(self, path):
+        try:
+            relpath = Path(path).resolve().relative_to(self.path)
+        except ValueError:
+            return True
+
+        return any(
+            fnmatch.fnmatch(name, pattern)
+            for pattern in self.ignore_patterns
+            for name in [str(relpath), *relpath.parts]
+        )
+
+    def notify(self, path):
+        if self.is_ignored(path):
+            return
+
+        with self._lock:
+            self._changed_paths.add(Path(path).resolve())
+        self._changed.set()
+
+    def _run(self):
+        while True:
+            self._changed.wait()
+            if self._stopped.is_set():
+                return
+
+            # wait for the changes to settle down
+            self._changed.clear()
+            while self._changed.wait(self.debounce):
+                if self._stopped.is_set():
+                    return
+                self._changed.clear()
+
+            with self._lock:
+                changed_paths, self._changed_paths = self._changed_paths, set()
+
+            try:
+                self.loader.reload(changed_paths)
+            except Exception:
+                traceback.print_exc()
 
 
 def get_observer(callback, path):
@@ -0,0 +1,77 @@
+"""Compression of responses, with `compression: true` in riyaz.yml.
+
+The encoding of a response is negotiated from the Accept-Encoding header of
+the request. Brotli is preferred when the brotli package is installed,
+and gzip otherwise. Responses smaller than `compression_min_size` bytes
+aren't worth compressing and are sent as they are.
+
+Cached pages keep their compressed bodies along with the page, see
+riyaz.app.cached_page, so that a page is compressed once per encoding and
+course version. Other responses are compressed when they are sent.
+"""
+from __future__ import annotations
+
+import gzip
+from typing import List, Optional
+
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+
+
+def get_encodings() -> List[str]:
+    """Returns the supported encodings, the preferred one first.
+    """
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return ["gzip"]
+
+    return ["br", "gzip"]
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Returns the preferred of the supported encodings accepted by the
+    client, or None if it accepts none of them.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name.strip().lower()] = quality
+
+    encodings = get_encodings()
+    candidates = [
+        (qualities.get(encoding, qualities.get("*", 0.0)), -i, encoding)
+        for i, encoding in enumerate(encodings)
+    ]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+
+def is_compressible(mimetype: str) -> bool:
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    """Compresses body with `encoding` at `level`, which is a brotli quality
+    between 0 and 11, and is capped at 9 for gzip.
+    """
+    if encoding == "br":
+        import brotli
+        return brotli.compress(body, quality=max(0, min(level, 11)))
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=max(1, min(level, 9)), mtime=0)
+
+    raise ValueError(f"unsupported encoding {encoding}")
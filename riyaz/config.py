@@ -2,15 +2,117 @@ import yaml
 from pathlib import Path
 
 
+# path of the riyaz.yml that was loaded, if any
+config_path = None
+
 # path to sqlite database
 database_path = "riyaz.db"
 assets_path = "assets"
 
+# directory of the plugin asset bundles built with `riyaz build-assets`. By
+# default, it is bundles/ next to riyaz.yml.
+bundles_path = "bundles"
+
+# path to sqlite database of the background job queue. By default, it is
+# jobs.db next to the main database.
+jobs_database_path = "jobs.db"
+
+# number of previous versions of each course to keep for rollback
+keep_releases = 1
+
+# print every SQL query to stderr
+debug_sql = False
+
+# cache rendered course and lesson pages until the course is imported again.
+# pages are kept in memory, and also in response_cache_dir if it is set.
+response_cache = False
+response_cache_size = 1000
+response_cache_dir = None
+
+# compress responses with brotli or gzip, as accepted by the client, see
+# riyaz.compression. Off by default, turn it on with `compression: true` in
+# riyaz.yml. compression_level is between 0 and 11 for brotli, and is
+# capped at 9 for gzip.
+compression = False
+compression_min_size = 1024
+compression_level = 6
+
+# directory to keep compiled templates in, so that new workers load them
+# instead of compiling them again. Templates are only compiled in memory
+# when it's not set.
+template_cache_dir = None
+
+# keep the outline, navigation and URLs of published courses in memory in
+# every worker, and read only the lesson content from the database, see
+# riyaz.graph
+course_graph = False
+
+# cache pages and template fragments in an SQLite file shared by all the
+# workers of the node, see riyaz.cache.SharedCache. The file is read through
+# a memory map, so the workers share its pages in the OS page cache instead
+# of keeping a copy each. shared_cache_size is the size of the cache in MB.
+# Pages are then not kept in the memory of each worker.
+shared_cache_path = None
+shared_cache_size = 512
+
+# number of template fragments in the {% cache %} fragment cache
+fragment_cache_size = 500
+
+# markdown engine, see riyaz.render for the available engines
+markdown_renderer = "python-markdown"
+
+# highlight code blocks with Pygments when courses are imported, see
+# riyaz.highlight. highlight_style is the name of a Pygments style.
+highlight_code = False
+highlight_style = "default"
+
+# reload open lessons from an event stream of the version of their course,
+# instead of polling the version every second. The stream is only served by
+# riyaz.asgi, so only set it when the site is served with it.
+event_stream = False
+
+# size of the thread pool that runs requests and database queries in the
+# ASGI app, see riyaz.asgi
+asgi_threads = 16
+
+# config of the feather plugin, see riyaz.plugins.feather
+feather = {}
+
+# collect metrics of requests, SQL statements, rendering, caches and
+# imports, served at /metrics, see riyaz.metrics. Off by default, turn it
+# on with `metrics: true` in riyaz.yml. With metrics_dir, the metrics of
+# all workers and of riyaz commands are written there and added up.
+metrics = False
+metrics_dir = None
+
+# profile requests and write a profile per request to profile_dir, see
+# riyaz.profiling. `profile` profiles every request, profile_sample_rate a
+# random fraction of them, and with profile_token, requests with the header
+# X-Riyaz-Profile: <profile_token> are profiled. profiler is "cprofile" or
+# "sample". profile_dir is profiles/ next to riyaz.yml by default.
+profile = False
+profile_sample_rate = 0.0
+profile_token = None
+profiler = "cprofile"
+profile_dir = "profiles"
+
 
 def load_config(path):
-    global database_path, assets_path
+    global config_path
+    global database_path, assets_path, bundles_path, jobs_database_path
+    global keep_releases
+    global debug_sql, response_cache, response_cache_size, response_cache_dir
+    global compression, compression_min_size, compression_level
+    global template_cache_dir, course_graph, fragment_cache_size
+    global shared_cache_path, shared_cache_size
+    global markdown_renderer
+    global highlight_code, highlight_style, event_stream, asgi_threads
+    global feather
+    global metrics, metrics_dir
+    global profile, profile_sample_rate, profile_token, profiler, profile_dir
 
     if path.exists():
+        config_path = str(path.resolve())
         with open(path, "r") as f:
             yml_config = yaml.safe_load(f)
 
@@ -19,11 +121,109 @@ def load_config(path):
             full_path = path.parent / Path(yml_config["database_path"])
             database_path = str(full_path.resolve())
 
+        jobs_database_path = str(Path(database_path).with_name("jobs.db"))
+
         if "assets_path" in yml_config:
             # resolve relative path
             full_path = path.parent / Path(yml_config["assets_path"])
             assets_path = str(full_path.resolve())
 
+        # resolve relative path, bundles are next to riyaz.yml by default
+        full_path = path.parent / Path(yml_config.get("bundles_path", "bundles"))
+        bundles_path = str(full_path.resolve())
+
+        if "jobs_database_path" in yml_config:
+            # resolve relative path
+            full_path = path.parent / Path(yml_config["jobs_database_path"])
+            jobs_database_path = str(full_path.resolve())
+
+        if "keep_releases" in yml_config:
+            keep_releases = int(yml_config["keep_releases"])
+
+        if "debug_sql" in yml_config:
+            debug_sql = bool(yml_config["debug_sql"])
+
+        if "response_cache" in yml_config:
+            response_cache = bool(yml_config["response_cache"])
+
+        if "response_cache_size" in yml_config:
+            response_cache_size = int(yml_config["response_cache_size"])
+
+        if "response_cache_dir" in yml_config:
+            # resolve relative path
+            full_path = path.parent / Path(yml_config["response_cache_dir"])
+            response_cache_dir = str(full_path.resolve())
+
+        if "template_cache_dir" in yml_config:
+            # resolve relative path
+            full_path = path.parent / Path(yml_config["template_cache_dir"])
+            template_cache_dir = str(full_path.resolve())
+
+        if "compression" in yml_config:
+            compression = bool(yml_config["compression"])
+
+        if "compression_min_size" in yml_config:
+            compression_min_size = int(yml_config["compression_min_size"])
+
+        if "compression_level" in yml_config:
+            compression_level = int(yml_config["compression_level"])
+
+        if "course_graph" in yml_config:
+            course_graph = bool(yml_config["course_graph"])
+
+        if "shared_cache_path" in yml_config:
+            # resolve relative path
+            full_path = path.parent / Path(yml_config["shared_cache_path"])
+            shared_cache_path = str(full_path.resolve())
+
+        if "shared_cache_size" in yml_config:
+            shared_cache_size = int(yml_config["shared_cache_size"])
+
+        if "fragment_cache_size" in yml_config:
+            fragment_cache_size = int(yml_config["fragment_cache_size"])
+
+        if "markdown_renderer" in yml_config:
+            markdown_renderer = yml_config["markdown_renderer"]
+
+        if "highlight_code" in yml_config:
+            highlight_code = bool(yml_config["highlight_code"])
+
+        if "highlight_style" in yml_config:
+            highlight_style = yml_config["highlight_style"]
+
+        if "event_stream" in yml_config:
+            event_stream = bool(yml_config["event_stream"])
+
+        if "asgi_threads" in yml_config:
+            asgi_threads = int(yml_config["asgi_threads"])
+
+        if "feather" in yml_config:
+            feather = dict(yml_config["feather"] or {})
+
+        if "metrics" in yml_config:
+            metrics = bool(yml_config["metrics"])
+
+        if "metrics_dir" in yml_config:
+            # resolve relative path
+            full_path = path.parent / Path(yml_config["metrics_dir"])
+            metrics_dir = str(full_path.resolve())
+
+        if "profile" in yml_config:
+            profile = bool(yml_config["profile"])
+
+        if "profile_sample_rate" in yml_config:
+            profile_sample_rate = float(yml_config["profile_sample_rate"])
+
+        if "profile_token" in yml_config:
+            profile_token = yml_config["profile_token"]
+
+        if "profiler" in yml_config:
+            profiler = yml_config["profiler"]
+
+        # resolve relative path, profiles are next to riyaz.yml by default
+        full_path = path.parent / Path(yml_config.get("profile_dir", "profiles"))
+        profile_dir = str(full_path.resolve())
+
     # TODO: implement config for extensions
 
 
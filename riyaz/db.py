@@ -6,29 +6,68 @@ import functools
 import random
 import shutil
 import string
+import time
 from datetime import datetime
 from itertools import groupby
 from pathlib import Path
 from pydantic import BaseModel
 from typing import List, Optional, Union
-from . import config
+from . import config, metrics, timings
+
+# statements counted by name in the SQL metrics, the rest count as "other"
+SQL_STATEMENTS = {"select", "insert", "update", "delete", "pragma"}
+
+# variables a statement can bind, SQLITE_MAX_VARIABLE_NUMBER of SQLite
+# before 3.32
+MAX_VARIABLES = 999
 
 class SqliteDB(web.db.SqliteDB):
+    def __init__(self, **keywords):
+        super().__init__(**keywords)
+        self.supports_multiple_insert = True
+
     def _connect(self, keywords):
         conn = super()._connect(keywords)
         conn.execute("PRAGMA foreign_keys = 1")
+        conn.execute("PRAGMA busy_timeout = 5000")
         return conn
 
     def _connect_with_pooling(self, keywords):
         conn = super()._connect_with_pooling(keywords)
         conn.execute("PRAGMA foreign_keys = 1")
+        conn.execute("PRAGMA busy_timeout = 5000")
         return conn
 
+    def _db_execute(self, cur, sql_query):
+        if not config.metrics:
+            return super()._db_execute(cur, sql_query)
+
+        start = time.perf_counter()
+        try:
+            return super()._db_execute(cur, sql_query)
+        finally:
+            metrics.sql_statement_duration.observe(
+                time.perf_counter() - start, get_statement(sql_query))
+
 web.db.register_database("sqlite", SqliteDB)
 
-@web.memoize
+def get_statement(sql_query) -> str:
+    """Returns the name of the SQL statement, like select, or "other".
+    """
+    # only the first part, formatting the whole query can be expensive
+    if isinstance(sql_query, web.db.SQLQuery) and sql_query.items:
+        sql_query = sql_query.items[0]
+    statement = str(sql_query).lstrip()[:6].lower()
+    return statement if statement in SQL_STATEMENTS else "other"
+
 def get_db():
-    return web.database("sqlite:///" + config.database_path)
+    return _get_db(config.database_path)
+
+@web.memoize
+def _get_db(database_path):
+    db = web.database("sqlite:///" + database_path)
+    db.printing = config.debug_sql
+    return db
 
 cache = {}
 
@@ -44,6 +83,10 @@ def query_memoize(f):
 class Document(BaseModel):
     id: Optional[int] = None
 
+    @classmethod
+    def _get_db(cls):
+        return get_db()
+
     @classmethod
     def find(cls, **kwargs):
         docs = cls.find_all(**kwargs, limit=1)
@@ -51,12 +94,12 @@ class Document(BaseModel):
 
     @classmethod
     def find_all(cls, **kwargs):
-        rows = get_db().where(cls._TABLE, **kwargs)
+        rows = cls._get_db().where(cls._TABLE, **kwargs)
         return [cls(**row) for row in rows]
 
     @classmethod
     def select(cls, *, what='*', where, vars, order=None, limit=None, offset=None):
-        rows = get_db().select(
+        rows = cls._get_db().select(
             cls._TABLE,
             what=what,
             where=where,
@@ -69,6 +112,27 @@ class Document(BaseModel):
         else:
             return rows
 
+    @classmethod
+    def insert_all(cls, docs, chunk_size=None):
+        """Inserts unsaved docs with multi-row inserts, and sets their ids.
+
+        An insert binds a variable per column of every row, so by default
+        the rows are inserted in chunks of at most MAX_VARIABLES variables.
+        """
+        if not docs:
+            return docs
+
+        values = [doc.dict(exclude={"id"}) for doc in docs]
+        chunk_size = chunk_size or max(1, MAX_VARIABLES // len(values[0]))
+        for i in range(0, len(docs), chunk_size):
+            chunk = docs[i:i+chunk_size]
+            ids = cls._get_db().multiple_insert(
+                cls._TABLE, values[i:i+chunk_size])
+            for doc, id in zip(chunk, ids):
+                doc.id = id
+
+        return docs
+
     def __repr__(self):
         return f"<{self.__class__.__name__} {dict(self)}>"
 
@@ -82,19 +146,32 @@ class Document(BaseModel):
         if self.id is None:
             d = self.dict()
             d.pop("id", None)
-            self.id = get_db().insert(self._TABLE, **d)
+            self.id = self._get_db().insert(self._TABLE, **d)
         else:
-            get_db().update(self._TABLE, where="id=$id", vars={"id": self.id}, **self.dict())
+            self._get_db().update(self._TABLE, where="id=$id", vars={"id": self.id}, **self.dict())
 
         return self
 
 class Course(Document):
     _TABLE = "course"
 
-    key: str
+    # key is set only on the published version of a course. Versions that
+    # are being built, or are kept around for rollback, have no key.
+    key: Optional[str]
     title: str
     short_description: Optional[str]
     description: Optional[str]
+    description_html: Optional[str]
+
+    def get_version(self) -> Optional[str]:
+        return self.key and Store.get(self.key)
+
+    def get_description_html(self) -> str:
+        return _get_html(self.description, self.description_html)
+
+    @classmethod
+    def find_published(cls):
+        return cls.select(where="key is not null", vars={}, order="key")
 
     def get_modules(self):
         return Module.find_all(course_id=self.id)
@@ -104,7 +181,7 @@ class Course(Document):
 
     def get_lesson(self, module_name, lesson_name):
         module = self.get_module(module_name)
-        return Lesson.find(
+        return module and Lesson.find(
             course_id=self.id, module_id=module.id, name=lesson_name)
 
     def get_outline(self):
@@ -159,15 +236,63 @@ class Course(Document):
 
         for lesson_outline in outline:
             assert lesson_outline.course_id == self.id
-            lesson_outline.save()
 
-        return outline
+        return CourseOutline.insert_all(outline)
 
     def update_version(self):
-        hash_value = get_random_string(16)
-        Store.set(self.key, hash_value)
+        with timings.stage("version"):
+            hash_value = get_random_string(16)
+            Store.set(self.key, hash_value)
         return hash_value
 
+    def publish(self, key: str, version: Optional[str] = None) -> CourseRelease:
+        """Makes this the published version of the course `key`.
+
+        The previously published version is unpublished in the same
+        transaction, so readers see either the old or the new version of the
+        course, never a mix. Older versions are kept around for rollback,
+        up to `config.keep_releases` of them.
+        """
+        assert self.id is not None  # should not be unsaved
+
+        with get_db().transaction():
+            get_db().update(
+                "course", where="key = $key and id != $id",
+                vars={"key": key, "id": self.id}, key=None)
+
+            self.key = key
+            self.save()
+
+            if version is None:
+                version = self.update_version()
+            else:
+                Store.set(key, version)
+
+            release = CourseRelease.find(course_id=self.id) or CourseRelease(
+                course_key=key, course_id=self.id, created=datetime.now())
+            release.update(version=version, published=datetime.now())
+            release.save()
+
+            CourseRelease.prune(key, keep=config.keep_releases)
+
+        return release
+
+    def get_release(self) -> Optional[CourseRelease]:
+        return CourseRelease.find(course_id=self.id)
+
+    def delete(self):
+        """Deletes this version of the course along with its modules, lessons
+        and outline.
+        """
+        assert self.key is None, "a published course can't be deleted"
+
+        with get_db().transaction():
+            for table in ["course_release", "course_outline", "lesson",
+                          "module", "course_instructor"]:
+                get_db().delete(
+                    table, where="course_id = $id", vars={"id": self.id})
+            get_db().delete("course", where="id = $id", vars={"id": self.id})
+
     def new_asset(self, filename: str) -> Asset:
         assert self.id is not None
 
@@ -182,6 +307,10 @@ class Instructor(Document):
     name: str
     about: str
     photo_id: Optional[int]
+    about_html: Optional[str]
+
+    def get_about_html(self) -> str:
+        return _get_html(self.about, self.about_html)
 
     def get_preview(self):
         return {"id": self.id, "key": self.key, "name": self.name}
@@ -189,11 +318,7 @@ class Instructor(Document):
     def get_courses(self):
         rows = get_db().where("course_instructor", instructor_id=self.id)
         course_ids = [row.course_id for row in rows]
-        # return Course.select(where="id in $ids", vars={"ids": course_ids})
-
-        return Course.select(
-            join={"course_instructor": "course_instructor.course_id=course.id"},
-            where="course_instructor.instructor_id=$id", vars={"id": self.id})
+        return Course.select(where="id in $ids", vars={"ids": course_ids})
 
     def new_asset(self, filename: str) -> Asset:
         assert self.id is not None
@@ -247,6 +372,21 @@ class Lesson(Document):
     name: str
     title: str
     content: Optional[str]
+    content_html: Optional[str]
+    languages: Optional[str]
+
+    def get_content_html(self) -> str:
+        return _get_html(self.content, self.content_html)
+
+    def get_languages(self) -> List[str]:
+        """Returns the languages of the code blocks in the lesson.
+        """
+        if self.languages is None:
+            # imported before the languages were stored
+            from .render import get_code_languages
+            return get_code_languages(self.content or "")
+
+        return self.languages.split(",") if self.languages else []
 
     def get_course(self):
         return Course.find(id=self.course_id)
@@ -297,6 +437,61 @@ class CourseOutline(Document):
     orphan: Optional[bool]
 
 
+class CourseRelease(Document):
+    """A version of a course, built by an import.
+
+    The published release is the one whose course has the key, see
+    `Course.publish`.
+    """
+    _TABLE = "course_release"
+
+    course_key: str
+    course_id: int
+    version: Optional[str]
+    created: Optional[datetime]
+    published: Optional[datetime]
+
+    @classmethod
+    def find_all_for(cls, course_key: str) -> List[CourseRelease]:
+        """Returns all releases of a course, most recently published first.
+        """
+        return cls.select(
+            where="course_key = $key", vars={"key": course_key},
+            order="published desc, id desc")
+
+    @classmethod
+    def prune(cls, course_key: str, keep: int):
+        """Deletes all but `keep` releases of a course, apart from the
+        published one.
+        """
+        releases = [release for release in cls.find_all_for(course_key)
+                    if not release.is_published()]
+
+        for release in releases[keep:]:
+            release.get_course().delete()
+
+    def get_course(self) -> Course:
+        return Course.find(id=self.course_id)
+
+    def is_published(self) -> bool:
+        course = self.get_course()
+        return course is not None and course.key == self.course_key
+
+    def rollback(self) -> Optional[CourseRelease]:
+        """Publishes the release of this course that was published before
+        this one. Returns None if there is no such release.
+        """
+        previous = next(
+            (release for release in CourseRelease.find_all_for(self.course_key)
+             if release.id != self.id),
+            None)
+        if previous is None:
+            return None
+
+        return previous.get_course().publish(
+            self.course_key, version=previous.version)
+
+
 class Store(Document):
     _TABLE = "store"
 
@@ -362,6 +557,18 @@ class Asset(Document):
 
         return asset_path
 
+    def save_content(self, content: bytes):
+        asset_path = self._construct_asset_path()
+        self.filesize = len(content)
+
+        asset_path.parent.mkdir(parents=True, exist_ok=True)
+        asset_path.write_bytes(content)
+
+        self.update_timestamps()
+        self.save()
+
+        return asset_path
+
     def update_timestamps(self):
         now = datetime.now()
 
@@ -371,6 +578,17 @@ class Asset(Document):
         self.last_modified = now
 
 
+def _get_html(md: Optional[str], html: Optional[str]) -> str:
+    """Returns the HTML rendered at import, or renders the markdown for rows
+    imported before the HTML was stored.
+    """
+    if html is not None:
+        return html
+
+    from .render import render_markdown_cached
+    return render_markdown_cached(md or "")
+
+
 def get_random_string(length):
     return "".join([ch for _ in range(length)
                     for ch in random.choice(string.ascii_letters)])
@@ -4,17 +4,26 @@ pydantic models and utility functions for parsing the on-disk courses go here.
 from __future__ import annotations
 
 import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from itertools import tee
 from pathlib import Path
-from typing import Any, Iterator, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import frontmatter
 import yaml
-from pydantic import BaseModel, validate_arguments, validator
+from pydantic import BaseModel, ValidationError, validate_arguments, validator
 from pydantic.types import DirectoryPath, FilePath
 
+from . import bundle
+from . import config
+from . import metrics
 from . import models
 from . import db
+from . import render
+from . import timings
 
 
 class DiskChapter(BaseModel):
@@ -63,26 +72,31 @@ class DiskCourse(BaseModel):
 
     def get_author_from_key(self, key):
         path = get_author_file_path(self.base_dir, key)
-        fm = frontmatter.load(path)
-
-        return models.Author(
-            key=key,
-            name=fm.get("name"),
-            photo=fm.get("photo"),
-            about=fm.content,
-        )
+        with timings.stage("authors", rows=1) as stage:
+            text = path.read_text()
+            stage.bytes += len(text)
+            fm = frontmatter.loads(text)
+
+        with timings.stage("validate"):
+            return models.Author(
+                key=key,
+                name=fm.get("name"),
+                photo=fm.get("photo"),
+                about=fm.content,
+            )
 
     def parse(self) -> models.Course:
         authors = [self.get_author_from_key(key) for key in self.authors]
         outline = [disk_chapter.parse() for disk_chapter in self.outline]
-        return models.Course(
-            name=self.name,
-            title=self.title,
-            short_description=self.short_description,
-            description=self.description,
-            authors=authors,
-            outline=outline,
-        )
+        with timings.stage("validate"):
+            return models.Course(
+                name=self.name,
+                title=self.title,
+                short_description=self.short_description,
+                description=self.description,
+                authors=authors,
+                outline=outline,
+            )
 
 
 @validate_arguments
@@ -91,13 +105,27 @@ def get_course_from_directory(directory: DirectoryPath) -> models.Course:
     return disk_course.parse()
 
 
+def parse_course(path: Path) -> models.Course:
+    """Parses the course from a course directory or a course bundle.
+    """
+    if bundle.is_bundle(path):
+        with timings.stage("bundle_read", rows=1, bytes=path.stat().st_size):
+            return bundle.read_bundle(path)
+
+    return get_course_from_directory(path)
+
+
 @validate_arguments
 def read_config(path: FilePath) -> DiskCourse:
-    with open(path) as f:
-        config_dict = yaml.safe_load(f)
+    with timings.stage("yaml", rows=1) as stage:
+        with open(path) as f:
+            text = f.read()
+        stage.bytes += len(text)
+        config_dict = yaml.safe_load(text)
 
     config_dict["base_dir"] = config_dict.get("base_dir", path.parent)
-    course = DiskCourse.parse_obj(config_dict)
+    with timings.stage("validate"):
+        course = DiskCourse.parse_obj(config_dict)
 
     return course
 
@@ -105,11 +133,16 @@ def read_config(path: FilePath) -> DiskCourse:
 @validate_arguments
 def get_lesson_from_path(path: FilePath) -> models.Lesson:
     name = path.name.split(".", 1)[0]
-    with open(path) as f:
-        content = f.read()
+    with timings.stage("lesson_read", rows=1) as stage:
+        with open(path) as f:
+            content = f.read()
+        stage.bytes += len(content)
+
+    with timings.stage("headings"):
         title = get_first_heading(content) or titlify(name)
 
-    return models.Lesson(name=name, title=title, content=content)
+    with timings.stage("validate"):
+        return models.Lesson(name=name, title=title, content=content)
 
 
 def get_author_file_path(base_dir: DirectoryPath, key: str):
@@ -133,130 +166,282 @@ def titlify(s: str) -> str:
 
 
 class CourseLoader:
-    def __init__(self, path: DirectoryPath):
+    def __init__(
+        self,
+        path: DirectoryPath,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ):
         self.path = path
+        self.row_counts: Counter = Counter()
+
+        # called with (lessons loaded, total lessons) as the course loads
+        self.on_progress = on_progress
+
+    def parse(self) -> models.Course:
+        return parse_course(self.path)
 
-    def load(self):
-        parsed_course = get_course_from_directory(self.path)
-        course = self._load_course(parsed_course)
-        course.save()
+    def load(self, parsed_course: Optional[models.Course] = None):
+        """Loads the course into the database in a single transaction.
+
+        Every load builds a new version of the course alongside the published
+        one and then publishes it, see `db.Course.publish`.
+
+        `parsed_course` can be passed when the course directory has already
+        been parsed (for example, in a worker process by `load_courses`).
+        """
+        start = time.perf_counter()
+        if parsed_course is None:
+            parsed_course = self.parse()
+
+        with db.get_db().transaction() as transaction:
+            course = self._load(parsed_course)
+            with timings.stage("db_commit"):
+                transaction.commit()
+
+        self._record_metrics("full", time.perf_counter() - start)
+        return course
+
+    def reload(self, changed_paths: Iterable[Path]):
+        """Reloads the course after the files at `changed_paths` changed.
+
+        When all the changed files are lessons of the course, only those
+        lessons are refreshed. Any other change (course.yml, authors, or a
+        lesson that was added or removed) loads the whole course again.
+        """
+        changed_paths = {Path(path).resolve() for path in changed_paths}
+        if not changed_paths:
+            return None
+
+        try:
+            disk_course = read_config(self.path / "course.yml")
+        except ValidationError:
+            return self.load()
+
+        lesson_paths = {
+            path.resolve(): (chapter.name, path.name.split(".", 1)[0])
+            for chapter in disk_course.outline
+            for path in chapter.lessons
+        }
+        if not changed_paths <= lesson_paths.keys():
+            return self.load()
+
+        return self.load_lessons(
+            disk_course.name,
+            {path: lesson_paths[path] for path in changed_paths})
+
+    def load_lessons(
+        self, course_key: str, lesson_paths: Dict[Path, Tuple[str, str]]
+    ):
+        """Refreshes title and content of some lessons of a loaded course.
+
+        `lesson_paths` maps a lesson file to its `(module_name, lesson_name)`.
+        """
+        start = time.perf_counter()
+        with db.get_db().transaction():
+            course, kind = self._load_lessons(course_key, lesson_paths)
+
+        self._record_metrics(kind, time.perf_counter() - start)
+        return course
+
+    def _load_lessons(
+        self, course_key: str, lesson_paths: Dict[Path, Tuple[str, str]]
+    ) -> Tuple[db.Course, str]:
+        """Returns the course, and whether only the lessons were refreshed
+        ("lessons") or the whole course was loaded again ("full").
+        """
+        course = db.Course.find(key=course_key)
+        if course is None:
+            return self._load(self.parse()), "full"
+
+        self.row_counts.clear()
+        for path, (module_name, lesson_name) in lesson_paths.items():
+            lesson = course.get_lesson(module_name, lesson_name)
+            if lesson is None:
+                return self._load(self.parse()), "full"
+
+            parsed_lesson = get_lesson_from_path(path)
+            lesson.update(
+                title=parsed_lesson.title,
+                content=parsed_lesson.content,
+                content_html=render.render_markdown(parsed_lesson.content),
+                languages=",".join(
+                    render.get_code_languages(parsed_lesson.content)),
+            )
+            lesson.save()
+            self.row_counts["lesson"] += 1
 
-        instructors = [
-            self._load_author(author)
-            for idx, author in enumerate(parsed_course.authors)
-        ]
-        course.set_instructors(*instructors)
+        course.update_version()
+        return course, "lessons"
+
+    def _record_metrics(self, kind: str, duration: float):
+        if not config.metrics:
+            return
+
+        metrics.course_import_duration.observe(duration, kind)
+        for table, rows in self.row_counts.items():
+            metrics.course_import_rows.inc(table, amount=rows)
+        metrics.maybe_flush()
+
+    def _load(self, parsed_course: models.Course) -> db.Course:
+        """Builds a new, unpublished version of the course and publishes it.
+        """
+        self.row_counts.clear()
+
+        with timings.stage("db_course", rows=1):
+            course = self._load_course(parsed_course)
+            course.save()
+        self.row_counts["course"] += 1
+
+        with timings.stage("db_instructors",
+                           rows=len(parsed_course.authors)):
+            changed_instructors = []
+            instructors = []
+            for author in parsed_course.authors:
+                instructor, changed = self._load_author(author)
+                instructors.append(instructor)
+                if changed:
+                    changed_instructors.append(instructor)
+            course.set_instructors(*instructors)
+        self.row_counts["instructor"] += len(instructors)
+
+        total_lessons = sum(
+            len(chapter.lessons) for chapter in parsed_course.outline)
 
         course_outline = []
         for m_idx, chapter in enumerate(parsed_course.outline, start=1):
-            module = self._load_chapter(
-                course_id=course.id, index=m_idx, chapter=chapter
-            )
-            module.save()
-
-            for l_idx, parsed_lesson in enumerate(chapter.lessons, start=1):
-                lesson = self._load_lesson(
-                    course_id=course.id,
-                    module_id=module.id,
-                    index=l_idx,
-                    lesson=parsed_lesson,
+            with timings.stage("db_modules", rows=1):
+                module = self._load_chapter(
+                    course_id=course.id, index=m_idx, chapter=chapter
                 )
-                lesson.save()
-
-                lesson_outline = self._load_lesson_outline(
+                module.save()
+            self.row_counts["module"] += 1
+
+            with timings.stage("db_lessons", rows=len(chapter.lessons)):
+                lessons = db.Lesson.insert_all([
+                    self._load_lesson(
+                        course_id=course.id,
+                        module_id=module.id,
+                        index=l_idx,
+                        lesson=parsed_lesson,
+                    )
+                    for l_idx, parsed_lesson in enumerate(
+                        chapter.lessons, start=1)
+                ])
+            self.row_counts["lesson"] += len(lessons)
+            if self.on_progress:
+                self.on_progress(self.row_counts["lesson"], total_lessons)
+
+            course_outline.extend(
+                self._load_lesson_outline(
                     course.id,
                     module.id,
                     lesson.id,
                     module_index=m_idx,
-                    lesson_index=l_idx,
+                    lesson_index=lesson.index_,
                 )
-                course_outline.append(lesson_outline)
+                for lesson in lessons
+            )
 
-        course_outline = self._load_outline(course_outline)
-        course.set_outline(course_outline)
-        course.update_version()
+        with timings.stage("db_outline", rows=len(course_outline)):
+            course_outline = self._load_outline(course_outline)
+            course.set_outline(course_outline)
+        self.row_counts["course_outline"] += len(course_outline)
+
+        with timings.stage("publish"):
+            course.publish(parsed_course.name)
+            self._update_shared_courses(course, changed_instructors)
 
         return course
 
+    def _update_shared_courses(
+        self, course: db.Course, instructors: List[db.Instructor]
+    ):
+        """Gives a new version to the other published courses of
+        `instructors`, whose pages show the instructors as they were.
+        """
+        courses = {
+            other.key: other
+            for instructor in instructors
+            for other in instructor.get_courses()
+            if other.key is not None and other.key != course.key
+        }
+        for other in courses.values():
+            other.update_version()
+
     def _load_course(self, course: models.Course) -> db.Course:
-        fields = dict(
-            key=course.name,
+        # the course gets its key when it is published
+        return db.Course(
+            key=None,
             title=course.title,
             short_description=course.short_description,
-            description=course.description
+            description=course.description,
+            description_html=render.render_markdown(course.description),
         )
 
-        if db_course := db.Course.find(key=course.name):
-            db_course.update(**fields)
-        else:
-            db_course = db.Course(**fields)
-
-        return db_course
-
     def _load_chapter(
         self, course_id: int, index: int, chapter: models.Chapter
     ) -> db.Module:
-        course = db.Course.find(id=course_id)
-        assert course is not None
-
-        fields = dict(
+        return db.Module(
             course_id=course_id,
             name=chapter.name,
             title=chapter.title,
             index_=index,
         )
 
-        if db_module := course.get_module(chapter.name):
-            db_module.update(**fields)
-        else:
-            db_module = db.Module(**fields)
-
-        return db_module
-
     def _load_lesson(
         self, course_id: int, module_id: int, index: int, lesson: models.Lesson
     ) -> db.Lesson:
-        fields = dict(
+        content_html = lesson.content_html
+        if content_html is None:
+            content_html = render.render_markdown(lesson.content)
+
+        return db.Lesson(
             course_id=course_id,
             module_id=module_id,
             name=lesson.name,
             title=lesson.title,
             content=lesson.content,
+            content_html=content_html,
+            languages=",".join(render.get_code_languages(lesson.content)),
             index_=index)
 
-        module = db.Module.find(id=module_id)
-        assert module is not None
-
-        if db_lesson := module.get_lesson(lesson.name):
-            db_lesson.update(**fields)
-        else:
-            db_lesson = db.Lesson(**fields)
-
-        return db_lesson
-
     def _load_author(
         self, author: models.Author
-    ) -> db.Instructor:
+    ) -> Tuple[db.Instructor, bool]:
+        """Returns the instructor, and whether what the pages show of an
+        existing instructor changed.
+        """
         fields = dict(
             key=author.key,
             name=author.name,
             about=author.about,
+            about_html=render.render_markdown(author.about or ""),
         )
 
         if db_instructor := db.Instructor.find(key=author.key):
+            before = self._get_instructor_state(db_instructor)
             db_instructor.update(**fields)
         else:
+            before = None
             db_instructor = db.Instructor(**fields)
 
         db_instructor.save()
-        self._set_instructor_photo(db_instructor, author.photo)
+        self._set_instructor_photo(
+            db_instructor, author.photo, author.photo_content)
 
-        return db_instructor
+        changed = before is not None and \
+            before != self._get_instructor_state(db_instructor)
+        return db_instructor, changed
+
+    def _get_instructor_state(self, instructor: db.Instructor) -> Tuple:
+        return (instructor.name, instructor.get_about_html(),
+                instructor.photo_id)
 
     def _set_instructor_photo(
         self,
         instructor: db.Instructor,
         on_disk_photo: Optional[FilePath],
+        photo_content: Optional[bytes] = None,
     ) -> Optional[db.Asset]:
         if on_disk_photo is None:
             instructor.set_photo(None)
@@ -266,7 +451,12 @@ class CourseLoader:
         filename = on_disk_photo.name
 
         asset = instructor.get_asset(filename) or instructor.new_asset(filename)
-        asset.save_file(on_disk_photo)
+        with timings.stage("assets", rows=1) as stage:
+            if photo_content is not None:
+                asset.save_content(photo_content)
+            else:
+                asset.save_file(on_disk_photo)
+            stage.bytes += asset.filesize or 0
 
         instructor.set_photo(asset)
         instructor.save()
@@ -302,6 +492,124 @@ class CourseLoader:
         return lesson_outlines
 
 
+@dataclass
+class ImportResult:
+    path: Path
+    key: Optional[str] = None
+    title: Optional[str] = None
+    parse_time: float = 0.0
+    load_time: float = 0.0
+    row_counts: Dict[str, int] = field(default_factory=dict)
+    error: Optional[Exception] = None
+    # time, rows and bytes of every stage of parsing and loading
+    timings: timings.Timings = field(default_factory=timings.Timings)
+
+    @property
+    def rows(self) -> int:
+        return sum(self.row_counts.values())
+
+
+def _parse_course(
+    path: Path
+) -> Tuple[models.Course, float, timings.Timings]:
+    start = time.perf_counter()
+    with timings.record() as parse_timings:
+        try:
+            parsed_course = parse_course(path)
+        except Exception as e:
+            # pydantic's validation errors can't be pickled back from a worker
+            raise ValueError(str(e)) from None
+
+        # render lessons in the worker too, rendering is as slow as parsing
+        render.render_course(parsed_course)
+
+    return parsed_course, time.perf_counter() - start, parse_timings
+
+
+def load_courses(
+    paths: Iterable[Path],
+    workers: Optional[int] = None,
+    batch_size: int = 10,
+    on_loaded: Optional[Callable[[ImportResult], None]] = None,
+) -> List[ImportResult]:
+    """Loads many course directories (or bundles) into the database.
+
+    Courses are parsed concurrently in `workers` processes, and
+    the parsed courses are written by the calling process alone, `batch_size`
+    courses per transaction. Every course is loaded in its own savepoint, so
+    a course that fails to load doesn't roll back the rest of its batch.
+
+    `on_loaded` is called with the `ImportResult` of every course, as soon
+    as it is loaded or fails.
+    """
+    paths = list(paths)
+    results: List[ImportResult] = []
+    pending: List[Tuple[ImportResult, models.Course]] = []
+
+    def finish(result):
+        results.append(result)
+        if on_loaded:
+            on_loaded(result)
+
+    def write_batch():
+        with db.get_db().transaction() as transaction:
+            for result, parsed_course in pending:
+                loader = CourseLoader(result.path)
+                start = time.perf_counter()
+                try:
+                    with timings.record(result.timings):
+                        course = loader.load(parsed_course)
+                except Exception as e:
+                    result.error = e
+                else:
+                    result.title = course.title
+                    result.row_counts = dict(loader.row_counts)
+                result.load_time = time.perf_counter() - start
+
+            # every course of the batch gets its share of the commit
+            start = time.perf_counter()
+            transaction.commit()
+            commit_time = (time.perf_counter() - start) / len(pending)
+            for result, _ in pending:
+                if not result.error:
+                    commit = result.timings.stages.setdefault(
+                        "db_commit", timings.Stage())
+                    commit.seconds += commit_time
+                    result.load_time += commit_time
+                finish(result)
+        pending.clear()
+
+    def parsed(result, parse):
+        try:
+            parsed_course, result.parse_time, result.timings = parse()
+        except Exception as e:
+            result.error = e
+            finish(result)
+            return
+
+        result.key = parsed_course.name
+        pending.append((result, parsed_course))
+        if len(pending) >= batch_size:
+            write_batch()
+
+    if len(paths) == 1 or workers == 1:
+        for path in paths:
+            parsed(ImportResult(path=path), lambda: _parse_course(path))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_parse_course, path): ImportResult(path=path)
+                for path in paths
+            }
+            for future in as_completed(futures):
+                parsed(futures[future], future.result)
+
+    if pending:
+        write_batch()
+
+    return results
+
+
 def iter_prevnext(ls: List[Any]) -> Iterator[Tuple[Any, Any, Any]]:
     if not ls:
         yield from ()  # empty iterator
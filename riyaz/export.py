@@ -0,0 +1,207 @@
+"""Export of a Riyaz site as static files.
+
+Every page of the site is rendered with the Flask app and written to a
+directory tree that any static file server can serve:
+
+    out/
+    |-- index.html
+    |-- courses/<course>/index.html
+    |-- courses/<course>/<module>/<lesson>/index.html
+    |-- api/courses/<course>/version
+    |-- assets/
+    |__ static/
+        |__ bundles/
+
+Courses are rendered in parallel, a course per task, and the versions of
+the exported courses are saved in the output directory so that the next
+export skips the courses that haven't changed.
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from . import config
+
+
+MANIFEST_FILENAME = ".riyaz-export.json"
+
+
+@dataclass
+class ExportSummary:
+    exported: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    pages: int = 0
+
+
+def export_site(out_dir: Path, workers: Optional[int] = None,
+                force: bool = False) -> ExportSummary:
+    """Exports all published courses to `out_dir`.
+
+    With `force`, courses are exported even when their version hasn't
+    changed since the last export.
+    """
+    from .db import Course, Store
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / MANIFEST_FILENAME
+    manifest = _read_manifest(manifest_path)
+    summary = ExportSummary()
+
+    versions = {course.key: Store.get(course.key)
+                for course in Course.find_published()}
+    tasks = []
+    for key, version in versions.items():
+        if not force and manifest.get(key) == version:
+            summary.skipped.append(key)
+        else:
+            tasks.append((key, get_course_urls(key)))
+
+    # the index lists all courses, so it is exported every time
+    tasks.append((None, ["/"]))
+
+    # workers are spawned rather than forked, so that they don't share the
+    # database connection of this process
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(config.config_path, config.database_path,
+                  config.assets_path),
+    ) as executor:
+        for key, pages in executor.map(_export_pages, tasks,
+                                       [str(out_dir)] * len(tasks)):
+            summary.pages += pages
+            if key is not None:
+                summary.exported.append(key)
+
+    for key in manifest.keys() - versions.keys():
+        _remove_course(out_dir, key)
+        summary.removed.append(key)
+
+    from .app import app
+    from .highlight import get_stylesheet, get_stylesheet_filename
+    sync_tree(Path(config.assets_path), out_dir / "assets")
+    sync_tree(Path(app.static_folder), out_dir / "static")
+    sync_tree(Path(config.bundles_path), out_dir / "static" / "bundles")
+    if config.highlight_code:
+        _write_file(out_dir / "static" / get_stylesheet_filename(),
+                    get_stylesheet(config.highlight_style).encode())
+
+    _write_file(out_dir / MANIFEST_FILENAME,
+                json.dumps(versions, indent=2).encode())
+    return summary
+
+
+def get_course_urls(key: str) -> List[str]:
+    from .db import Course
+
+    course = Course.find(key=key)
+    urls = [f"/courses/{key}", f"/api/courses/{key}/version"]
+    for module in course.get_outline():
+        for lesson in module["lessons"]:
+            urls.append(f"/courses/{key}/{module['name']}/{lesson['name']}")
+    return urls
+
+
+def get_output_path(out_dir: Path, url: str) -> Path:
+    path = out_dir / url.strip("/")
+    if url.startswith("/api/"):
+        return path
+    return path / "index.html"
+
+
+def sync_tree(src: Path, dst: Path):
+    """Copies files from `src` to `dst` that are missing or have changed.
+    """
+    if not src.is_dir():
+        return
+
+    for root, _, filenames in os.walk(src):
+        dst_root = dst / Path(root).relative_to(src)
+        dst_root.mkdir(parents=True, exist_ok=True)
+        for filename in filenames:
+            src_file, dst_file = Path(root) / filename, dst_root / filename
+            src_stat = src_file.stat()
+            try:
+                dst_stat = dst_file.stat()
+            except FileNotFoundError:
+                dst_stat = None
+
+            if (dst_stat is None
+                    or dst_stat.st_size != src_stat.st_size
+                    or dst_stat.st_mtime < src_stat.st_mtime):
+                shutil.copy2(src_file, dst_file)
+
+
+def _init_worker(config_path: Optional[str], database_path: str,
+                 assets_path: str):
+    # a spawned worker starts with the defaults, not with riyaz.yml
+    if config_path is not None:
+        config.load_config(Path(config_path))
+    config.database_path = database_path
+    config.assets_path = assets_path
+    # pages are rendered once, there is nothing to gain from caching them
+    config.response_cache = False
+
+
+def _export_pages(task: Tuple[Optional[str], List[str]],
+                  out_dir: str) -> Tuple[Optional[str], int]:
+    from .app import app
+
+    key, urls = task
+    client = app.test_client()
+    paths = set()
+    for url in urls:
+        response = client.get(url)
+        if response.status_code != 200:
+            raise ValueError(
+                f"GET {url} returned status {response.status_code}")
+        path = get_output_path(Path(out_dir), url)
+        _write_file(path, response.get_data())
+        paths.add(path)
+
+    if key is not None:
+        # pages of lessons that were removed from the course go too, once
+        # the new pages are in place
+        _remove_stale_files(Path(out_dir), key, paths)
+
+    return key, len(urls)
+
+
+def _remove_course(out_dir: Path, key: str):
+    shutil.rmtree(out_dir / "courses" / key, ignore_errors=True)
+    shutil.rmtree(out_dir / "api" / "courses" / key, ignore_errors=True)
+
+
+def _remove_stale_files(out_dir: Path, key: str, paths: Set[Path]):
+    for course_dir in [out_dir / "courses" / key,
+                       out_dir / "api" / "courses" / key]:
+        for root, _, filenames in os.walk(course_dir, topdown=False):
+            for filename in filenames:
+                path = Path(root) / filename
+                if path not in paths:
+                    path.unlink()
+            if not os.listdir(root):
+                os.rmdir(root)
+
+
+def _write_file(path: Path, content: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+
+
+def _read_manifest(path: Path) -> Dict[str, str]:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
@@ -0,0 +1,93 @@
+"""Server-side syntax highlighting of code blocks.
+
+When `highlight_code` is enabled in riyaz.yml, fenced code blocks are
+highlighted with Pygments when the markdown is rendered, which happens
+once when a course is imported. The language is taken from the info string
+of the fence:
+
+    ```python
+    print("hello")
+    ```
+
+Blocks without a language, or with a language that Pygments doesn't know,
+are left as they are, and so are feather blocks (`{.python .feather}`),
+which are turned into editors in the browser.
+
+The highlighted code only has CSS classes. The colors come from a single
+stylesheet for the `highlight_style` in the config, served from
+/static/highlight.<fingerprint>.css so that browsers can cache it forever.
+
+Pygments has to be installed separately: `pip install Pygments`.
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import html
+import re
+
+from . import config
+
+
+CSS_CLASS = "highlight"
+
+# a code block as rendered by the markdown renderers. A <pre> with
+# attributes is left alone.
+CODE_BLOCK_RE = re.compile(
+    r'<pre><code class="language-([^"]+)">(.*?)</code></pre>', re.DOTALL)
+
+
+@functools.lru_cache(maxsize=None)
+def get_formatter(style: str):
+    from pygments.formatters import HtmlFormatter
+
+    return HtmlFormatter(style=style, nowrap=True)
+
+
+@functools.lru_cache(maxsize=128)
+def get_lexer(language: str):
+    """Returns the Pygments lexer for `language`, or None if there isn't
+    one.
+    """
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+
+    try:
+        return get_lexer_by_name(language)
+    except ClassNotFound:
+        return None
+
+
+def highlight_code_blocks(html_: str) -> str:
+    """Highlights the code blocks in the rendered HTML of a markdown
+    document.
+    """
+    from pygments import highlight
+
+    formatter = get_formatter(config.highlight_style)
+
+    def replace(match):
+        language, code = match.groups()
+        lexer = get_lexer(language)
+        if lexer is None:
+            return match.group(0)
+
+        highlighted = highlight(html.unescape(code), lexer, formatter)
+        return (f'<pre class="{CSS_CLASS}">'
+                f'<code class="language-{language}">{highlighted}</code>'
+                f'</pre>')
+
+    return CODE_BLOCK_RE.sub(replace, html_)
+
+
+@functools.lru_cache(maxsize=None)
+def get_stylesheet(style: str) -> str:
+    return get_formatter(style).get_style_defs(f".{CSS_CLASS}")
+
+
+def get_fingerprint(style: str) -> str:
+    return hashlib.sha1(get_stylesheet(style).encode()).hexdigest()[:12]
+
+
+def get_stylesheet_filename() -> str:
+    return f"highlight.{get_fingerprint(config.highlight_style)}.css"
@@ -0,0 +1,241 @@
+"""Background jobs for a running Riyaz site.
+
+Jobs are queued in a sqlite database of their own (`config.jobs_database_path`)
+so that a worker can record progress while an import holds the write lock
+of the main database. A single worker process (`riyaz worker`) runs the jobs
+one at a time.
+
+Usage:
+
+    job = enqueue_import_course(Path("courses/how-to-python"))
+    ...
+    job = Job.find(id=job.id)
+    print(job.status, job.progress)
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import web
+
+from . import config
+from .db import Document
+
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+schema = """
+create table if not exists job (
+    id integer primary key,
+    kind text not null,
+    key text,
+    args text,
+    status text not null default 'queued',
+    progress real default 0,
+    message text,
+    created datetime,
+    started datetime,
+    finished datetime,
+    worker_pid integer
+);
+
+create index if not exists job_status_idx on job (status, id);
+"""
+
+# kind -> function that runs a job of that kind, see `job_handler`
+job_handlers: Dict[str, Callable[[Job], Optional[str]]] = {}
+
+
+def get_jobs_db():
+    return _get_jobs_db(config.jobs_database_path)
+
+
+@web.memoize
+def _get_jobs_db(database_path):
+    db = web.database("sqlite:///" + database_path)
+    db.printing = config.debug_sql
+    db.ctx.db.cursor().executescript(schema)
+    db.query("pragma journal_mode = wal")
+    return db
+
+
+class Job(Document):
+    _TABLE = "job"
+
+    kind: str
+    key: Optional[str]
+    args: Optional[str]
+    status: str = QUEUED
+    progress: float = 0
+    message: Optional[str]
+    created: Optional[datetime]
+    started: Optional[datetime]
+    finished: Optional[datetime]
+    worker_pid: Optional[int]
+
+    @classmethod
+    def _get_db(cls):
+        return get_jobs_db()
+
+    @classmethod
+    def enqueue(cls, kind: str, key: Optional[str] = None, **args) -> Job:
+        """Adds a job to the queue.
+
+        If a job of the same kind and key is already waiting in the queue,
+        that job is returned instead of adding another one.
+        """
+        with get_jobs_db().transaction():
+            if key is not None:
+                if job := cls.find(kind=kind, key=key, status=QUEUED):
+                    return job
+
+            job = cls(kind=kind, key=key, args=json.dumps(args),
+                      created=datetime.now())
+            return job.save()
+
+    @classmethod
+    def claim_next(cls) -> Optional[Job]:
+        """Marks the oldest queued job as running and returns it.
+        """
+        while job := cls.find(status=QUEUED, order="id"):
+            updated = get_jobs_db().update(
+                "job", where="id = $id and status = $status",
+                vars={"id": job.id, "status": QUEUED},
+                status=RUNNING, started=datetime.now(), worker_pid=os.getpid())
+            if updated:
+                return cls.find(id=job.id)
+
+        return None
+
+    def get_args(self) -> Dict[str, Any]:
+        return json.loads(self.args or "{}")
+
+    def get_duration(self) -> Optional[float]:
+        if self.started is None:
+            return None
+
+        finished = self.finished or datetime.now()
+        return (finished - self.started).total_seconds()
+
+    def set_progress(self, progress: float, message: Optional[str] = None):
+        self.progress = progress
+        self.message = message
+        get_jobs_db().update(
+            "job", where="id = $id", vars={"id": self.id},
+            progress=progress, message=message)
+
+    def finish(self, status: str, message: Optional[str] = None):
+        self.update(status=status, message=message, finished=datetime.now())
+        if status == DONE:
+            self.progress = 1
+        self.save()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "key": self.key,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "created": self.created and self.created.isoformat(),
+            "started": self.started and self.started.isoformat(),
+            "finished": self.finished and self.finished.isoformat(),
+            "duration": self.get_duration(),
+        }
+
+
+def job_handler(kind: str):
+    """Decorator to register a function that runs jobs of `kind`.
+
+    The function is called with the job, and the message it returns is saved
+    on the job when it finishes.
+    """
+    def decorator(f):
+        job_handlers[kind] = f
+        return f
+    return decorator
+
+
+def enqueue_import_course(course_dir: Path) -> Job:
+    path = str(Path(course_dir).resolve())
+    return Job.enqueue("import-course", key=path, path=path)
+
+
+@job_handler("import-course")
+def run_import_course(job: Job) -> str:
+    from .disk import CourseLoader
+
+    last_update = 0.0
+
+    def on_progress(done, total):
+        nonlocal last_update
+        # throttle writes to the jobs database
+        if done == total or time.monotonic() - last_update > 0.5:
+            last_update = time.monotonic()
+            job.set_progress(done / total, f"loaded {done} of {total} lessons")
+
+    loader = CourseLoader(Path(job.get_args()["path"]), on_progress=on_progress)
+    course = loader.load()
+
+    rows = sum(loader.row_counts.values())
+    return f"loaded course '{course.key}' ({rows} rows)"
+
+
+def run_job(job: Job) -> Job:
+    handler = job_handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"unknown job kind '{job.kind}'")
+        message = handler(job)
+    except Exception:
+        job.finish(FAILED, traceback.format_exc())
+    else:
+        job.finish(DONE, message)
+
+    return job
+
+
+def fail_abandoned_jobs():
+    """Marks jobs left running by a worker that has exited as failed.
+    """
+    for job in Job.find_all(status=RUNNING):
+        if job.worker_pid is None or not is_running(job.worker_pid):
+            job.finish(FAILED, "worker exited before the job finished")
+
+
+def is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def run_worker(poll_interval: float = 1.0, once: bool = False,
+               on_finished: Optional[Callable[[Job], None]] = None):
+    """Runs queued jobs one at a time, forever.
+
+    With `once`, returns when the queue is empty.
+    """
+    fail_abandoned_jobs()
+
+    while True:
+        job = Job.claim_next()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        run_job(job)
+        if on_finished:
+            on_finished(job)
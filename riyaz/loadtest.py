@@ -0,0 +1,269 @@
+"""Load testing of a Riyaz site over HTTP.
+
+Simulates two kinds of clients against a running server:
+
+    - readers, who open the catalog, then a course page, and then read a
+      few lessons of the course one after another, without pausing
+    - tabs, lessons left open in a browser, which poll the version of their
+      course every second
+
+and reports the throughput and the latency percentiles of every route:
+the catalog, course pages, lessons and the version endpoint.
+
+The pages are found by crawling the site from the catalog, so any site
+can be tested. `riyaz loadtest` generates a site with synthetic courses
+when it isn't given one, and starts gunicorn on it for each combination
+of workers and threads.
+"""
+from __future__ import annotations
+
+import contextlib
+import http.client
+import random
+import re
+import shlex
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import yaml
+
+from . import config
+from .metrics import percentile
+
+
+ROUTES = ["catalog", "course", "lesson", "version"]
+
+SERVER_COMMAND = ("gunicorn -k gthread --workers {workers} --threads {threads} "
+                  "-b 127.0.0.1:{port} riyaz.app:app")
+
+COURSE_LINK_RE = re.compile(r'href="/courses/([^"/#]+)"')
+LESSON_LINK_RE = re.compile(r'href="(/courses/[^"/#]+/[^"/#]+/[^"/#]+)"')
+
+
+@dataclass
+class RouteStats:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+
+    def to_dict(self, duration: float) -> dict:
+        return {
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "rps": len(self.latencies) / duration,
+            **{f"p{p}": percentile(self.latencies, p) for p in (50, 95, 99)},
+        }
+
+
+@dataclass
+class Site:
+    """URLs of a site, as found by crawling it.
+    """
+    # lesson URLs of every course, in the order of the course outline
+    courses: Dict[str, List[str]]
+
+
+@dataclass
+class LoadTestResult:
+    duration: float
+    routes: Dict[str, RouteStats]
+    workers: Optional[int] = None
+    threads: Optional[int] = None
+
+    def get_rps(self) -> float:
+        return sum(len(s.latencies) for s in self.routes.values()) / self.duration
+
+    def get_errors(self) -> int:
+        return sum(s.errors for s in self.routes.values())
+
+    def to_dict(self) -> dict:
+        return {
+            "workers": self.workers,
+            "threads": self.threads,
+            "duration": self.duration,
+            "rps": self.get_rps(),
+            "errors": self.get_errors(),
+            "routes": {name: stats.to_dict(self.duration)
+                       for name, stats in self.routes.items()},
+        }
+
+
+def create_site(path: Path, courses: int = 3, **course_options) -> Path:
+    """Creates a site at `path` with `courses` synthetic courses, see
+    riyaz.synthetic.generate_course for `course_options`.
+    """
+    from .disk import CourseLoader
+    from .migrate import migrate
+    from .synthetic import generate_course
+
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "riyaz.yml").write_text(yaml.safe_dump({
+        "database_path": "riyaz.db",
+        "assets_path": "assets",
+    }))
+    config.load_config(path / "riyaz.yml")
+    migrate()
+
+    for i in range(1, courses + 1):
+        course_dir = generate_course(
+            path / "courses", name=f"course-{i}", seed=i, **course_options)
+        CourseLoader(course_dir).load()
+    return path
+
+
+def get_page(conn: http.client.HTTPConnection, url: str) -> str:
+    conn.request("GET", url)
+    response = conn.getresponse()
+    body = response.read().decode()
+    if response.status != 200:
+        raise RuntimeError(f"GET {url} returned {response.status}")
+    return body
+
+
+def crawl_site(port: int) -> Site:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    courses = {}
+    try:
+        for name in dict.fromkeys(COURSE_LINK_RE.findall(get_page(conn, "/"))):
+            page = get_page(conn, f"/courses/{name}")
+            courses[name] = list(dict.fromkeys(LESSON_LINK_RE.findall(page)))
+    finally:
+        conn.close()
+
+    if not courses:
+        raise RuntimeError("no courses found in the catalog")
+    return Site(courses=courses)
+
+
+class _Client:
+    def __init__(self, port: int, results: Dict[str, RouteStats],
+                 lock: threading.Lock):
+        self.port = port
+        self.results = results
+        self.lock = lock
+        self.conn = self._connect()
+
+    def _connect(self):
+        return http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+
+    def get(self, route: str, url: str):
+        start = time.perf_counter()
+        try:
+            self.conn.request("GET", url)
+            response = self.conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            self.conn.close()
+            self.conn = self._connect()
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            if ok:
+                self.results[route].latencies.append(elapsed)
+            else:
+                self.results[route].errors += 1
+
+
+def run_load(port: int, site: Site, readers: int = 8, tabs: int = 50,
+             duration: float = 10, poll_interval: float = 1.0,
+             seed: int = 0) -> LoadTestResult:
+    """Runs `readers` readers and `tabs` tabs against the server on `port`
+    for `duration` seconds.
+    """
+    results = {route: RouteStats() for route in ROUTES}
+    lock = threading.Lock()
+    stop = threading.Event()
+    course_names = sorted(site.courses)
+
+    def reader(rng: random.Random):
+        client = _Client(port, results, lock)
+        while not stop.is_set():
+            client.get("catalog", "/")
+            name = rng.choice(course_names)
+            client.get("course", f"/courses/{name}")
+
+            lessons = site.courses[name]
+            if lessons:
+                first = rng.randrange(len(lessons))
+                for url in lessons[first:first + rng.randint(1, 5)]:
+                    if stop.is_set():
+                        break
+                    client.get("lesson", url)
+        client.conn.close()
+
+    def tab(rng: random.Random):
+        client = _Client(port, results, lock)
+        url = f"/api/courses/{rng.choice(course_names)}/version"
+        # spread the polls of the tabs over the interval
+        stop.wait(rng.random() * poll_interval)
+        while not stop.is_set():
+            client.get("version", url)
+            stop.wait(poll_interval)
+        client.conn.close()
+
+    rng = random.Random(seed)
+    threads = [
+        threading.Thread(target=reader, args=(random.Random(rng.random()),))
+        for _ in range(readers)
+    ] + [
+        threading.Thread(target=tab, args=(random.Random(rng.random()),))
+        for _ in range(tabs)
+    ]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    stop.wait(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    return LoadTestResult(duration=time.perf_counter() - start, routes=results)
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(
+                f"server exited with status {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server didn't start on port {port}")
+
+
+@contextlib.contextmanager
+def run_server(command: str, root_directory: Path, port: int) -> Iterator[None]:
+    """Runs the server `command` in `root_directory` until the block exits.
+    """
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(
+            shlex.split(command), cwd=root_directory,
+            stdout=log, stderr=subprocess.STDOUT)
+        try:
+            try:
+                wait_for_port(port, process)
+            except RuntimeError as e:
+                log.seek(0)
+                output = log.read().decode(errors="replace")[-2000:]
+                raise RuntimeError(f"{e}\n{output}") from None
+            yield
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,473 @@
+"""Metrics of Riyaz, in the Prometheus text format.
+
+With `metrics: true` in riyaz.yml, the app serves them at /metrics. Without
+it, nothing is recorded and /metrics is not found. Every metric of riyaz is defined in this
+module, and recorded where it happens:
+
+    - requests and their latency, by route, in riyaz.app
+    - SQL statements and their time, in riyaz.db
+    - template and markdown render time, in riyaz.app and riyaz.render
+    - course imports and rows written, in riyaz.disk
+    - version polls and event streams, in riyaz.app and riyaz.asgi
+    - hits and misses of the caches, read from the caches when collected
+
+Recording is cheap and takes no lock: every thread counts into its own
+dict, and the dicts of all threads are added up when the metrics are
+collected.
+
+To add up the metrics of all gunicorn workers, and of `riyaz worker` and
+`riyaz import-course`, set `metrics_dir` in riyaz.yml. Every process then
+writes its metrics to metrics_dir/<pid>-<random>.json, from a thread that
+writes them within a second of being recorded, and when it exits, and
+/metrics adds up the files of all processes. The files of processes that
+have exited are added to metrics_dir/retired.json and removed, so counters
+never go down, and a new process with the pid of an old one doesn't
+overwrite its file. Without metrics_dir, /metrics only has the metrics of
+the worker that serves it.
+"""
+from __future__ import annotations
+
+import atexit
+import bisect
+import contextlib
+import json
+import os
+import secrets
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import (
+    Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+)
+
+from . import config
+
+
+# in seconds, from 1ms to 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+# SQL statements are mostly well under a millisecond
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+               0.05, 0.1, 0.25, 1.0)
+IMPORT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+                  300.0)
+
+# seconds between writes of the metrics of a process to metrics_dir
+FLUSH_INTERVAL = 1.0
+
+# file in metrics_dir with the totals of the processes that have exited
+RETIRED_FILE = "retired.json"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Key = Tuple[str, Tuple[str, ...]]
+# (metric name, labels, value)
+Sample = Tuple[str, Tuple[str, ...], float]
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, registry: Registry, name: str, help: str,
+                 labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def _get_key(self, labels: Tuple[str, ...]) -> Key:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(
+                f"{self.name} has labels {self.labelnames}, got {labels}")
+        return self.name, labels
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        store = self.registry.get_store()
+        key = self._get_key(labels)
+        store[key] = store.get(key, 0) + amount
+        self.registry.dirty = True
+
+
+class Histogram(Metric):
+    """Counts of observations in buckets, with their sum and count.
+
+    The value of a histogram is a list of the counts of every bucket,
+    not cumulative, followed by the sum of the observations.
+    """
+    type = "histogram"
+
+    def __init__(self, registry: Registry, name: str, help: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        store = self.registry.get_store()
+        key = self._get_key(labels)
+        counts = store.get(key)
+        if counts is None:
+            # a bucket per upper bound, one for +Inf, and the sum
+            counts = store[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+        self.registry.dirty = True
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+        # functions called when collecting, which return the values of
+        # counters kept elsewhere, like the hits of a cache
+        self.collectors: List[Callable[[], Iterable[Sample]]] = []
+
+        self._local = threading.local()
+        # stores of live threads, and the totals of threads that are gone
+        self._stores: List[Tuple[weakref.ref, dict]] = []
+        self._retired: dict = {}
+        self._lock = threading.Lock()
+
+        # whether metrics were recorded since they were last written
+        self.dirty = False
+        # directory the flusher thread of the process writes to
+        self._directory: Optional[str] = None
+        self._flusher_pid: Optional[int] = None
+        self._file_pid: Optional[int] = None
+        self._file_name = ""
+
+    def register(self, metric: Metric):
+        self.metrics[metric.name] = metric
+
+    def add_collector(self, f: Callable[[], Iterable[Sample]]):
+        self.collectors.append(f)
+        return f
+
+    def get_store(self) -> dict:
+        try:
+            return self._local.store
+        except AttributeError:
+            store = self._local.store = {}
+            with self._lock:
+                self._stores.append((weakref.ref(threading.current_thread()), store))
+            return store
+
+    def collect(self) -> dict:
+        """Returns the metrics of this process, as a dict of (name, labels)
+        to value.
+        """
+        with self._lock:
+            live = []
+            for thread_ref, store in self._stores:
+                thread = thread_ref()
+                if thread is None or not thread.is_alive():
+                    _merge(self._retired, store)
+                else:
+                    live.append((thread_ref, store))
+            self._stores = live
+            values = _copy(self._retired)
+
+        for _, store in live:
+            # copying a dict is atomic, so the thread can keep counting
+            _merge(values, dict(store))
+
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                _merge(values, {(name, tuple(labels)): value})
+        return values
+
+    def collect_all(self, directory: Optional[str] = None) -> dict:
+        """Returns the metrics of this process added to those of every other
+        process in `directory`.
+        """
+        values = self.collect()
+        if not directory or not os.path.isdir(directory):
+            return values
+
+        self.retire(directory)
+        with _lock_directory(directory):
+            retired = _read_retired(directory)
+            _merge(values, retired["values"])
+
+            skip = {self.get_file_name(), RETIRED_FILE, *retired["merged"]}
+            for path in Path(directory).glob("*.json"):
+                if path.name not in skip:
+                    _merge(values, _read_snapshot(path) or {})
+        return values
+
+    def retire(self, directory: str):
+        """Adds the metrics of the processes in `directory` that have exited
+        to its RETIRED_FILE, and removes their files.
+        """
+        with _lock_directory(directory, exclusive=True):
+            retired = _read_retired(directory)
+            merged = [name for name in retired["merged"]
+                      if (Path(directory) / name).exists()]
+
+            dead = []
+            for path in Path(directory).glob("*.json"):
+                if path.name == RETIRED_FILE or path.name in merged:
+                    continue
+                pid = _get_pid(path.name)
+                if pid is None or _is_alive(pid):
+                    continue
+                _merge(retired["values"], _read_snapshot(path) or {})
+                dead.append(path)
+
+            if not dead and merged == retired["merged"]:
+                return
+
+            # the files are listed as merged until they are removed, so a
+            # file is never added twice
+            _write_json(Path(directory) / RETIRED_FILE, {
+                "values": _to_snapshot(retired["values"]),
+                "merged": merged + [path.name for path in dead],
+            })
+            for path in dead:
+                path.unlink(missing_ok=True)
+
+    def get_file_name(self) -> str:
+        """Returns the name of the file of this process in metrics_dir.
+        """
+        pid = os.getpid()
+        if self._file_pid != pid:
+            self._file_pid = pid
+            self._file_name = f"{pid}-{secrets.token_hex(4)}.json"
+        return self._file_name
+
+    def flush(self, directory: str):
+        """Writes the metrics of this process to `directory`.
+        """
+        os.makedirs(directory, exist_ok=True)
+        _write_json(Path(directory) / self.get_file_name(),
+                    _to_snapshot(self.collect()))
+
+    def maybe_flush(self, directory: Optional[str]):
+        """Writes the metrics to `directory`, if it is set, within
+        FLUSH_INTERVAL seconds from a thread of this process, and then
+        again whenever metrics are recorded.
+        """
+        self._directory = directory
+        if not directory or self._flusher_pid == os.getpid():
+            return
+
+        with self._lock:
+            # the thread isn't copied to a forked process
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        threading.Thread(target=self._run_flusher, name="riyaz-metrics",
+                         daemon=True).start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            if self.dirty and self._directory:
+                self.dirty = False
+                try:
+                    self.flush(self._directory)
+                except OSError:
+                    pass
+
+    def format(self, values: dict) -> str:
+        """Formats `values` from collect in the Prometheus text format.
+        """
+        by_name: Dict[str, list] = {}
+        for (name, labels), value in sorted(values.items()):
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for labels, value in by_name.get(name, []):
+                pairs = list(zip(metric.labelnames, labels))
+                if isinstance(metric, Histogram):
+                    lines.extend(_format_histogram(metric, pairs, value))
+                else:
+                    lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def percentile(values: Iterable[float], p: float) -> Optional[float]:
+    """Returns the `p`th percentile of `values`, or None without values.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def _merge(values: dict, other: dict):
+    for key, value in other.items():
+        current = values.get(key)
+        if current is None:
+            values[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(current, list):
+            for i, v in enumerate(value):
+                current[i] += v
+        else:
+            values[key] = current + value
+
+
+def _to_snapshot(values: dict) -> list:
+    return [[name, list(labels), value]
+            for (name, labels), value in values.items()]
+
+
+def _from_snapshot(snapshot: list) -> dict:
+    return {(name, tuple(labels)): value for name, labels, value in snapshot}
+
+
+def _read_snapshot(path: Path) -> Optional[dict]:
+    try:
+        return _from_snapshot(json.loads(path.read_text()))
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def _read_retired(directory: str) -> dict:
+    try:
+        retired = json.loads((Path(directory) / RETIRED_FILE).read_text())
+        return {"values": _from_snapshot(retired["values"]),
+                "merged": list(retired["merged"])}
+    except (OSError, ValueError, TypeError, KeyError):
+        return {"values": {}, "merged": []}
+
+
+def _write_json(path: Path, data):
+    tmp_path = path.with_name(
+        f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(json.dumps(data))
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def _lock_directory(directory: str,
+                    exclusive: bool = False) -> Iterator[None]:
+    """Holds a lock on `directory` shared by all processes, exclusive or
+    shared. Without fcntl, on Windows, the directory is not locked.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    with open(Path(directory) / ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _get_pid(filename: str) -> Optional[int]:
+    pid = filename.split(".")[0].split("-")[0]
+    return int(pid) if pid.isdigit() else None
+
+
+def _is_alive(pid: int) -> bool:
+    # on Windows, os.kill ends the process, so it is never retired
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _copy(values: dict) -> dict:
+    return {key: list(value) if isinstance(value, list) else value
+            for key, value in values.items()}
+
+
+def _format_histogram(metric: Histogram, pairs, counts) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip((*metric.buckets, "+Inf"), counts):
+        cumulative += count
+        le = bound if bound == "+Inf" else _format_value(bound)
+        lines.append(f"{metric.name}_bucket{_format_labels([*pairs, ('le', le)])} "
+                     f"{_format_value(cumulative)}")
+    lines.append(f"{metric.name}_sum{_format_labels(pairs)} {_format_value(counts[-1])}")
+    lines.append(f"{metric.name}_count{_format_labels(pairs)} {_format_value(cumulative)}")
+    return lines
+
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value) -> str:
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+http_requests = Counter(
+    registry, "riyaz_http_requests_total",
+    "HTTP requests, by route, method and status.",
+    ["route", "method", "status"])
+http_request_duration = Histogram(
+    registry, "riyaz_http_request_duration_seconds",
+    "Time to handle HTTP requests, by route.", ["route"])
+sql_statement_duration = Histogram(
+    registry, "riyaz_sql_statement_duration_seconds",
+    "Time to execute SQL statements, by statement.", ["statement"],
+    buckets=SQL_BUCKETS)
+template_render_duration = Histogram(
+    registry, "riyaz_template_render_duration_seconds",
+    "Time to render templates, by template.", ["template"])
+markdown_render_duration = Histogram(
+    registry, "riyaz_markdown_render_duration_seconds",
+    "Time to render markdown, by renderer.", ["renderer"])
+cache_hits = Counter(
+    registry, "riyaz_cache_hits_total", "Cache hits, by cache.", ["cache"])
+cache_misses = Counter(
+    registry, "riyaz_cache_misses_total", "Cache misses, by cache.", ["cache"])
+course_import_duration = Histogram(
+    registry, "riyaz_course_import_duration_seconds",
+    "Time to import courses, of whole courses (full) or of changed "
+    "lessons (lessons).", ["kind"], buckets=IMPORT_BUCKETS)
+course_import_rows = Counter(
+    registry, "riyaz_course_import_rows_total",
+    "Rows written by course imports, by table.", ["table"])
+version_polls = Counter(
+    registry, "riyaz_version_polls_total",
+    "Checks of course versions by open lessons, as version requests (poll) "
+    "and as event streams opened (events).", ["transport"])
+
+
+def maybe_flush():
+    if config.metrics:
+        registry.maybe_flush(config.metrics_dir)
+
+
+@atexit.register
+def _flush_at_exit():
+    if config.metrics and config.metrics_dir and registry.collect():
+        registry.flush(config.metrics_dir)
+
+
+def render_metrics() -> str:
+    return registry.format(registry.collect_all(config.metrics_dir))
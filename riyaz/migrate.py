@@ -1,10 +1,42 @@
 from .db import get_db
 from pathlib import Path
 
+
+# migrations to bring an existing database up to date with schema.sql.
+# each entry is (version, sql script). schema.sql sets user_version to the
+# latest version, and a database created before versioning is at version 1.
+MIGRATIONS = [
+    (2, """
+    create table course_release (
+        id integer primary key,
+        course_key text not null,
+        course_id integer references course,
+        version text,
+        created datetime,
+        published datetime
+    );
+
+    insert into course_release (course_key, course_id, version, created, published)
+    select course.key, course.id, store.value, datetime('now'), datetime('now')
+    from course left join store on store.key = course.key;
+    """),
+    (3, """
+    alter table course add column description_html text;
+    alter table instructor add column about_html text;
+    alter table lesson add column content_html text;
+    """),
+    (4, """
+    alter table lesson add column languages text;
+    """),
+]
+
+
 def migrate():
     """Migrate the database to the latest version.
     """
     init_schema()
+    apply_migrations()
+    enable_wal()
 
 def get_tables():
     q = "select name from sqlite_master where type='table'"
@@ -20,5 +52,22 @@ def init_schema():
         cursor = get_db().ctx.db.cursor()
         cursor.executescript(schema)
 
+def get_schema_version():
+    version = get_db().query("pragma user_version")[0].user_version
+    return version or 1
+
+def apply_migrations():
+    cursor = get_db().ctx.db.cursor()
+    for version, script in MIGRATIONS:
+        if get_schema_version() < version:
+            cursor.executescript(
+                f"begin; {script}; pragma user_version = {version}; commit;")
+
+def enable_wal():
+    """Switch to write-ahead logging, so that readers never block on, or
+    get blocked by, a course that is being imported.
+    """
+    get_db().query("pragma journal_mode = wal")
+
 if __name__ == "__main__":
-    migrate()
\ No newline at end of file
+    migrate()
@@ -13,6 +13,7 @@ class Lesson(BaseModel):
     name: str
     title: str
     content: str
+    content_html: Optional[str] = None
 
 
 class Chapter(BaseModel):
@@ -27,6 +28,10 @@ class Author(BaseModel):
     about: Optional[str]
     photo: Optional[FilePath]
 
+    # content of the photo when it isn't read from disk, like in a bundle.
+    # photo is then just the filename.
+    photo_content: Optional[bytes] = None
+
 
 class Course(BaseModel):
     name: str
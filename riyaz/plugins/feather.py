@@ -1,12 +1,105 @@
-from riyaz.app import include_stylesheet, include_javascript
-from riyaz import config
+"""Live code editors for code blocks with the feather class.
 
+    ```{.python .feather}
+    print("hello, world!")
+    ```
 
-feather_config = getattr(config, "feather", {})
+The code runs on the feather server in static/feather/feather_config.js.
+With `local_execution` enabled, Python code runs on this server instead, in
+a pool of sandboxed worker processes (see riyaz.sandbox):
+
+    feather:
+      local_execution: true
+      workers: 4          # default: number of CPUs
+      queue_size: 64      # requests waiting for a worker, beyond that 429
+      timeout: 5          # seconds
+      cpu_seconds: 2
+      memory_mb: 256
+
+`riyaz serve --local-execution` enables it too; it is off unless asked for.
+Snippets are not isolated from the filesystem or the network, so don't
+enable it on a public site.
+Only the pages of this server can run code: other sites could otherwise
+run code on the machine of an author who visits them while `riyaz serve`
+runs. The editors send a secret, which /feather/config.js gives to the
+pages of this server, and code only runs for requests to localhost or to
+one of `allowed_hosts`, so that a site that points its own name to this
+machine can't run code either:
+
+    feather:
+      local_execution: true
+      allowed_hosts: [riyaz.internal]
+      token: <secret>     # default: random, per process
+
+With several worker processes, set `token`, so that all of them accept the
+secret that any of them gave to a page.
+"""
+import hmac
+import json
+import secrets
+import shlex
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from flask import abort, request
+
+from riyaz import config, sandbox
+from riyaz.sandbox import Limits, QueueFull, SandboxPool
+
+
+codemirror_dir = Path(__file__).parent.parent / "static/feather/codemirror"
+
+# CodeMirror mode of languages whose name is not the name of the mode
+MODE_ALIASES = {
+    "golang": "go",
+    "html": "htmlmixed",
+    "js": "javascript",
+    "json": "javascript",
+    "sh": "shell",
+    "bash": "shell",
+    "c": "clike",
+    "cpp": "clike",
+    "java": "clike",
+    "yml": "yaml",
+}
+
+# modes that use other modes
+MODE_DEPENDENCIES = {
+    "htmlmixed": ["xml", "javascript", "css"],
+    "markdown": ["xml"],
+}
+
+
+# header with the secret of the editors of the pages of this server, see
+# view_config_js. Pages of other sites can only send it after a CORS
+# preflight request, which this server never allows.
+LOCAL_HEADER = "X-FEATHER-LOCAL"
+
+# hosts that can run code, besides `allowed_hosts` in the feather config
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+_token = secrets.token_urlsafe(32)
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_config():
+    return config.feather
+
+
+def is_local_execution_enabled():
+    # snippets can't run on Windows, see riyaz.sandbox
+    return bool(get_config().get("local_execution")) and sandbox.is_supported()
 
 
 def get_modes():
-    modes = feather_config.get("modes", ["python"])
+    """Returns the modes to load on every lesson with code, in addition to
+    the modes of the languages in the lesson.
+    """
+    modes = get_config().get("modes", [])
     return modes
 
 
@@ -18,27 +111,184 @@ def get_stylesheets():
 
 
 def get_javascripts():
-    mode_js = "/static/feather/codemirror/mode/{mode}/{mode}.js"
     return [
         "/static/feather/jquery-3.6.0.min.js",
         "/static/feather/codemirror/lib/codemirror.js",
         "/static/feather/codemirror/addon/mode/simple.js",
         "/static/feather/codemirror/keymap/sublime.js",
-        *[mode_js.format(mode=mode) for mode in get_modes()],
         "/static/feather/feather.js",
         "/static/feather/feather_config.js",
     ]
 
 
+def get_mode_javascripts(languages):
+    """Returns the javascripts of the CodeMirror modes for `languages`.
+    Languages without a mode are skipped.
+    """
+    mode_js = "/static/feather/codemirror/mode/{mode}/{mode}.js"
+
+    modes = []
+    for language in [*get_modes(), *languages]:
+        mode = MODE_ALIASES.get(language, language)
+        if not (codemirror_dir / "mode" / mode / f"{mode}.js").is_file():
+            continue
+
+        for m in [*MODE_DEPENDENCIES.get(mode, []), mode]:
+            if m not in modes:
+                modes.append(m)
+
+    return [mode_js.format(mode=mode) for mode in modes]
+
+
+def get_local_execution_javascripts(languages):
+    # loaded after feather_config.js, to point the editors to this server
+    if is_local_execution_enabled():
+        return ["/feather/config.js"]
+    return []
+
+
+def get_pool() -> SandboxPool:
+    """Returns the pool of workers that run code, starting it on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            feather_config = get_config()
+            limits = Limits(
+                cpu_seconds=int(feather_config.get("cpu_seconds", 2)),
+                memory_mb=int(feather_config.get("memory_mb", 256)),
+                timeout=float(feather_config.get("timeout", 5)),
+            )
+            _pool = SandboxPool(
+                workers=feather_config.get("workers"),
+                queue_size=int(feather_config.get("queue_size", 64)),
+                limits=limits)
+        return _pool
+
+
+def get_token() -> str:
+    """Returns the secret that the editors send with the code they run.
+    """
+    return str(get_config().get("token") or _token)
+
+
+def view_config_js():
+    if not is_local_execution_enabled():
+        abort(404)
+    if not is_allowed_host() or not is_same_site_request():
+        abort(403)
+
+    feather_config = {
+        "server_url": "/feather",
+        "headers": {LOCAL_HEADER: get_token()},
+    }
+    return (f"window.feather_config = {json.dumps(feather_config)};\n",
+            200, {"Content-Type": "text/javascript",
+                  "Cache-Control": "no-store"})
+
+
+def is_allowed_host() -> bool:
+    """Tells whether the request is for localhost or one of `allowed_hosts`.
+
+    Checking the Origin alone is not enough: a site can point its own name
+    to 127.0.0.1, and its pages are then of the same origin as this server.
+    """
+    try:
+        hostname = urlsplit(f"//{request.host}").hostname
+    except ValueError:
+        return False
+
+    allowed_hosts = {
+        host.lower() for host in get_config().get("allowed_hosts", [])}
+    return hostname in LOCAL_HOSTS | allowed_hosts
+
+
+def is_same_site_request() -> bool:
+    site = request.headers.get("Sec-Fetch-Site", "same-origin")
+    return site in ("same-origin", "none")
+
+
+def is_same_origin_request() -> bool:
+    """Tells whether the request comes from a page of this server.
+    """
+    if not is_allowed_host():
+        return False
+
+    token = request.headers.get(LOCAL_HEADER, "")
+    if not hmac.compare_digest(token.encode(), get_token().encode()):
+        return False
+
+    origin = request.headers.get("Origin")
+    if origin is not None and urlsplit(origin).netloc != request.host:
+        return False
+
+    return is_same_site_request()
+
+
+def run_code(runtime: str):
+    if not is_local_execution_enabled():
+        abort(404)
+    if not is_same_origin_request():
+        abort(403)
+    if runtime != "python":
+        return f"ERROR: runtime {runtime} is not supported\n", 404
+
+    files: Dict[str, str] = {
+        name: f.read().decode(errors="replace")
+        for name, f in request.files.items()
+    }
+    if files:
+        code = files.get("main.py") or next(iter(files.values()))
+    else:
+        code = request.get_data(as_text=True)
+
+    args = shlex.split(request.headers.get("X-FEATHER-ARGS", ""))
+    env = dict(
+        item.split("=", 1)
+        for item in shlex.split(request.headers.get("X-FEATHER-ENV", ""))
+        if "=" in item
+    )
+
+    try:
+        result = get_pool().run(code, args=args, env=env, files=files)
+    except QueueFull:
+        return ("ERROR: too many programs are running, try again\n",
+                429, {"Retry-After": "1"})
+
+    return result.output, 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+
+def view_metrics():
+    if not is_local_execution_enabled() or _pool is None:
+        return {}
+    return _pool.metrics.to_dict()
+
+
 def inject_assets():
-    stylesheets = get_stylesheets()
-    javascripts = get_javascripts()
+    from riyaz.app import (
+        add_lesson_javascripts, include_lesson_javascript,
+        include_lesson_stylesheet
+    )
+
+    for ss in get_stylesheets():
+        include_lesson_stylesheet(ss)
+
+    for js in get_javascripts():
+        include_lesson_javascript(js)
+
+    add_lesson_javascripts(get_mode_javascripts)
+    add_lesson_javascripts(get_local_execution_javascripts)
+
 
-    for ss in stylesheets:
-        include_stylesheet(ss)
+def add_routes():
+    from riyaz.app import app
 
-    for js in javascripts:
-        include_javascript(js)
+    app.add_url_rule("/feather/config.js", view_func=view_config_js)
+    app.add_url_rule("/feather/runtimes/<runtime>", view_func=run_code,
+                     methods=["POST"])
+    app.add_url_rule("/feather/metrics", view_func=view_metrics)
 
 
-inject_assets()
+def init():
+    inject_assets()
+    add_routes()
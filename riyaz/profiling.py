@@ -0,0 +1,165 @@
+"""Profiling of requests.
+
+ProfilerMiddleware wraps the WSGI app of riyaz.app and profiles a request
+when:
+
+    - `profile` is set in riyaz.yml, or `riyaz serve --profile` is used,
+      which profiles every request
+    - a random number falls below `profile_sample_rate`, to profile a
+      fraction of the requests of a production site
+    - `profile_token` is set and the request has the header
+      `X-Riyaz-Profile: <token>`, to profile a single request
+
+    $ curl -H "X-Riyaz-Profile: $TOKEN" https://riyaz.example.com/courses/...
+
+A profile is written per request to profile_dir/<endpoint>/, like
+profiles/view_lesson/20240101-120000-123456-42ms.prof. With `profiler:
+cprofile`, the default, the files are cProfile stats, for `python -m
+pstats` or snakeviz. With `profiler: sample`, the stack of the request is
+sampled every few milliseconds instead, and the files are collapsed stacks
+(.folded) for flamegraph.pl or speedscope.
+
+Only the view is profiled, and not the body of streamed responses, like
+event streams. A single request is profiled at a time; requests that
+arrive while another one is profiled are served without profiling.
+"""
+from __future__ import annotations
+
+import cProfile
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from . import config
+
+
+PROFILE_HEADER = "X-Riyaz-Profile"
+PROFILERS = ["cprofile", "sample"]
+
+
+def should_profile(environ: dict) -> bool:
+    if config.profile:
+        return True
+
+    token = environ.get("HTTP_" + PROFILE_HEADER.upper().replace("-", "_"))
+    if config.profile_token and token is not None:
+        if hmac.compare_digest(token.encode(), str(config.profile_token).encode()):
+            return True
+
+    return random.random() < config.profile_sample_rate
+
+
+class StackSampler:
+    """Samples the stack of a thread every `interval` seconds from another
+    thread, and counts the samples of every stack.
+
+    A sample can only be taken when the sampled thread releases the GIL,
+    so intervals below sys.getswitchinterval() (5ms by default) don't
+    give more samples.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="riyaz-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} "
+                             f"({os.path.basename(code.co_filename)}:"
+                             f"{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def write(self, path: Path):
+        """Writes the samples in the collapsed stack format, a line per
+        stack with the frames separated by semicolons and the sample count.
+        """
+        with open(path, "w") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfilerMiddleware:
+    def __init__(self, wsgi_app, flask_app):
+        self.wsgi_app = wsgi_app
+        self.flask_app = flask_app
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if not should_profile(environ):
+            return self.wsgi_app(environ, start_response)
+
+        # cProfile can't profile two threads at once in Python 3.12+
+        if not self._lock.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+
+        try:
+            return self._profile(environ, start_response)
+        finally:
+            self._lock.release()
+
+    def _profile(self, environ, start_response):
+        if config.profiler == "sample":
+            profiler = StackSampler(threading.get_ident())
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            return self.wsgi_app(environ, start_response)
+        finally:
+            elapsed = time.perf_counter() - start
+            if isinstance(profiler, StackSampler):
+                profiler.stop()
+            else:
+                profiler.disable()
+            self._write(profiler, self.get_endpoint(environ), elapsed)
+
+    def get_endpoint(self, environ: dict) -> str:
+        try:
+            endpoint, _ = self.flask_app.url_map.bind_to_environ(environ).match()
+        except Exception:
+            return "unmatched"
+        return endpoint
+
+    def _write(self, profiler, endpoint: str, elapsed: float):
+        path = get_profile_path(
+            endpoint, elapsed,
+            ".folded" if isinstance(profiler, StackSampler) else ".prof")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(profiler, StackSampler):
+            profiler.write(path)
+        else:
+            profiler.dump_stats(path)
+
+
+def get_profile_path(endpoint: str, elapsed: float, suffix: str,
+                     now: Optional[datetime] = None) -> Path:
+    now = now or datetime.now()
+    name = f"{now:%Y%m%d-%H%M%S-%f}-{elapsed * 1000:.0f}ms{suffix}"
+    return Path(config.profile_dir) / endpoint / name
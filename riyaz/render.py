@@ -0,0 +1,176 @@
+"""Rendering of course content to HTML.
+
+Lessons, course descriptions and instructor bios are rendered once, when the
+course is imported, and the HTML is stored next to the markdown. Anything
+rendered on a page view goes through a bounded cache keyed by the hash of
+the markdown.
+
+The markdown engine is picked with `markdown_renderer` in riyaz.yml. The
+default is Python-Markdown; the others are faster CommonMark engines that
+have to be installed separately:
+
+    - python-markdown (default)
+    - markdown-it: `pip install markdown-it-py`
+    - mistune: `pip install mistune`
+    - cmarkgfm: `pip install cmarkgfm`
+
+Python-Markdown also supports the `{.python .feather}` attribute syntax in
+code fences, which the CommonMark engines read as a plain info string.
+
+With `highlight_code` enabled, code blocks are also highlighted as part of
+rendering, see riyaz.highlight. Courses imported before the setting was
+changed keep their HTML until they are imported again.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import time
+from typing import Callable, Dict, List
+
+from . import config
+from . import metrics
+from . import models
+from . import timings
+from .cache import LRUCache
+from .highlight import highlight_code_blocks
+
+
+# rendered HTML of recently viewed markdown, keyed by the render settings and
+# sha1 of the markdown
+render_cache = LRUCache(maxsize=256)
+
+# name -> function that returns a render function for that engine. The
+# engine is imported only when it is used.
+renderers: Dict[str, Callable[[], Callable[[str], str]]] = {}
+
+_render_functions: Dict[str, Callable[[str], str]] = {}
+
+
+def renderer(name: str):
+    """Decorator to register a markdown renderer.
+    """
+    def decorator(f):
+        renderers[name] = f
+        return f
+    return decorator
+
+
+@renderer("python-markdown")
+def python_markdown():
+    import markdown
+
+    def render(md: str) -> str:
+        return markdown.markdown(md, extensions=["fenced_code"])
+    return render
+
+
+@renderer("markdown-it")
+def markdown_it():
+    from markdown_it import MarkdownIt
+
+    md_it = MarkdownIt("commonmark")
+    return md_it.render
+
+
+@renderer("mistune")
+def mistune():
+    import mistune
+
+    return mistune.create_markdown(escape=False)
+
+
+@renderer("cmarkgfm")
+def cmarkgfm():
+    import cmarkgfm
+    from cmarkgfm.cmark import Options
+
+    def render(md: str) -> str:
+        return cmarkgfm.markdown_to_html(md, options=Options.CMARK_OPT_UNSAFE)
+    return render
+
+
+def get_renderer(name: str = None) -> Callable[[str], str]:
+    """Returns the render function of the renderer `name`, or of the
+    renderer in the config.
+    """
+    name = name or config.markdown_renderer
+    if name not in _render_functions:
+        if name not in renderers:
+            raise ValueError(
+                f"unknown markdown renderer '{name}', "
+                f"available renderers: {', '.join(renderers)}")
+        _render_functions[name] = renderers[name]()
+
+    return _render_functions[name]
+
+
+def render_markdown(md: str) -> str:
+    start = time.perf_counter()
+    with timings.stage("render", rows=1, bytes=len(md)):
+        html = get_renderer()(md)
+        if config.highlight_code:
+            html = highlight_code_blocks(html)
+
+    if config.metrics:
+        metrics.markdown_render_duration.observe(
+            time.perf_counter() - start, config.markdown_renderer)
+    return html
+
+
+def render_markdown_cached(md: str) -> str:
+    key = (config.markdown_renderer,
+           config.highlight_code and config.highlight_style,
+           hashlib.sha1(md.encode()).digest())
+    return render_cache.get_or_set(key, lambda: render_markdown(md))
+
+
+# opening or closing line of a fenced code block, with the info string
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})\s*([^`]*?)\s*$")
+
+
+def get_code_languages(md: str) -> List[str]:
+    """Returns the languages of the fenced code blocks in the markdown, in
+    the order they first appear.
+
+    The language is the first word of the info string, or the first class
+    in the attribute syntax: both "python" and "{.python .feather}" are
+    python.
+    """
+    languages: List[str] = []
+    fence = None
+    for line in md.splitlines():
+        match = FENCE_RE.match(line)
+        if match is None:
+            continue
+
+        marker, info = match.groups()
+        if fence is None:
+            fence = marker
+            language = _get_info_language(info)
+            if language and language not in languages:
+                languages.append(language)
+        elif marker[0] == fence[0] and len(marker) >= len(fence) and not info:
+            fence = None
+
+    return languages
+
+
+def _get_info_language(info: str) -> str:
+    if info.startswith("{"):
+        classes = [word for word in info.strip("{}").split()
+                   if word.startswith(".")]
+        return classes[0][1:].lower() if classes else ""
+
+    return info.split()[0].lower() if info else ""
+
+
+def render_course(course: models.Course) -> models.Course:
+    """Renders HTML of all lessons of a parsed course that don't have it.
+    """
+    for chapter in course.outline:
+        for lesson in chapter.lessons:
+            if lesson.content_html is None:
+                lesson.content_html = render_markdown(lesson.content)
+
+    return course
@@ -1,5 +1,5 @@
 from pathlib import Path
-from .disk import CourseLoader
+from .disk import load_courses
 
 query_fields = {
     "module": ("course", "name"),
@@ -9,10 +9,14 @@ query_fields = {
 def load_sample_data(path: str):
     """Loads sample data from given path.
     """
-    paths = Path(path).glob("*/")
-    for p in paths:
-        print(f"loading {p} ...")
-        CourseLoader(p).load()
+    paths = [p for p in Path(path).glob("*/") if p.is_dir()]
+
+    def on_loaded(result):
+        print(f"loaded {result.path} in "
+              f"{result.parse_time + result.load_time:.2f}s"
+              + (f" (failed: {result.error})" if result.error else ""))
+
+    load_courses(paths, on_loaded=on_loaded)
 
 # def load_course(doc):
 #     keys = ['key', 'title', 'short_description', 'description']
@@ -0,0 +1,316 @@
+"""Sandboxed execution of code snippets.
+
+A SandboxPool keeps a number of worker processes running, started when the
+pool is created, so that running a snippet doesn't pay for starting Python.
+Every snippet runs in a fresh process forked from a worker, in its own
+temporary directory and session, with limits on CPU time, memory, open
+files, the size of written files, wall clock time and output.
+
+The limits protect the server from runaway snippets, like an infinite loop
+or a huge allocation. They don't stop a snippet from reading files or
+opening network connections, so it is not a security boundary for code
+from untrusted users.
+
+When all workers are busy, requests wait for a free worker in a bounded
+queue. When the queue is full, SandboxPool.run raises QueueFull right away
+instead of piling up requests.
+
+    pool = SandboxPool(workers=4, queue_size=16)
+    result = pool.run("print('hello')")
+    result.output  # "hello\\n"
+
+Only Python snippets are supported, and only on POSIX systems.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import queue
+import select
+import signal
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Deque, Dict, List, Optional, Sequence
+
+from .metrics import percentile
+
+
+def is_supported() -> bool:
+    """Tells whether snippets can run on this system, which needs fork and
+    the resource module of POSIX systems.
+    """
+    return os.name == "posix"
+
+
+class QueueFull(Exception):
+    """Raised when there are more requests waiting than the pool queues.
+    """
+
+
+@dataclass
+class Limits:
+    # CPU seconds and address space of a snippet
+    cpu_seconds: int = 2
+    memory_mb: int = 256
+    # wall clock seconds before the snippet is killed
+    timeout: float = 5.0
+    # output beyond this is dropped, and the snippet is killed
+    output_bytes: int = 64 * 1024
+    file_size_mb: int = 10
+    open_files: int = 64
+
+
+@dataclass
+class Result:
+    output: str
+    exit_code: Optional[int]
+    timed_out: bool = False
+    # seconds spent waiting for a worker, and running the snippet
+    wait_time: float = 0.0
+    run_time: float = 0.0
+
+
+@dataclass
+class Metrics:
+    runs: int = 0
+    timeouts: int = 0
+    rejected: int = 0
+    worker_restarts: int = 0
+    # latency of the last runs, in seconds, from the request to the result
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        del d["latencies"]
+        for p in (50, 95, 99):
+            d[f"latency_p{p}"] = percentile(self.latencies, p)
+        return d
+
+
+class SandboxPool:
+    def __init__(self, workers: Optional[int] = None, queue_size: int = 64,
+                 limits: Optional[Limits] = None):
+        self.limits = limits or Limits()
+        self.queue_size = queue_size
+        self.metrics = Metrics()
+
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: queue.Queue = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+        for _ in range(workers or os.cpu_count() or 1):
+            worker = self._start_worker()
+            self._workers.append(worker)
+            self._idle.put(worker)
+
+    def run(self, code: str, args: Sequence[str] = (),
+            env: Optional[Dict[str, str]] = None,
+            files: Optional[Dict[str, str]] = None) -> Result:
+        """Runs the Python snippet `code` with command line `args`.
+
+        With `files`, the files are written to the directory of the snippet
+        before it runs.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            if self._idle.empty() and self._waiting >= self.queue_size:
+                self.metrics.rejected += 1
+                raise QueueFull(f"{self._waiting} requests are waiting")
+            self._waiting += 1
+
+        try:
+            worker = self._idle.get()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        wait_time = time.perf_counter() - start
+        try:
+            result = worker.run(dict(
+                code=code, args=list(args), env=env or {}, files=files or {}))
+        except (EOFError, OSError):
+            # the worker died, a snippet can't kill it, but the OOM killer can
+            worker.close()
+            worker = self._replace_worker(worker)
+            result = Result(output="worker crashed", exit_code=None)
+        finally:
+            self._idle.put(worker)
+
+        result.wait_time = wait_time
+        with self._lock:
+            self.metrics.runs += 1
+            self.metrics.timeouts += result.timed_out
+            self.metrics.latencies.append(time.perf_counter() - start)
+        return result
+
+    def close(self):
+        for worker in self._workers:
+            worker.close()
+        self._workers.clear()
+
+    def _start_worker(self) -> _Worker:
+        return _Worker(self._context, self.limits)
+
+    def _replace_worker(self, worker: _Worker) -> _Worker:
+        new_worker = self._start_worker()
+        with self._lock:
+            self._workers[self._workers.index(worker)] = new_worker
+            self.metrics.worker_restarts += 1
+        return new_worker
+
+
+class _Worker:
+    def __init__(self, context, limits: Limits):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, limits), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def run(self, request: dict) -> Result:
+        self.conn.send(request)
+        return Result(**self.conn.recv())
+
+    def close(self):
+        self.conn.close()
+        self.process.kill()
+        self.process.join()
+
+
+def _worker_main(conn, limits: Limits):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        conn.send(_run_snippet(request, limits))
+
+
+def _run_snippet(request: dict, limits: Limits) -> dict:
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="riyaz_sandbox_") as workdir:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            _exec_snippet(request, limits, workdir, write_fd)
+        os.close(write_fd)
+
+        output, timed_out = _read_output(read_fd, limits, start)
+        if timed_out or len(output) > limits.output_bytes:
+            _kill(pid)
+        os.close(read_fd)
+
+        _, status = os.waitpid(pid, 0)
+
+    if len(output) > limits.output_bytes:
+        output = output[:limits.output_bytes] + b"\n[output truncated]\n"
+    if timed_out:
+        output += f"\n[killed after {limits.timeout:g} seconds]\n".encode()
+    elif os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGXCPU:
+        output += f"\n[killed after {limits.cpu_seconds} CPU seconds]\n".encode()
+
+    return dict(
+        output=output.decode(errors="replace"),
+        exit_code=_get_exit_code(status),
+        timed_out=timed_out,
+        run_time=time.perf_counter() - start,
+    )
+
+
+def _read_output(fd: int, limits: Limits, start: float):
+    output = b""
+    while len(output) <= limits.output_bytes:
+        remaining = limits.timeout - (time.perf_counter() - start)
+        if remaining <= 0:
+            return output, True
+
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if not ready:
+            return output, True
+
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            break
+        output += chunk
+
+    return output, False
+
+
+def _get_exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _kill(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _exec_snippet(request: dict, limits: Limits, workdir: str, output_fd: int):
+    """Runs the snippet in the forked child. Never returns.
+    """
+    exit_code = 0
+    try:
+        os.setsid()
+        os.chdir(workdir)
+        for name, content in request["files"].items():
+            with open(os.path.basename(name), "w") as f:
+                f.write(content)
+
+        _set_limit("RLIMIT_CPU", limits.cpu_seconds)
+        _set_limit("RLIMIT_AS", limits.memory_mb * 1024 * 1024)
+        _set_limit("RLIMIT_FSIZE", limits.file_size_mb * 1024 * 1024)
+        _set_limit("RLIMIT_NOFILE", limits.open_files)
+
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(output_fd, 1)
+        os.dup2(output_fd, 2)
+
+        sys.stdin = open(0, closefd=False)
+        sys.stdout = open(1, "w", buffering=1, closefd=False)
+        sys.stderr = open(2, "w", buffering=1, closefd=False)
+        sys.argv = ["main.py", *request["args"]]
+        os.environ.update(request["env"])
+
+        code = compile(request["code"], "main.py", "exec")
+        exec(code, {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            exit_code = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        # leave out the frame of this function
+        etype, value, tb = sys.exc_info()
+        traceback.print_exception(etype, value, tb.tb_next)
+        exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+
+def _set_limit(name: str, value: int):
+    import resource
+
+    limit = getattr(resource, name)
+    _, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(limit, (value, hard))
@@ -4,7 +4,8 @@ create table course (
     key text unique,
     title text not null,
     short_description text,
-    description text
+    description text,
+    description_html text
 );
 
 create table instructor (
@@ -12,7 +13,8 @@ create table instructor (
     key text unique,
     name text not null,
     about text,
-    photo_id integer references asset
+    photo_id integer references asset,
+    about_html text
 );
 
 create table course_instructor (
@@ -41,6 +43,9 @@ create table lesson (
     name text,
     title text,
     content text,
+    content_html text,
+    -- comma separated languages of the fenced code blocks
+    languages text,
 
     unique (course_id, module_id, name)
 );
@@ -64,6 +69,15 @@ create table course_outline (
     orphan boolean default('f')
 );
 
+create table course_release (
+    id integer primary key,
+    course_key text not null,
+    course_id integer references course,
+    version text,
+    created datetime,
+    published datetime
+);
+
 create table store (
     id integer primary key,
     key text unique,
@@ -82,6 +96,8 @@ create table asset (
     last_modified datetime
 );
 
+pragma user_version = 4;
+
 -- create view course_outline_view as
 -- select
 --     course_outline.*,
@@ -344,7 +344,7 @@ function setupExample(element) {
     },
 
     getHeaders() {
-      var headers = {...this.options.headers};
+      var headers = {...(window.feather_config || {}).headers, ...this.options.headers};
 
       if (Object.keys(this.options.env).length) {
         headers['X-FEATHER-ENV'] = editor.getEnvHeader();
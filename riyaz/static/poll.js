@@ -1,3 +1,7 @@
+// set on the script tag when the server has event streams, see riyaz.asgi
+const useEventStream = Boolean(
+    document.currentScript && "eventStream" in document.currentScript.dataset)
+
 function getCourseName() {
     let path = window.location.pathname;
     if (!path.startsWith("/courses/")) {
@@ -39,8 +43,39 @@ async function getCourseVersion(courseName) {
     return data.version || null;
 }
 
+// reloads the page when the server sends a new version of the course, and
+// falls back to polling when the server doesn't have event streams
+function watchCourse(courseName) {
+    if (!useEventStream || !window.EventSource) {
+        return startPolling(courseName, 1.0)
+    }
+
+    let originalVersion = undefined
+    const events = new EventSource(`/api/courses/${courseName}/events`)
+
+    events.addEventListener("version", event => {
+        const version = JSON.parse(event.data).version || null
+        if (originalVersion === undefined) {
+            originalVersion = version
+        }
+        else if (version != originalVersion) {
+            console.log("course updated. reloading")
+            events.close()
+            window.location.reload()
+        }
+    })
+    events.onerror = () => {
+        if (originalVersion === undefined) {
+            events.close()
+            startPolling(courseName, 1.0)
+        }
+    }
+}
+
 window.onload = function() {
     let courseName = getCourseName()
-    startPolling(courseName, 1.0)
+    if (courseName) {
+        watchCourse(courseName)
+    }
 }
 
@@ -0,0 +1,141 @@
+"""Synthetic courses for benchmarks and tests.
+
+Writes a course directory like the ones made with `riyaz new`, with any
+number of modules, lessons and authors, and lessons of any size. The
+content is generated from a seed, so the same arguments always write the
+same course.
+
+    course_dir = generate_course(Path("/tmp/courses"), modules=20,
+                                 lessons=15, lesson_size_kb=8)
+    course_dir  # Path("/tmp/courses/synthetic")
+
+It can also be run as a script:
+
+    $ python -m riyaz.synthetic /tmp/courses --modules 20 --lessons 15
+"""
+from __future__ import annotations
+
+import argparse
+import random
+from pathlib import Path
+
+import yaml
+
+
+WORDS = (
+    "riyaz course lesson module python function value list loop string "
+    "module file data code example test program variable class method "
+    "return import error output input number text line read write"
+).split()
+
+CODE_BLOCKS = {
+    "python": (
+        "def fib(n):\n"
+        "    return n if n < 2 else fib(n - 1) + fib(n - 2)\n"
+    ),
+    "javascript": (
+        "function fib(n) {\n"
+        "  return n < 2 ? n : fib(n - 1) + fib(n - 2);\n"
+        "}\n"
+    ),
+    "bash": "for f in *.md; do\n  wc -l \"$f\"\ndone\n",
+}
+
+
+def make_paragraph(rng: random.Random, words: int = 60) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return f"{text.capitalize()}, with `inline code` and **emphasis**.\n\n"
+
+
+def make_lesson(rng: random.Random, title: str, size_kb: float) -> str:
+    """Returns the markdown of a lesson of about `size_kb` KB, made of
+    sections of paragraphs and fenced code blocks.
+    """
+    parts = [f"# {title}\n\n"]
+    size = len(parts[0])
+    section = 1
+    while size < size_kb * 1024:
+        language = rng.choice(sorted(CODE_BLOCKS))
+        part = (f"## Section {section}\n\n"
+                + "".join(make_paragraph(rng) for _ in range(3))
+                + f"```{language}\n{CODE_BLOCKS[language]}```\n\n")
+        parts.append(part)
+        size += len(part)
+        section += 1
+    return "".join(parts)
+
+
+def generate_course(
+    base_dir: Path,
+    name: str = "synthetic",
+    modules: int = 10,
+    lessons: int = 10,
+    authors: int = 2,
+    lesson_size_kb: float = 4,
+    seed: int = 0,
+) -> Path:
+    """Writes a course with `modules` modules of `lessons` lessons each to
+    base_dir/name, and returns the path of the course directory.
+    """
+    rng = random.Random(seed)
+    course_dir = Path(base_dir) / name
+    (course_dir / "authors").mkdir(parents=True)
+
+    author_keys = [f"author-{i}" for i in range(1, authors + 1)]
+    for i, key in enumerate(author_keys, start=1):
+        (course_dir / "authors" / f"{key}.md").write_text(
+            f"---\nname: Author {i}\n---\n\n{make_paragraph(rng)}")
+
+    outline = []
+    for m in range(1, modules + 1):
+        module_name = f"module-{m}"
+        (course_dir / module_name).mkdir()
+
+        lesson_paths = []
+        for n in range(1, lessons + 1):
+            path = f"{module_name}/lesson-{n}.md"
+            (course_dir / path).write_text(
+                make_lesson(rng, f"Lesson {m}.{n}", lesson_size_kb))
+            lesson_paths.append(path)
+
+        outline.append({
+            "name": module_name,
+            "title": f"Module {m}",
+            "lessons": lesson_paths,
+        })
+
+    (course_dir / "course.yml").write_text(yaml.safe_dump({
+        "name": name,
+        "title": f"Synthetic course {name}",
+        "short_description": "A generated course",
+        "description": make_paragraph(rng),
+        "authors": author_keys,
+        "outline": outline,
+    }, sort_keys=False))
+
+    return course_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic course for benchmarks.")
+    parser.add_argument("base_dir", type=Path)
+    parser.add_argument("--name", default="synthetic")
+    parser.add_argument("--modules", type=int, default=10)
+    parser.add_argument("--lessons", type=int, default=10,
+                        help="number of lessons in each module")
+    parser.add_argument("--authors", type=int, default=2)
+    parser.add_argument("--lesson-size", type=float, default=4,
+                        help="size of each lesson in KB")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = generate_course(
+        args.base_dir, name=args.name, modules=args.modules,
+        lessons=args.lessons, authors=args.authors,
+        lesson_size_kb=args.lesson_size, seed=args.seed)
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
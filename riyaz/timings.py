@@ -0,0 +1,95 @@
+"""Timings of the stages of a course import.
+
+The code of an import marks its stages, like reading lesson files or
+inserting lessons, with `stage`:
+
+    with timings.stage("lesson_read", rows=1) as s:
+        content = f.read()
+        s.bytes += len(content)
+
+Stages are only timed inside `record`, which collects them in a Timings:
+
+    with timings.record() as t:
+        CourseLoader(path).load()
+    t.to_dict()  # {"lesson_read": {"seconds": ..., "rows": ..., ...}, ...}
+
+Stages can be nested, and the time of a stage doesn't include the time of
+the stages inside it, so the times of all stages add up to the time spent
+in them.
+"""
+from __future__ import annotations
+
+import contextlib
+import time
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+
+@dataclass
+class Stage:
+    seconds: float = 0.0
+    # number of times the stage ran
+    count: int = 0
+    rows: int = 0
+    bytes: int = 0
+
+
+@dataclass
+class Timings:
+    stages: Dict[str, Stage] = field(default_factory=dict)
+
+    # [start, time in nested stages] of the running stages
+    _stack: List[List[float]] = field(default_factory=list, repr=False)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows: int = 0, bytes: int = 0) -> Iterator[Stage]:
+        s = self.stages.get(name)
+        if s is None:
+            s = self.stages[name] = Stage()
+        s.count += 1
+        s.rows += rows
+        s.bytes += bytes
+
+        frame = [time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield s
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            s.seconds += elapsed - frame[1]
+            if self._stack:
+                self._stack[-1][1] += elapsed
+
+    def get_total(self) -> float:
+        return sum(s.seconds for s in self.stages.values())
+
+    def to_dict(self) -> Dict[str, dict]:
+        return {name: asdict(s) for name, s in self.stages.items()}
+
+
+_current: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+
+@contextlib.contextmanager
+def record(timings: Optional[Timings] = None) -> Iterator[Timings]:
+    """Collects the stages that run in the block in `timings`, or in a new
+    Timings.
+    """
+    timings = timings or Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def stage(name: str, rows: int = 0, bytes: int = 0):
+    """Times the block as stage `name` of the timings being recorded, if
+    any. `rows` and `bytes` are added to the totals of the stage.
+    """
+    timings = _current.get()
+    if timings is None:
+        return contextlib.nullcontext(Stage())
+    return timings.stage(name, rows=rows, bytes=bytes)
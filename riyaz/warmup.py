@@ -0,0 +1,84 @@
+"""Warmup of a new worker of the Riyaz app.
+
+The first requests to a new worker are slow: templates are compiled on
+first use, database connections are opened, and the page and fragment
+caches are empty. warmup() does all of that up front, by compiling every
+template and rendering the index and the page of every published course.
+With `course_graph` set in riyaz.yml, it also reads the course graph of
+the worker, see riyaz.graph.
+
+With `template_cache_dir` set in riyaz.yml, compiled templates are kept on
+disk, and `riyaz warmup` fills that directory before a deploy, so that new
+workers load the templates instead of compiling them.
+
+To warm up every gunicorn worker before it takes requests, use this module
+as the gunicorn config:
+
+    $ gunicorn -c python:riyaz.warmup riyaz.app:app
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class WarmupSummary:
+    templates: int = 0
+    pages: int = 0
+    # lessons read into the course graph
+    lessons: int = 0
+    template_time: float = 0.0
+    page_time: float = 0.0
+    graph_time: float = 0.0
+
+
+def warmup(pages: bool = True) -> WarmupSummary:
+    """Compiles all templates, and with `pages`, renders the index and the
+    page of every published course.
+    """
+    from . import config
+    from .app import app, configure_fragment_cache, configure_template_cache
+    from .db import Course
+    from .graph import course_graph
+
+    summary = WarmupSummary()
+
+    start = time.perf_counter()
+    configure_template_cache()
+    configure_fragment_cache()
+    for name in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(name)
+        summary.templates += 1
+    summary.template_time = time.perf_counter() - start
+
+    if config.course_graph:
+        start = time.perf_counter()
+        summary.lessons = course_graph.load_all()
+        summary.graph_time = time.perf_counter() - start
+
+    if pages:
+        start = time.perf_counter()
+        client = app.test_client()
+        urls = ["/", *(f"/courses/{course.key}"
+                       for course in Course.find_published())]
+        for url in urls:
+            client.get(url)
+            summary.pages += 1
+        summary.page_time = time.perf_counter() - start
+
+    return summary
+
+
+def post_worker_init(worker):
+    """gunicorn hook, called in each worker before it takes requests.
+    """
+    summary = warmup()
+    worker.log.info(
+        "Warmed up %d templates in %.3fs and %d pages in %.3fs",
+        summary.templates, summary.template_time,
+        summary.pages, summary.page_time)
+    if summary.lessons:
+        worker.log.info(
+            "Read %d lessons into the course graph in %.3fs",
+            summary.lessons, summary.graph_time)
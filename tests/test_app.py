@@ -0,0 +1,552 @@
+import gzip
+import pstats
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from riyaz import app as app_module
+from riyaz import config
+from riyaz import highlight
+from riyaz import sandbox
+from riyaz.assets import build_asset_bundle
+from riyaz.db import Store
+from riyaz.plugins import feather
+from riyaz.disk import CourseLoader
+from riyaz.migrate import migrate
+from riyaz.profiling import StackSampler
+from riyaz.warmup import warmup
+
+
+@pytest.fixture
+def loader(get_db, course_dir):
+    migrate()
+    loader = CourseLoader(course_dir)
+    loader.load()
+    return loader
+
+
+@pytest.fixture
+def client(loader):
+    return app_module.app.test_client()
+
+
+class TestResponseCache:
+    lesson_url = "/courses/hello-world/getting-started/course-yml"
+
+    @pytest.fixture(autouse=True)
+    def response_cache(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(config, "response_cache", True)
+        monkeypatch.setattr(config, "response_cache_dir", str(tmp_path))
+        monkeypatch.setattr(app_module, "_response_cache", None)
+
+    def test_pages_are_cached(self, client):
+        first = client.get(self.lesson_url)
+        second = client.get(self.lesson_url)
+
+        assert first.status_code == second.status_code == 200
+        assert first.data == second.data
+        assert first.headers["ETag"] and first.headers["Last-Modified"]
+        assert app_module.get_response_cache().memory.hits == 1
+
+    def test_not_modified(self, client):
+        etag = client.get(self.lesson_url).headers["ETag"]
+
+        response = client.get(self.lesson_url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+
+    def test_new_version_evicts_pages(self, client, loader, tmp_path):
+        client.get(self.lesson_url)
+        client.get("/courses/hello-world")
+        cache = app_module.get_response_cache()
+        assert len(cache.memory) == 2
+
+        loader.load()
+        client.get(self.lesson_url)
+
+        assert len(cache.memory) == 1
+        assert len(list((tmp_path / "hello-world").iterdir())) == 1
+
+    def test_missing_pages_are_not_cached(self, client):
+        response = client.get("/courses/hello-world/getting-started/nope")
+        assert response.status_code == 404
+        assert len(app_module.get_response_cache().memory) == 0
+
+
+class TestSharedCache:
+    lesson_url = "/courses/hello-world/getting-started/course-yml"
+
+    @pytest.fixture(autouse=True)
+    def shared_cache(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(config, "response_cache", True)
+        monkeypatch.setattr(config, "shared_cache_path", str(tmp_path / "cache.db"))
+        app_module.configure_shared_cache()
+        app_module.app.jinja_env.fragment_cache.clear()
+        yield app_module._shared_cache
+        monkeypatch.undo()
+        app_module.configure_shared_cache()
+
+    def test_pages_are_shared(self, client, shared_cache):
+        first = client.get(self.lesson_url)
+        # pages are not kept in the memory of the worker
+        assert len(app_module.get_response_cache().memory) == 0
+
+        # like another worker
+        app_module.configure_shared_cache()
+        second = client.get(self.lesson_url)
+
+        assert first.data == second.data
+        assert first.headers["ETag"] == second.headers["ETag"]
+        assert app_module._shared_cache.hits == 1
+
+    def test_fragments_are_shared(self, client, shared_cache):
+        client.get("/courses/hello-world")
+        assert shared_cache.get("fragment", repr((
+            "course-outline", "hello-world",
+            Store.get("hello-world")))) is not None
+
+    def test_new_version_evicts_pages(self, client, loader, shared_cache):
+        client.get(self.lesson_url)
+        loader.load()
+        client.get("/courses/hello-world")
+
+        pages = shared_cache._connect().execute(
+            "select version from cache where namespace = 'page'").fetchall()
+        assert pages == [(Store.get("hello-world"),)]
+
+
+class TestFragmentCache:
+    @pytest.fixture(autouse=True)
+    def clear_fragment_cache(self):
+        app_module.app.jinja_env.fragment_cache.clear()
+
+    def render(self, source, **context):
+        with app_module.app.app_context():
+            template = app_module.app.jinja_env.from_string(source)
+            return template.render(**context)
+
+    def test_fragments_are_cached_by_key(self):
+        source = "{% cache 'fragment', key %}{{ value }}{% endcache %}"
+
+        assert self.render(source, key=1, value="one") == "one"
+        assert self.render(source, key=1, value="changed") == "one"
+        assert self.render(source, key=2, value="two") == "two"
+
+    def test_course_page_fragments(self, client, loader):
+        client.get("/courses/hello-world")
+        cache = app_module.app.jinja_env.fragment_cache
+        assert len(cache) == 3
+
+        loader.load()
+        response = client.get("/courses/hello-world")
+
+        assert response.status_code == 200
+        assert b"Course outline" in response.data
+        assert len(cache) == 6
+
+    def test_lesson_page_fragments(self, client, loader):
+        client.get("/courses/hello-world/getting-started/course-yml")
+        # the breadcrumbs are not cached, since they need no queries
+        keys = app_module.app.jinja_env.fragment_cache.keys()
+        assert not [key for key in keys if "lesson-breadcrumbs" in key]
+
+    def test_configure_fragment_cache(self, monkeypatch):
+        monkeypatch.setattr(config, "fragment_cache_size", 2)
+        app_module.configure_fragment_cache()
+        source = "{% cache 'fragment', key %}{{ key }}{% endcache %}"
+        try:
+            for key in range(3):
+                self.render(source, key=key)
+            assert len(app_module.app.jinja_env.fragment_cache) == 2
+        finally:
+            monkeypatch.undo()
+            app_module.configure_fragment_cache()
+
+
+class TestHighlightStylesheet:
+    @pytest.fixture(autouse=True)
+    def highlight_code(self, monkeypatch):
+        pytest.importorskip("pygments")
+        monkeypatch.setattr(config, "highlight_code", True)
+
+    def test_stylesheet(self, client):
+        url = "/static/" + highlight.get_stylesheet_filename()
+
+        assert url.encode() in client.get("/courses/hello-world").data
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.mimetype == "text/css"
+        assert "immutable" in response.headers["Cache-Control"]
+
+    def test_stale_fingerprint(self, client):
+        assert client.get("/static/highlight.0123456789ab.css").status_code == 404
+
+
+class TestPluginAssets:
+    lesson_url = "/courses/hello-world/getting-started/riyaz-terminology"
+
+    @pytest.fixture
+    def bundle(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(config, "bundles_path", str(tmp_path))
+        bundle = build_asset_bundle(
+            "lesson",
+            app_module.lesson_stylesheet_urls, app_module.lesson_javascript_urls,
+            static_dir=Path(app_module.app.static_folder), out_dir=tmp_path)
+        monkeypatch.setitem(app_module.asset_bundles, "lesson", bundle)
+        return bundle
+
+    def test_plugins_are_initialized_once(self):
+        urls = list(app_module.lesson_javascript_urls)
+        app_module.init_plugins()
+
+        assert app_module.lesson_javascript_urls == urls
+        assert "/static/feather/feather.js" in urls
+
+    def test_course_page_has_no_editor(self, client):
+        html = client.get("/courses/hello-world").get_data(as_text=True)
+        assert "/static/feather/" not in html
+
+    def test_lesson_loads_modes_of_its_languages(self, client):
+        html = client.get(self.lesson_url).get_data(as_text=True)
+
+        assert '<script defer src="/static/feather/feather.js">' in html
+        assert "/mode/python/python.js" in html
+        assert "/mode/yaml/yaml.js" not in html
+
+    def test_lesson_without_code(self, client, loader, course_dir):
+        lesson_path = course_dir / "getting-started" / "riyaz-terminology.md"
+        lesson_path.write_text("# Riyaz Terminology\n\nNo code here.\n")
+        loader.load()
+
+        html = client.get(self.lesson_url).get_data(as_text=True)
+        assert "/static/feather/" not in html
+
+    def test_pages_use_bundle(self, client, bundle):
+        html = client.get(self.lesson_url).get_data(as_text=True)
+
+        assert "/static/feather/feather.js" not in html
+        assert f'<script defer src="/static/bundles/{bundle.javascript}">' in html
+        assert f'href="/static/bundles/{bundle.stylesheet}"' in html
+        assert "/mode/python/python.js" in html
+
+        response = client.get(f"/static/bundles/{bundle.javascript}")
+        assert response.status_code == 200
+        assert "immutable" in response.headers["Cache-Control"]
+
+
+class TestLocalExecution:
+    lesson_url = "/courses/hello-world/getting-started/riyaz-terminology"
+
+    @pytest.fixture(autouse=True)
+    def local_execution(self, monkeypatch):
+        monkeypatch.setattr(
+            config, "feather", {"local_execution": True, "workers": 1})
+        monkeypatch.setattr(feather, "_pool", None)
+        self.local_headers = {"X-FEATHER-LOCAL": feather.get_token()}
+        yield
+        if feather._pool is not None:
+            feather._pool.close()
+
+    def test_run_code(self, client):
+        response = client.post(
+            "/feather/runtimes/python", data="import sys; print(sys.argv[1:])",
+            headers={**self.local_headers, "X-FEATHER-ARGS": "a 'b c'",
+                     "Origin": "http://localhost"})
+
+        assert response.status_code == 200
+        assert response.get_data(as_text=True) == "['a', 'b c']\n"
+        assert client.get("/feather/metrics").json["runs"] == 1
+
+    def test_unknown_runtime(self, client):
+        response = client.post(
+            "/feather/runtimes/rust", data="", headers=self.local_headers)
+        assert response.status_code == 404
+
+    def test_cross_origin(self, client):
+        # a form or fetch with a text/plain body from another site, which
+        # the browser sends without a preflight
+        response = client.post(
+            "/feather/runtimes/python", data="print('pwned')",
+            content_type="text/plain",
+            headers={"Origin": "https://evil.example.com",
+                     "Sec-Fetch-Site": "cross-site"})
+        assert response.status_code == 403
+
+        response = client.post(
+            "/feather/runtimes/python", data="print('pwned')",
+            headers={**self.local_headers,
+                     "Origin": "https://evil.example.com"})
+        assert response.status_code == 403
+
+        response = client.post(
+            "/feather/runtimes/python", data="print('pwned')",
+            headers={"X-FEATHER-LOCAL": "1", "Origin": "http://localhost"})
+        assert response.status_code == 403
+        assert feather._pool is None
+
+    def test_dns_rebinding(self, client):
+        # a site that points its own name to this machine makes requests
+        # whose Origin matches their Host
+        response = client.post(
+            "/feather/runtimes/python", data="print('pwned')",
+            base_url="http://evil.example:5000",
+            headers={**self.local_headers,
+                     "Origin": "http://evil.example:5000",
+                     "Sec-Fetch-Site": "same-origin"})
+        assert response.status_code == 403
+
+        response = client.get(
+            "/feather/config.js", base_url="http://evil.example:5000")
+        assert response.status_code == 403
+        assert feather._pool is None
+
+    def test_allowed_hosts(self, client, monkeypatch):
+        monkeypatch.setitem(config.feather, "allowed_hosts", ["riyaz.internal"])
+        response = client.post(
+            "/feather/runtimes/python", data="print('ok')",
+            base_url="http://riyaz.internal:5000",
+            headers={**self.local_headers,
+                     "Origin": "http://riyaz.internal:5000"})
+        assert response.status_code == 200
+
+    def test_disabled(self, client, monkeypatch):
+        monkeypatch.setattr(config, "feather", {})
+
+        assert client.post("/feather/runtimes/python", data="").status_code == 404
+        html = client.get(self.lesson_url).get_data(as_text=True)
+        assert "/feather/config.js" not in html
+
+    def test_unsupported_system(self, client, monkeypatch):
+        monkeypatch.setattr(sandbox, "is_supported", lambda: False)
+        assert client.post(
+            "/feather/runtimes/python", data="",
+            headers=self.local_headers).status_code == 404
+
+    def test_lesson_uses_local_server(self, client):
+        html = client.get(self.lesson_url).get_data(as_text=True)
+        assert '<script defer src="/feather/config.js">' in html
+        config_js = client.get("/feather/config.js").get_data(as_text=True)
+        assert '"server_url": "/feather"' in config_js
+        assert f'"X-FEATHER-LOCAL": "{feather.get_token()}"' in config_js
+
+
+def test_import_without_posix_modules():
+    # like on Windows, which has neither fcntl nor resource
+    code = ("import sys; sys.modules.update(fcntl=None, resource=None); "
+            "import riyaz.app")
+    process = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True)
+    assert process.returncode == 0, process.stderr
+
+
+def test_no_course_events(client):
+    # an open stream would hold a worker thread, see riyaz.asgi
+    assert client.get("/api/courses/hello-world/events").status_code == 404
+
+
+def test_event_stream(client, monkeypatch):
+    url = "/courses/hello-world/getting-started/course-yml"
+    assert "data-event-stream" not in client.get(url).get_data(as_text=True)
+
+    monkeypatch.setattr(config, "event_stream", True)
+    assert "data-event-stream" in client.get(url).get_data(as_text=True)
+
+
+class TestCompression:
+    lesson_url = "/courses/hello-world/getting-started/course-yml"
+    gzip_headers = {"Accept-Encoding": "gzip"}
+
+    @pytest.fixture(autouse=True)
+    def compression(self, monkeypatch):
+        monkeypatch.setattr(config, "compression", True)
+        monkeypatch.setattr(config, "compression_min_size", 1024)
+
+    def test_compressed_response(self, client):
+        plain = client.get("/")
+        response = client.get("/", headers=self.gzip_headers)
+
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert gzip.decompress(response.data) == plain.data
+        assert "Content-Encoding" not in plain.headers
+
+    def test_small_response(self, client):
+        response = client.get(
+            "/api/courses/hello-world/version", headers=self.gzip_headers)
+        assert "Content-Encoding" not in response.headers
+
+    def test_disabled(self, client, monkeypatch):
+        monkeypatch.setattr(config, "compression", False)
+        response = client.get("/", headers=self.gzip_headers)
+        assert "Content-Encoding" not in response.headers
+
+    def test_cached_page_is_compressed_once(self, client, monkeypatch, tmp_path):
+        monkeypatch.setattr(config, "response_cache", True)
+        monkeypatch.setattr(config, "response_cache_dir", str(tmp_path))
+        monkeypatch.setattr(app_module, "_response_cache", None)
+
+        calls = []
+        compress = app_module.compress
+
+        def counting_compress(*args):
+            calls.append(args)
+            return compress(*args)
+        monkeypatch.setattr(app_module, "compress", counting_compress)
+
+        plain = client.get(self.lesson_url)
+        first = client.get(self.lesson_url, headers=self.gzip_headers)
+        second = client.get(self.lesson_url, headers=self.gzip_headers)
+
+        assert len(calls) == 1
+        assert first.data == second.data
+        assert gzip.decompress(first.data) == plain.data
+        assert first.headers["ETag"] != plain.headers["ETag"]
+
+        # the compressed body is saved with the page
+        app_module.get_response_cache().memory.clear()
+        third = client.get(self.lesson_url, headers=self.gzip_headers)
+        assert third.data == first.data
+        assert len(calls) == 1
+
+        response = client.get(self.lesson_url, headers={
+            **self.gzip_headers, "If-None-Match": first.headers["ETag"]})
+        assert response.status_code == 304
+
+
+class TestWarmup:
+    @pytest.fixture(autouse=True)
+    def template_cache(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(config, "template_cache_dir", str(tmp_path / "templates"))
+        app_module.app.jinja_env.cache.clear()
+        yield
+        monkeypatch.undo()
+        app_module.configure_template_cache()
+
+    def test_warmup(self, loader, tmp_path):
+        summary = warmup()
+
+        assert summary.templates == len(
+            app_module.app.jinja_env.list_templates(extensions=["html"]))
+        # the index and the page of hello-world
+        assert summary.pages == 2
+        assert list((tmp_path / "templates").iterdir())
+
+    def test_templates_only(self, loader):
+        summary = warmup(pages=False)
+        assert summary.templates > 0
+        assert summary.pages == 0
+
+
+class TestProfiling:
+    lesson_url = "/courses/hello-world/getting-started/course-yml"
+
+    @pytest.fixture(autouse=True)
+    def profile_dir(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(config, "profile_dir", str(tmp_path))
+        return tmp_path
+
+    def test_profile(self, client, monkeypatch, profile_dir):
+        monkeypatch.setattr(config, "profile", True)
+        assert client.get(self.lesson_url).status_code == 200
+
+        [path] = (profile_dir / "view_lesson").glob("*.prof")
+        stats = pstats.Stats(str(path))
+        assert any(name == "view_lesson" for _, _, name in stats.stats)
+
+    def test_not_profiled(self, client, profile_dir):
+        assert client.get(self.lesson_url).status_code == 200
+        assert list(profile_dir.iterdir()) == []
+
+    def test_token(self, client, monkeypatch, profile_dir):
+        monkeypatch.setattr(config, "profile_token", "secret")
+
+        client.get("/", headers={"X-Riyaz-Profile": "wrong"})
+        assert list(profile_dir.iterdir()) == []
+
+        client.get("/", headers={"X-Riyaz-Profile": "secret"})
+        assert len(list((profile_dir / "index").glob("*.prof"))) == 1
+
+    def test_sample_rate(self, client, monkeypatch, profile_dir):
+        monkeypatch.setattr(config, "profile_sample_rate", 1.0)
+        client.get("/api/courses/hello-world/version")
+        client.get("/no-such-page")
+
+        assert len(list((profile_dir / "get_course_version").iterdir())) == 1
+        assert len(list((profile_dir / "unmatched").iterdir())) == 1
+
+    def test_sample_profiler(self, client, monkeypatch, profile_dir):
+        monkeypatch.setattr(config, "profile", True)
+        monkeypatch.setattr(config, "profiler", "sample")
+        client.get(self.lesson_url)
+
+        [path] = (profile_dir / "view_lesson").glob("*.folded")
+        for line in path.read_text().splitlines():
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0 and stack
+
+    def test_stack_sampler(self):
+        def busy_loop():
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                pass
+
+        sampler = StackSampler(threading.get_ident(), interval=0.001)
+        sampler.start()
+        busy_loop()
+        sampler.stop()
+
+        assert sampler.counts
+        assert all("test_stack_sampler" in stack for stack in sampler.counts)
+        assert any(stack.split(";")[-1].startswith("busy_loop")
+                   for stack in sampler.counts)
+
+
+class TestMetrics:
+    @pytest.fixture(autouse=True)
+    def metrics(self, monkeypatch):
+        monkeypatch.setattr(config, "metrics", True)
+
+    def get_metrics(self, client):
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+        return response.data.decode()
+
+    def test_metrics(self, client):
+        client.get("/courses/hello-world/getting-started/course-yml")
+        client.get("/api/courses/hello-world/version")
+        text = self.get_metrics(client)
+
+        for line in [
+            'riyaz_http_requests_total{route="view_lesson",method="GET",status="200"}',
+            'riyaz_http_request_duration_seconds_count{route="view_lesson"}',
+            'riyaz_sql_statement_duration_seconds_count{statement="select"}',
+            'riyaz_template_render_duration_seconds_count{template="lesson.html"}',
+            'riyaz_markdown_render_duration_seconds_count{renderer="python-markdown"}',
+            'riyaz_course_import_duration_seconds_count{kind="full"}',
+            'riyaz_course_import_rows_total{table="lesson"}',
+            'riyaz_version_polls_total{transport="poll"}',
+        ]:
+            assert line in text
+
+    def test_counts(self, client):
+        def get_value(text, name):
+            for line in text.splitlines():
+                if line.startswith(name + " "):
+                    return float(line.split()[-1])
+            return 0
+
+        name = 'riyaz_http_requests_total{route="index",method="GET",status="200"}'
+        before = get_value(self.get_metrics(client), name)
+        client.get("/")
+        client.get("/")
+        assert get_value(self.get_metrics(client), name) == before + 2
+
+    def test_disabled(self, client, monkeypatch):
+        monkeypatch.setattr(config, "metrics", False)
+        assert client.get("/metrics").status_code == 404
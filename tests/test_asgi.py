@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+
+from riyaz import asgi
+from riyaz.disk import CourseLoader
+from riyaz.migrate import migrate
+
+
+@pytest.fixture(autouse=True)
+def loader(get_db, course_dir):
+    migrate()
+    loader = CourseLoader(course_dir)
+    loader.load()
+    return loader
+
+
+def make_scope(path, method="GET", headers=()):
+    return {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "path": path,
+        "root_path": "",
+        "query_string": b"",
+        "headers": list(headers),
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 5000),
+    }
+
+
+async def request(path, method="GET", body=b"", headers=()):
+    """Calls the ASGI app, and returns the status, headers and body.
+    """
+    messages = []
+    disconnected = asyncio.Event()
+
+    async def receive():
+        if not messages:
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi.app(make_scope(path, method, headers), receive, send)
+
+    start, *bodies = messages
+    return (start["status"], dict(start["headers"]),
+            b"".join(m.get("body", b"") for m in bodies))
+
+
+def test_flask_routes():
+    status, headers, body = asyncio.run(request("/courses/hello-world"))
+
+    assert status == 200
+    assert headers[b"content-type"].startswith(b"text/html")
+    assert b"Hello" in body
+
+    status, _, _ = asyncio.run(request("/courses/no-such-course"))
+    assert status == 404
+
+
+def test_post_body():
+    status, _, body = asyncio.run(request(
+        "/feather/runtimes/python", method="POST", body=b"print(1)"))
+    # local execution is disabled
+    assert status == 404
+
+
+def test_course_version():
+    status, _, body = asyncio.run(request("/api/courses/hello-world/version"))
+
+    assert status == 200
+    assert json.loads(body)["version"]
+
+
+def test_course_events():
+    async def read_first_event():
+        messages = []
+        got_event = asyncio.Event()
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+            if message.get("body"):
+                got_event.set()
+
+        task = asyncio.ensure_future(asgi.app(
+            make_scope("/api/courses/hello-world/events"), receive, send))
+        await asyncio.wait_for(got_event.wait(), 5)
+        disconnected.set()
+        await asyncio.wait_for(task, 5)
+        return messages
+
+    start, event, *_ = asyncio.run(read_first_event())
+
+    assert start["status"] == 200
+    assert dict(start["headers"])[b"content-type"] == b"text/event-stream"
+    assert event["body"].startswith(b"event: version\ndata: {\"version\": ")
@@ -0,0 +1,59 @@
+from riyaz.assets import build_asset_bundle, load_asset_bundle, minify_css
+
+
+def test_minify_css():
+    css = """
+    /* comment */
+    .a > .b,
+    .c {
+        color: red;
+        margin: 0 auto;
+    }
+    """
+    assert minify_css(css) == ".a>.b,.c{color: red;margin: 0 auto}"
+
+
+def test_minify_css_strings():
+    css = """
+    a[title="a , b"] > b::before {
+        content: "a , b ; c /* d */";
+        background: url('data:image/svg+xml;utf8,<svg a="1 ; 2"/>') ;
+    }
+    """
+    assert minify_css(css) == (
+        'a[title="a , b"]>b::before{content: "a , b ; c /* d */";'
+        "background: url('data:image/svg+xml;utf8,<svg a=\"1 ; 2\"/>')}")
+
+
+def test_build_asset_bundle(tmp_path):
+    static_dir = tmp_path / "static"
+    static_dir.mkdir()
+    (static_dir / "a.css").write_text(".a { color: red; }")
+    (static_dir / "a.js").write_text("var a = 1")
+    (static_dir / "b.js").write_text("var b = 2;")
+
+    out_dir = tmp_path / "bundles"
+    bundle = build_asset_bundle(
+        "plugins", ["/static/a.css"], ["/static/a.js", "/static/b.js", "/static/c.js"],
+        static_dir=static_dir, out_dir=out_dir)
+
+    assert bundle.missing == ["/static/c.js"]
+    assert (out_dir / bundle.stylesheet).read_text() == ".a{color: red}"
+    assert (out_dir / bundle.javascript).read_text().startswith("var a = 1\n;")
+    assert load_asset_bundle(out_dir, "plugins") == bundle
+    assert load_asset_bundle(out_dir, "lesson") is None
+
+    # a rebuild with different content gets a new name, and replaces the
+    # old bundle
+    (static_dir / "a.css").write_text(".a { color: blue; }")
+    rebuilt = build_asset_bundle(
+        "plugins", ["/static/a.css"], ["/static/a.js"],
+        static_dir=static_dir, out_dir=out_dir)
+
+    assert rebuilt.stylesheet != bundle.stylesheet
+    assert sorted(p.name for p in out_dir.glob("plugins.*")) == sorted(
+        [rebuilt.stylesheet, rebuilt.javascript])
+
+
+def test_load_missing_bundle(tmp_path):
+    assert load_asset_bundle(tmp_path, "plugins") is None
@@ -0,0 +1,54 @@
+import pytest
+
+from riyaz import bundle, db, disk
+from riyaz.migrate import migrate
+
+
+@pytest.fixture
+def course_with_photo(course_dir):
+    photo = course_dir / "authors" / "alice.png"
+    photo.write_bytes(b"not really a png")
+
+    author_file = course_dir / "authors" / "alice.md"
+    author_file.write_text(
+        f"---\nname: Alice\nphoto: {photo}\n---\nAbout Alice\n")
+
+    return course_dir
+
+
+def test_read_bundle(course_with_photo, tmp_path):
+    course = disk.get_course_from_directory(course_with_photo)
+    path = tmp_path / "hello-world.riyaz"
+
+    bundle.write_bundle(course, path)
+    assert bundle.is_bundle(path)
+    assert not bundle.is_bundle(course_with_photo)
+
+    bundled_course = bundle.read_bundle(path)
+    assert bundled_course.dict(exclude={"authors"}) == course.dict(
+        exclude={"authors"})
+
+    author = bundled_course.authors[0]
+    assert author.key == "alice" and author.about == "About Alice"
+    assert author.photo.name == "alice.png"
+    assert author.photo_content == b"not really a png"
+
+
+def test_import_bundle(course_with_photo, tmp_path, get_db, monkeypatch):
+    from riyaz import config
+
+    migrate()
+    monkeypatch.setattr(config, "assets_path", str(tmp_path / "assets"))
+
+    path = tmp_path / "hello-world.riyaz"
+    bundle.write_bundle(disk.get_course_from_directory(course_with_photo), path)
+
+    [result] = disk.load_courses([path])
+
+    assert result.error is None
+    course = db.Course.find(key="hello-world")
+    assert [lesson["name"] for lesson in course.get_outline()[0]["lessons"]] == [
+        "riyaz-terminology", "course-yml"]
+
+    photo_url = course.get_instructors()[0].get_photo_url()
+    assert (tmp_path / photo_url.replace("/assets/", "assets/", 1)).read_bytes() == b"not really a png"
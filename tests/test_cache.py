@@ -0,0 +1,170 @@
+import multiprocessing
+import pickle
+from datetime import datetime, timezone
+
+from riyaz.cache import CachedResponse, LRUCache, ResponseCache, SharedCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.get("b") is None
+
+    assert cache.hits == 3 and cache.misses == 1
+
+
+def test_lru_cache_get_or_set():
+    cache = LRUCache(maxsize=2)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "value"
+
+    assert cache.get_or_set("key", compute) == "value"
+    assert cache.get_or_set("key", compute) == "value"
+    assert len(calls) == 1
+
+
+def test_disabled_lru_cache():
+    cache = LRUCache(maxsize=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def _set_in_other_process(path):
+    SharedCache(path).set("page", "key", b"from another process")
+
+
+def test_shared_cache(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SharedCache(path)
+    assert cache.get("page", "key") is None
+
+    process = multiprocessing.get_context("spawn").Process(
+        target=_set_in_other_process, args=(path,))
+    process.start()
+    process.join()
+
+    assert cache.get("page", "key") == b"from another process"
+    assert cache.get("fragment", "key") is None
+    assert cache.hits == 1 and cache.misses == 2
+
+
+def test_shared_cache_evict(tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.db"))
+    cache.set("page", "a", b"1", course_key="course", version="v1")
+    cache.set("page", "b", b"2", course_key="course", version="v2")
+    cache.set("page", "c", b"3", course_key="other", version="v1")
+    cache.set("fragment", "d", "4")
+
+    cache.evict("course", keep_version="v2")
+    assert cache.get("page", "a") is None
+    assert [cache.get("page", k) for k in "bc"] == [b"2", b"3"]
+    assert cache.get("fragment", "d") == "4"
+
+
+def test_shared_cache_prune(tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.db"), maxsize=10 * 1024)
+    for i in range(20):
+        cache.set("page", str(i), b"x" * 1024)
+    cache.prune()
+
+    assert len(cache) < 10
+    # the oldest values are dropped first
+    assert cache.get("page", "0") is None
+    assert cache.get("page", "19") == b"x" * 1024
+
+
+def test_shared_cache_errors_are_misses(tmp_path):
+    path = tmp_path / "cache.db"
+    cache = SharedCache(str(path))
+    cache.set("page", "key", b"1")
+
+    cache._connect().execute("update cache set value = x'00'")
+    assert cache.get("page", "key", "default") == "default"
+
+    # a page written by another version of riyaz
+    cache._connect().execute("update cache set value = ?", (b"r{}\n",))
+    assert cache.get("page", "key", "default") == "default"
+    assert cache.misses == 2
+
+    path.unlink()
+    path.mkdir()
+    cache = SharedCache(str(path))
+    assert len(cache) == 0
+    cache.clear()
+
+
+def test_shared_cache_values_are_not_unpickled(tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.db"))
+    cache.set("page", "key", b"page")
+    cache._connect().execute(
+        "update cache set value = ?", (pickle.dumps(_Payload()),))
+
+    assert cache.get("page", "key") is None
+    assert _unpickled == []
+
+
+def test_shared_cache_values(tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.db"))
+    response = CachedResponse.from_body(b"page", "text/html")
+    cache.set("page", "page", response)
+    cache.set("fragment", "fragment", "<p>fragment</p>")
+
+    assert cache.get("page", "page").body == b"page"
+    assert cache.get("fragment", "fragment") == "<p>fragment</p>"
+
+
+def test_response_cache_shares_pages(tmp_path):
+    shared = SharedCache(str(tmp_path / "cache.db"))
+    worker_1 = ResponseCache(maxsize=0, shared=shared)
+    worker_2 = ResponseCache(maxsize=0, shared=shared)
+
+    worker_1.set("course", "v1", "/courses/course",
+                 CachedResponse.from_body(b"page", "text/html"))
+    assert worker_2.get("course", "v1", "/courses/course").body == b"page"
+
+    # a new version drops the pages of older versions for all workers
+    assert worker_2.get("course", "v2", "/courses/course") is None
+    assert worker_1.get("course", "v1", "/courses/course") is None
+
+
+def test_cached_response_bytes():
+    response = CachedResponse(
+        b"page\n", "text/html", "etag",
+        datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        {"gzip": b"gz", "br": b""})
+
+    read = CachedResponse.from_bytes(response.to_bytes())
+    assert [getattr(read, name) for name in CachedResponse.__slots__] == \
+        [getattr(response, name) for name in CachedResponse.__slots__]
+
+
+_unpickled = []
+
+
+def _unpickle():
+    _unpickled.append(1)
+
+
+class _Payload:
+    def __reduce__(self):
+        return _unpickle, ()
+
+
+def test_response_cache_files_are_not_unpickled(tmp_path):
+    cache = ResponseCache(maxsize=0, directory=str(tmp_path))
+    cache.set("course", "v1", "/courses/course",
+              CachedResponse.from_body(b"page", "text/html"))
+    [path] = (tmp_path / "course" / "v1").iterdir()
+
+    path.write_bytes(pickle.dumps(_Payload()))
+    assert cache.get("course", "v1", "/courses/course") is None
+    assert _unpickled == []
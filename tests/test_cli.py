@@ -0,0 +1,109 @@
+import json
+import subprocess
+import sys
+from contextlib import nullcontext
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from riyaz import config
+from riyaz.cli import main
+
+
+# imported by the commands that need them, not by `riyaz --help`. Their
+# import time is measured by benchmarks/cli_import_time.py.
+LAZY_MODULES = [
+    "cookiecutter", "flask", "jinja2", "markdown", "pydantic", "pygments",
+    "watchdog", "web", "riyaz.app", "riyaz.db", "riyaz.disk",
+]
+
+HELP_SCRIPT = """
+import json, sys
+from riyaz.cli import main
+try:
+    main(["--help"])
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def test_help_imports_no_heavy_modules():
+    process = subprocess.run(
+        [sys.executable, "-c", HELP_SCRIPT],
+        capture_output=True, text=True, check=True)
+    modules = json.loads(process.stdout.splitlines()[-1])
+
+    assert [name for name in LAZY_MODULES if name in modules] == []
+
+
+def test_help():
+    result = CliRunner().invoke(main, ["--help"])
+    assert result.exit_code == 0
+    assert "import-course" in result.output
+
+
+def test_new_site(tmp_path, monkeypatch):
+    # new-site points the config at the new site
+    monkeypatch.setattr(config, "database_path", config.database_path)
+    monkeypatch.setattr(config, "assets_path", config.assets_path)
+
+    result = CliRunner().invoke(main, ["new-site", str(tmp_path / "site")])
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "site" / "riyaz.db").exists()
+    assert (tmp_path / "site" / "riyaz.yml").exists()
+
+
+class TestServe:
+    @pytest.fixture(autouse=True)
+    def serve(self, monkeypatch, course_dir):
+        from riyaz.app import app
+        from riyaz.cli import livereload
+
+        # serve points the config at a temporary site
+        for name in ["database_path", "assets_path", "feather"]:
+            monkeypatch.setattr(config, name, getattr(config, name))
+        monkeypatch.setattr(app, "run", lambda: None)
+        monkeypatch.setattr(
+            livereload, "live_reload", lambda *args, **kwargs: nullcontext())
+        monkeypatch.chdir(course_dir)
+
+    def test_local_execution_is_opt_in(self):
+        result = CliRunner().invoke(main, ["serve"])
+        assert result.exit_code == 0, result.output
+        assert not config.feather.get("local_execution")
+
+    def test_local_execution(self, monkeypatch):
+        from riyaz.plugins import feather
+
+        pools = []
+        monkeypatch.setattr(feather, "get_pool", lambda: pools.append(1))
+
+        result = CliRunner().invoke(main, ["serve", "--local-execution"])
+        assert result.exit_code == 0, result.output
+        assert config.feather["local_execution"] is True
+        assert pools == [1]
+
+
+def run_cli(*args, cwd=None):
+    return subprocess.run(
+        [sys.executable, "-c", "from riyaz.cli import main; main()", *args],
+        capture_output=True, text=True, cwd=cwd)
+
+
+def test_import_course_json_to_stdout(tmp_path):
+    sample_course = Path(__file__).parent.parent / "sample_courses" / "hello-world"
+    site = tmp_path / "site"
+    assert run_cli("new-site", str(site), cwd=tmp_path).returncode == 0
+
+    process = run_cli("import-course", "-d", str(site), "--timings",
+                      "--json", "-", str(sample_course), cwd=tmp_path)
+    assert process.returncode == 0, process.stderr
+
+    results = json.loads(process.stdout)
+    assert [result["key"] for result in results] == ["hello-world"]
+    assert "db_lessons" in results[0]["stages"]
+    # the summary and the timings go to stderr
+    assert "Successfully loaded course" in process.stderr
+    assert "db_lessons" in process.stderr
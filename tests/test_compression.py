@@ -0,0 +1,46 @@
+import gzip
+
+import pytest
+
+from riyaz import compression
+
+
+@pytest.fixture(autouse=True)
+def encodings(monkeypatch):
+    monkeypatch.setattr(compression, "get_encodings", lambda: ["br", "gzip"])
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, deflate, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("*", "br"),
+    ("*;q=0.1, br;q=0", "gzip"),
+    ("GZIP;q=bad, gzip", "gzip"),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert compression.negotiate_encoding(accept_encoding) == expected
+
+
+def test_is_compressible():
+    assert compression.is_compressible("text/html")
+    assert compression.is_compressible("application/json")
+    assert not compression.is_compressible("image/png")
+
+
+def test_compress_gzip():
+    body = b"hello " * 100
+    compressed = compression.compress(body, "gzip", 6)
+
+    assert gzip.decompress(compressed) == body
+    # no timestamp, so the same body compresses to the same bytes
+    assert compression.compress(body, "gzip", 6) == compressed
+
+
+def test_compress_brotli():
+    brotli = pytest.importorskip("brotli")
+    body = b"hello " * 100
+    assert brotli.decompress(compression.compress(body, "br", 11)) == body
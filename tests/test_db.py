@@ -1,6 +1,7 @@
-import pytest
 import textwrap
 
+import pytest
+
 from riyaz import db
 
 
@@ -119,3 +120,84 @@ class TestDocument:
         rows = Document_.select(what="name", where=None, vars=None)
         names = [{**row} for row in rows]
         assert names == [{"name": "first"}, {"name": "second"}]
+
+
+class TestCourseRelease:
+    @pytest.fixture(autouse=True)
+    def setup_db(self, get_db, monkeypatch):
+        from riyaz import config
+        from riyaz.migrate import migrate
+
+        migrate()
+        monkeypatch.setattr(config, "keep_releases", 1)
+
+    @pytest.fixture
+    def loader(self, course_dir):
+        from riyaz.disk import CourseLoader
+        return CourseLoader(course_dir)
+
+    def test_load_publishes_new_version(self, loader):
+        old_course = loader.load()
+        new_course = loader.load()
+
+        assert new_course.id != old_course.id
+        assert db.Course.find(key="hello-world").id == new_course.id
+        assert db.Course.find(id=old_course.id).key is None
+        assert db.Store.get("hello-world") == new_course.get_release().version
+
+        published = db.Course.find_published()
+        assert [course.id for course in published if course.key == "hello-world"] == [new_course.id]
+
+    def test_old_versions_are_pruned(self, loader):
+        first, second, third = loader.load(), loader.load(), loader.load()
+
+        assert db.Course.find(id=first.id) is None
+        assert db.Lesson.find(course_id=first.id) is None
+        assert db.Course.find(id=second.id) is not None
+
+    def test_rollback(self, loader):
+        old_course = loader.load()
+        new_course = loader.load()
+
+        previous = new_course.get_release().rollback()
+
+        assert previous.course_id == old_course.id
+        assert db.Course.find(key="hello-world").id == old_course.id
+        assert db.Store.get("hello-world") == previous.version
+
+        # rolling back again undoes the rollback
+        db.Course.find(key="hello-world").get_release().rollback()
+        assert db.Course.find(key="hello-world").id == new_course.id
+
+
+def test_insert_all_max_variables(get_db, monkeypatch):
+    from riyaz.migrate import migrate
+
+    migrate()
+    database = get_db()
+    batches = []
+    multiple_insert = database.multiple_insert
+
+    def spying_multiple_insert(table, values, *args, **kwargs):
+        batches.append([len(row) for row in values])
+        return multiple_insert(table, values, *args, **kwargs)
+
+    monkeypatch.setattr(database, "multiple_insert", spying_multiple_insert)
+
+    course = db.Course(title="Many lessons").save()
+    module = db.Module.new(course, name="module", title="Module").save()
+    lessons = db.Lesson.insert_all([
+        db.Lesson(course_id=course.id, module_id=module.id, index_=i,
+                  name=f"lesson-{i}", title=f"Lesson {i}", content="")
+        for i in range(1, 151)])
+    outline = course.set_outline([
+        db.CourseOutline(
+            course_id=course.id, module_id=module.id, module_index=1,
+            lesson_id=lesson.id, lesson_index=lesson.index_)
+        for lesson in lessons])
+
+    # the limit of SQLite before 3.32
+    assert all(sum(batch) <= db.MAX_VARIABLES for batch in batches)
+    assert sum(len(batch) for batch in batches) == 300
+    assert len(db.CourseOutline.find_all(course_id=course.id)) == 150
+    assert all(row.id is not None for row in outline)
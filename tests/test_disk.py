@@ -1,9 +1,11 @@
+import shutil
+
 import pytest
 import yaml
 from pathlib import Path
 from pydantic import ValidationError
 
-from riyaz import disk
+from riyaz import db, disk
 
 
 def get_config_path(base):
@@ -67,3 +69,124 @@ class TestReadConfig:
 def test_course_from_directory(course_dir):
     course = disk.get_course_from_directory(course_dir)
     assert course.name == "hello-world"
+
+
+class TestLoadCourses:
+    @pytest.fixture(autouse=True)
+    def setup_db(self, get_db):
+        from riyaz.migrate import migrate
+        migrate()
+
+    @pytest.fixture
+    def course_dirs(self, course_dir):
+        other_dir = course_dir.parent / "other-course"
+        shutil.copytree(course_dir, other_dir)
+
+        config_path = get_config_path(other_dir)
+        data = yaml.safe_load(config_path.read_text())
+        data["name"] = "other-course"
+        config_path.write_text(yaml.dump(data))
+
+        return [course_dir, other_dir]
+
+    def test_load_courses(self, course_dirs):
+        results = disk.load_courses(course_dirs, workers=2, batch_size=1)
+
+        assert sorted(result.key for result in results) == [
+            "hello-world", "other-course"]
+        for result in results:
+            assert result.error is None
+            assert result.row_counts["lesson"] == 2
+            assert db.Course.find(key=result.key) is not None
+
+    def test_load_courses_timings(self, course_dirs):
+        results = disk.load_courses(course_dirs, workers=2, batch_size=2)
+
+        for result in results:
+            stages = result.timings.stages
+            assert stages["lesson_read"].rows == 2
+            assert stages["lesson_read"].bytes == sum(
+                len(path.read_text())
+                for path in result.path.glob("getting-started/*.md"))
+            assert stages["db_lessons"].rows == 2
+            for name in ["yaml", "validate", "authors", "headings", "render",
+                         "db_course", "db_outline", "publish", "version",
+                         "db_commit"]:
+                assert stages[name].count > 0, name
+            assert result.timings.get_total() <= (
+                result.parse_time + result.load_time)
+
+    def test_load_courses_with_invalid_course(self, course_dir, tmp_path):
+        results = disk.load_courses([course_dir, tmp_path], workers=1)
+
+        errors = {result.path: result.error for result in results}
+        assert errors[course_dir] is None
+        assert errors[tmp_path] is not None
+
+
+class TestCourseLoaderReload:
+    @pytest.fixture(autouse=True)
+    def setup_db(self, get_db):
+        from riyaz.migrate import migrate
+        migrate()
+
+    @pytest.fixture
+    def loader(self, course_dir):
+        loader = disk.CourseLoader(course_dir)
+        loader.load()
+        return loader
+
+    def test_reload_changed_lesson(self, loader, course_dir):
+        lesson_path = course_dir / "getting-started" / "course-yml.md"
+        lesson_path.write_text("# Updated title\n\nUpdated content\n")
+
+        loader.reload([lesson_path])
+
+        assert dict(loader.row_counts) == {"lesson": 1}
+        course = db.Course.find(key="hello-world")
+        lesson = course.get_lesson("getting-started", "course-yml")
+        assert lesson.title == "Updated title"
+
+    def test_reload_changed_config(self, loader, course_dir):
+        loader.reload([get_config_path(course_dir)])
+
+        assert loader.row_counts["course"] == 1
+        assert loader.row_counts["lesson"] == 2
+
+
+class TestSharedInstructors:
+    @pytest.fixture(autouse=True)
+    def setup_db(self, get_db):
+        from riyaz.migrate import migrate
+        migrate()
+
+    @pytest.fixture
+    def other_dir(self, course_dir):
+        other_dir = course_dir.parent / "other-course"
+        shutil.copytree(course_dir, other_dir)
+
+        config_path = get_config_path(other_dir)
+        data = yaml.safe_load(config_path.read_text())
+        data["name"] = "other-course"
+        config_path.write_text(yaml.dump(data))
+
+        disk.CourseLoader(course_dir).load()
+        disk.CourseLoader(other_dir).load()
+        return other_dir
+
+    def test_unchanged_instructor(self, other_dir):
+        version = db.Store.get("hello-world")
+        disk.CourseLoader(other_dir).load()
+
+        assert db.Store.get("hello-world") == version
+
+    def test_changed_instructor(self, other_dir):
+        version = db.Store.get("hello-world")
+        author_path = other_dir / "authors" / "alice.md"
+        author_path.write_text(author_path.read_text().replace(
+            "Information about the author", "New bio"))
+        disk.CourseLoader(other_dir).load()
+
+        assert db.Store.get("hello-world") != version
+        course = db.Course.find(key="hello-world")
+        assert "New bio" in course.get_instructors()[0].get_about_html()
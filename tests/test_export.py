@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from riyaz import config, export
+from riyaz.disk import CourseLoader
+from riyaz.export import MANIFEST_FILENAME, _init_worker, export_site
+from riyaz.migrate import migrate
+
+
+@pytest.fixture
+def loader(get_db, course_dir, tmp_path, monkeypatch):
+    migrate()
+    monkeypatch.setattr(config, "assets_path", str(tmp_path / "assets"))
+
+    loader = CourseLoader(course_dir)
+    loader.load()
+    return loader
+
+
+def test_export_site(loader, tmp_path):
+    out_dir = tmp_path / "out"
+
+    summary = export_site(out_dir, workers=2)
+
+    assert summary.exported == ["hello-world"]
+    assert (out_dir / "index.html").exists()
+    assert (out_dir / "courses/hello-world/index.html").exists()
+    lesson_page = out_dir / "courses/hello-world/getting-started/course-yml/index.html"
+    assert b"course.yml" in lesson_page.read_bytes()
+    assert (out_dir / "static/poll.js").exists()
+
+    version = json.loads((out_dir / "api/courses/hello-world/version").read_text())
+    manifest = json.loads((out_dir / MANIFEST_FILENAME).read_text())
+    assert manifest == {"hello-world": version["version"]}
+
+
+def test_export_is_incremental(loader, tmp_path):
+    out_dir = tmp_path / "out"
+    export_site(out_dir, workers=1)
+
+    summary = export_site(out_dir, workers=1)
+    assert summary.exported == [] and summary.skipped == ["hello-world"]
+
+    loader.load()
+    summary = export_site(out_dir, workers=1)
+    assert summary.exported == ["hello-world"]
+
+
+def test_removed_lessons_are_not_kept(loader, course_dir, tmp_path):
+    out_dir = tmp_path / "out"
+    export_site(out_dir, workers=1)
+    lesson_dir = out_dir / "courses/hello-world/getting-started/course-yml"
+    assert lesson_dir.exists()
+
+    course_yml = course_dir / "course.yml"
+    course_yml.write_text(course_yml.read_text().replace(
+        "        - getting-started/course-yml.md\n", ""))
+    loader.load()
+    export_site(out_dir, workers=1)
+
+    assert not lesson_dir.exists()
+    assert (out_dir / "courses/hello-world/index.html").exists()
+
+
+def test_pages_stay_while_exported(loader, tmp_path, monkeypatch):
+    out_dir = tmp_path / "out"
+    export_site(out_dir, workers=1)
+    index = out_dir / "courses/hello-world/index.html"
+    stale = out_dir / "courses/hello-world/getting-started/old/index.html"
+    stale.parent.mkdir()
+    stale.write_text("old")
+
+    written = []
+    write_file = export._write_file
+
+    def checking_write_file(path, content):
+        # a server of the tree still finds the course
+        assert index.exists()
+        written.append(path)
+        write_file(path, content)
+
+    monkeypatch.setattr(export, "_write_file", checking_write_file)
+    task = ("hello-world", export.get_course_urls("hello-world"))
+    key, pages = export._export_pages(task, str(out_dir))
+
+    assert pages == len(written)
+    assert not stale.parent.exists()
+    assert all(path.exists() for path in written)
+
+
+def test_worker_loads_config(monkeypatch, tmp_path):
+    for name in ["config_path", "database_path", "assets_path", "bundles_path",
+                 "jobs_database_path", "profile_dir", "response_cache"]:
+        monkeypatch.setattr(config, name, getattr(config, name))
+    # like a spawned worker, which starts with the defaults
+    monkeypatch.setattr(config, "highlight_style", "default")
+    config_path = tmp_path / "riyaz.yml"
+    config_path.write_text("highlight_style: monokai\n")
+
+    _init_worker(str(config_path), str(tmp_path / "site.db"), "assets")
+
+    assert config.highlight_style == "monokai"
+    assert config.database_path == str(tmp_path / "site.db")
+    assert config.response_cache is False
@@ -0,0 +1,130 @@
+import shutil
+
+import pytest
+
+from riyaz import app as app_module
+from riyaz import config
+from riyaz.db import Course, Store
+from riyaz.disk import CourseLoader
+from riyaz.graph import CourseGraph, course_graph, read_course
+from riyaz.migrate import migrate
+
+
+@pytest.fixture
+def loader(get_db, course_dir):
+    migrate()
+    loader = CourseLoader(course_dir)
+    loader.load()
+    return loader
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    monkeypatch.setattr(config, "course_graph", True)
+    course_graph.clear()
+    yield course_graph
+    course_graph.clear()
+
+
+def test_read_course(loader):
+    course = Course.find(key="hello-world")
+    graph_course = read_course("hello-world")
+
+    assert graph_course.version == course.get_version()
+    assert graph_course.title == course.title
+    assert [i.key for i in graph_course.get_instructors()] == \
+        [i.key for i in course.get_instructors()]
+    assert [(m.name, m.title, [lesson.name for lesson in m.lessons])
+            for m in graph_course.get_outline()] == \
+        [(m["name"], m["title"], [lesson["name"] for lesson in m["lessons"]])
+         for m in course.get_outline()]
+
+    for module in course.get_modules():
+        for lesson in module.get_lessons():
+            graph_lesson = graph_course.get_lesson(module.name, lesson.name)
+            assert graph_lesson.get_url() == lesson.get_url()
+            assert graph_lesson.get_label() == lesson.get_label()
+            assert graph_lesson.get_languages() == lesson.get_languages()
+            assert graph_lesson.get_content_html() == lesson.get_content_html()
+            for attr in ["get_prev", "get_next"]:
+                expected = getattr(lesson, attr)()
+                actual = getattr(graph_lesson, attr)()
+                assert (actual and actual.get_url()) == \
+                    (expected and expected.get_url())
+
+
+def test_missing_course(loader):
+    assert read_course("nope") is None
+    assert CourseGraph().get_course("nope") is None
+
+
+def test_new_version_is_read_again(loader):
+    graph = CourseGraph()
+    old = graph.get_course("hello-world")
+    assert graph.get_course("hello-world") is old
+    assert (graph.hits, graph.misses) == (1, 1)
+
+    loader.load()
+    new = graph.get_course("hello-world")
+
+    assert new is not old
+    assert new.version == Course.find(key="hello-world").get_version()
+    assert old.version != new.version
+    assert len(graph) == 1
+
+
+def test_load_all(loader):
+    graph = CourseGraph()
+    assert graph.load_all() == read_course("hello-world").get_lesson_count()
+    assert len(graph) == 1
+
+
+@pytest.mark.parametrize("url", [
+    "/courses/hello-world",
+    "/courses/hello-world/getting-started/course-yml",
+    "/courses/hello-world/getting-started/nope",
+    "/courses/nope",
+])
+def test_pages_are_the_same(loader, monkeypatch, url):
+    client = app_module.app.test_client()
+    fragment_cache = app_module.app.jinja_env.fragment_cache
+
+    fragment_cache.clear()
+    expected = client.get(url)
+
+    monkeypatch.setattr(config, "course_graph", True)
+    course_graph.clear()
+    fragment_cache.clear()
+    response = client.get(url)
+
+    assert response.status_code == expected.status_code
+    assert response.data == expected.data
+    course_graph.clear()
+
+
+def test_pages_use_graph(loader, graph):
+    client = app_module.app.test_client()
+    hits, misses = graph.hits, graph.misses
+    client.get("/courses/hello-world")
+    client.get("/courses/hello-world/getting-started/course-yml")
+
+    assert (graph.hits - hits, graph.misses - misses) == (1, 1)
+
+
+def test_shared_instructor_is_read_again(loader, course_dir):
+    graph = CourseGraph()
+    old = graph.get_course("hello-world")
+
+    other_dir = course_dir.parent / "other-course"
+    shutil.copytree(course_dir, other_dir)
+    course_yml = other_dir / "course.yml"
+    course_yml.write_text(course_yml.read_text().replace(
+        "name: hello-world", "name: other-course"))
+    author_path = other_dir / "authors" / "alice.md"
+    author_path.write_text(author_path.read_text().replace(
+        "Information about the author", "New bio"))
+    CourseLoader(other_dir).load()
+
+    new = graph.get_course("hello-world")
+    assert new.version == Store.get("hello-world") != old.version
+    assert "New bio" in new.get_instructors()[0].get_about_html()
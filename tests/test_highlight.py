@@ -0,0 +1,41 @@
+import pytest
+
+from riyaz import config
+from riyaz import highlight
+from riyaz import render
+
+pytest.importorskip("pygments")
+
+
+@pytest.fixture(autouse=True)
+def highlight_code(monkeypatch):
+    monkeypatch.setattr(config, "highlight_code", True)
+
+
+def test_highlight_code_blocks():
+    html = render.render_markdown('```python\nx = "<a>"\n```\n')
+
+    assert html.startswith('<pre class="highlight"><code class="language-python">')
+    assert '<span class="n">x</span>' in html
+    assert "&lt;a&gt;" in html
+
+
+@pytest.mark.parametrize("md", [
+    "```\nplain\n```\n",
+    "```no-such-language\nplain\n```\n",
+    "```{.python .feather}\nprint(1)\n```\n",
+])
+def test_blocks_that_are_not_highlighted(monkeypatch, md):
+    monkeypatch.setattr(config, "highlight_code", False)
+    expected = render.render_markdown(md)
+    monkeypatch.setattr(config, "highlight_code", True)
+
+    assert render.render_markdown(md) == expected
+
+
+def test_stylesheet_fingerprint():
+    filename = highlight.get_stylesheet_filename()
+
+    assert filename == f"highlight.{highlight.get_fingerprint('default')}.css"
+    assert highlight.get_fingerprint("monokai") != highlight.get_fingerprint("default")
+    assert ".highlight .k" in highlight.get_stylesheet("default")
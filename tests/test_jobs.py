@@ -0,0 +1,62 @@
+import pytest
+
+from riyaz import config, db, jobs
+from riyaz.migrate import migrate
+
+
+@pytest.fixture(autouse=True)
+def jobs_db(get_db, tmp_path, monkeypatch):
+    migrate()
+    monkeypatch.setattr(config, "jobs_database_path", str(tmp_path / "jobs.db"))
+
+
+def test_enqueue_coalesces_queued_jobs(course_dir):
+    first = jobs.enqueue_import_course(course_dir)
+    second = jobs.enqueue_import_course(course_dir)
+
+    assert first.id == second.id
+    assert len(jobs.Job.find_all()) == 1
+
+
+def test_enqueue_after_job_started(course_dir):
+    first = jobs.enqueue_import_course(course_dir)
+    assert jobs.Job.claim_next().id == first.id
+
+    second = jobs.enqueue_import_course(course_dir)
+    assert second.id != first.id
+
+
+def test_run_worker(course_dir):
+    job = jobs.enqueue_import_course(course_dir)
+
+    jobs.run_worker(once=True)
+
+    job = jobs.Job.find(id=job.id)
+    assert job.status == jobs.DONE
+    assert job.progress == 1
+    assert job.get_duration() is not None
+    assert db.Course.find(key="hello-world") is not None
+
+
+def test_failed_job(tmp_path):
+    job = jobs.enqueue_import_course(tmp_path / "does-not-exist")
+
+    jobs.run_worker(once=True)
+
+    job = jobs.Job.find(id=job.id)
+    assert job.status == jobs.FAILED
+    assert job.message
+
+
+def test_job_status_api(course_dir):
+    from riyaz.app import app
+
+    job = jobs.enqueue_import_course(course_dir)
+    client = app.test_client()
+
+    response = client.get(f"/api/jobs/{job.id}")
+    assert response.status_code == 200
+    assert response.json["status"] == jobs.QUEUED
+
+    response = client.get(f"/api/jobs/{job.id + 1}")
+    assert response.status_code == 404
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from riyaz.cli.livereload import Reloader
+
+
+class FakeLoader:
+    def __init__(self):
+        self.calls = []
+        self.running = 0
+        self.overlapped = False
+        self.lock = threading.Lock()
+
+    def reload(self, changed_paths):
+        with self.lock:
+            self.running += 1
+            self.overlapped = self.overlapped or self.running > 1
+
+        time.sleep(0.05)
+        self.calls.append(changed_paths)
+
+        with self.lock:
+            self.running -= 1
+
+
+@pytest.fixture
+def loader():
+    return FakeLoader()
+
+
+@pytest.fixture
+def reloader(loader, tmp_path):
+    reloader = Reloader(loader, tmp_path, debounce=0.1)
+    reloader.start()
+    yield reloader
+    reloader.stop()
+
+
+def test_changes_are_coalesced(reloader, loader, tmp_path):
+    for name in ["a.md", "b.md", "a.md"]:
+        reloader.notify(tmp_path / name)
+        time.sleep(0.01)
+
+    time.sleep(0.3)
+
+    assert loader.calls == [{tmp_path / "a.md", tmp_path / "b.md"}]
+
+
+def test_ignored_paths(reloader, loader, tmp_path):
+    assert reloader.is_ignored(tmp_path / ".git" / "index")
+    assert reloader.is_ignored(tmp_path / "lessons" / ".intro.md.swp")
+    assert reloader.is_ignored(tmp_path.parent / "outside.md")
+    assert not reloader.is_ignored(tmp_path / "lessons" / "intro.md")
+
+    reloader.notify(tmp_path / ".git" / "index")
+    time.sleep(0.2)
+    assert loader.calls == []
+
+
+def test_reloads_never_overlap(reloader, loader, tmp_path):
+    for i in range(5):
+        reloader.notify(tmp_path / f"{i}.md")
+        time.sleep(0.12)
+
+    time.sleep(0.3)
+
+    assert not loader.overlapped
+    assert set().union(*loader.calls) == {
+        tmp_path / f"{i}.md" for i in range(5)}
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from riyaz import loadtest
+from riyaz.app import app
+from riyaz.disk import CourseLoader
+from riyaz.migrate import migrate
+
+
+@pytest.fixture
+def port(get_db, course_dir):
+    migrate()
+    CourseLoader(course_dir).load()
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server.port
+    server.shutdown()
+    thread.join()
+
+
+def test_percentiles():
+    stats = loadtest.RouteStats(latencies=[i / 1000 for i in range(1, 101)])
+    assert stats.to_dict(duration=1.0)["p50"] == 0.051
+    assert stats.to_dict(duration=1.0)["p99"] == 0.1
+    assert loadtest.RouteStats().to_dict(duration=1.0)["p50"] is None
+
+
+def test_crawl_site(port):
+    site = loadtest.crawl_site(port)
+    assert site.courses == {
+        "hello-world": [
+            "/courses/hello-world/getting-started/riyaz-terminology",
+            "/courses/hello-world/getting-started/course-yml",
+        ],
+    }
+
+
+def test_run_load(port):
+    site = loadtest.crawl_site(port)
+    result = loadtest.run_load(
+        port, site, readers=2, tabs=3, duration=0.5, poll_interval=0.1)
+
+    assert result.get_errors() == 0
+    assert result.get_rps() > 0
+    for route in loadtest.ROUTES:
+        assert result.routes[route].latencies, route
+
+    d = result.to_dict()
+    assert set(d["routes"]) == set(loadtest.ROUTES)
+    assert d["routes"]["lesson"]["p95"] is not None
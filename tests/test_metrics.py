@@ -0,0 +1,159 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from riyaz import metrics
+from riyaz.metrics import Counter, Histogram, Registry
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter(registry):
+    requests = Counter(registry, "requests_total", "Requests.", ["route"])
+    requests.inc("index")
+    requests.inc("index", amount=2)
+    requests.inc("lesson")
+
+    assert registry.collect() == {
+        ("requests_total", ("index",)): 3,
+        ("requests_total", ("lesson",)): 1,
+    }
+    with pytest.raises(ValueError):
+        requests.inc()
+
+
+def test_histogram_format(registry):
+    latency = Histogram(registry, "latency_seconds", "Latency.", ["route"],
+                        buckets=[0.1, 1])
+    for value in (0.05, 0.5, 0.5, 5):
+        latency.observe(value, 'say "hi"\n')
+
+    assert registry.format(registry.collect()) == (
+        "# HELP latency_seconds Latency.\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{route="say \\"hi\\"\\n",le="0.1"} 1\n'
+        'latency_seconds_bucket{route="say \\"hi\\"\\n",le="1"} 3\n'
+        'latency_seconds_bucket{route="say \\"hi\\"\\n",le="+Inf"} 4\n'
+        'latency_seconds_sum{route="say \\"hi\\"\\n"} 6.05\n'
+        'latency_seconds_count{route="say \\"hi\\"\\n"} 4\n'
+    )
+
+
+def test_threads(registry):
+    requests = Counter(registry, "requests_total", "Requests.")
+
+    def count():
+        for _ in range(1000):
+            requests.inc()
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # the counts of the threads that are gone are kept
+    assert registry.collect() == {("requests_total", ()): 8000}
+    assert registry.collect() == {("requests_total", ()): 8000}
+
+
+def test_collector(registry):
+    Counter(registry, "hits_total", "Hits.", ["cache"])
+    registry.add_collector(lambda: [("hits_total", ("render",), 5)])
+    assert registry.collect() == {("hits_total", ("render",)): 5}
+
+
+def test_processes(registry, tmp_path):
+    requests = Counter(registry, "requests_total", "Requests.", ["route"])
+    latency = Histogram(registry, "latency_seconds", "Latency.", buckets=[1])
+    requests.inc("index")
+    latency.observe(0.5)
+
+    # written by another worker, which is still running
+    pid = os.getppid()
+    (tmp_path / f"{pid}-a.json").write_text(json.dumps([
+        ["requests_total", ["index"], 2],
+        ["latency_seconds", [], [1, 1, 2.5]],
+    ]))
+    (tmp_path / f"{pid}-b.json").write_text("not json")
+
+    assert registry.collect_all(str(tmp_path)) == {
+        ("requests_total", ("index",)): 3,
+        ("latency_seconds", ()): [2, 1, 3.0],
+    }
+
+    registry.flush(str(tmp_path / "metrics"))
+    [path] = (tmp_path / "metrics").iterdir()
+    assert json.loads(path.read_text()) == [
+        ["requests_total", ["index"], 1],
+        ["latency_seconds", [], [1, 0, 0.5]],
+    ]
+
+
+def get_dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    return process.pid
+
+
+def test_retired_processes(registry, tmp_path):
+    Counter(registry, "requests_total", "Requests.")
+    dead_pid, live_pid = get_dead_pid(), os.getppid()
+    for name, value in [(f"{dead_pid}-a.json", 2), (f"{live_pid}-b.json", 3)]:
+        (tmp_path / name).write_text(json.dumps([["requests_total", [], value]]))
+
+    assert registry.collect_all(str(tmp_path)) == {("requests_total", ()): 5}
+    # the file of the process that exited is added to the retired totals
+    assert sorted(path.name for path in tmp_path.glob("*.json")) == [
+        f"{live_pid}-b.json", metrics.RETIRED_FILE]
+
+    # and a new process with the same pid doesn't replace them
+    (tmp_path / f"{dead_pid}-c.json").write_text(
+        json.dumps([["requests_total", [], 1]]))
+    assert registry.collect_all(str(tmp_path)) == {("requests_total", ()): 6}
+
+
+def test_flusher(registry, tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "FLUSH_INTERVAL", 0.05)
+    requests = Counter(registry, "requests_total", "Requests.")
+    requests.inc()
+    registry.maybe_flush(str(tmp_path))
+    # recorded after the request that started the flusher, with no requests
+    # after it
+    requests.inc()
+
+    path = tmp_path / registry.get_file_name()
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        if path.exists() and json.loads(path.read_text()) == [
+                ["requests_total", [], 2]]:
+            break
+        time.sleep(0.01)
+    else:
+        pytest.fail("the metrics were not written")
+
+
+def test_without_fcntl(registry, tmp_path, monkeypatch):
+    # like on Windows, where the directory is not locked
+    monkeypatch.setitem(sys.modules, "fcntl", None)
+    Counter(registry, "requests_total", "Requests.")
+    (tmp_path / f"{os.getppid()}-a.json").write_text(
+        json.dumps([["requests_total", [], 2]]))
+
+    assert registry.collect_all(str(tmp_path)) == {("requests_total", ()): 2}
+    assert not (tmp_path / ".lock").exists()
+
+
+def test_percentile():
+    values = [i / 1000 for i in range(100, 0, -1)]
+    assert metrics.percentile(values, 50) == 0.051
+    assert metrics.percentile(values, 99) == 0.1
+    assert metrics.percentile([], 50) is None
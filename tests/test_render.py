@@ -0,0 +1,74 @@
+import re
+from pathlib import Path
+
+import pytest
+
+from riyaz import render
+
+root = Path(__file__).parent.parent
+
+# markdown of the sample courses, to check that every renderer renders our
+# fenced code blocks the same way as the default renderer
+conformance_files = sorted([
+    *root.glob("sample_courses/**/*.md"),
+    *root.glob("tests/data/**/*.md"),
+])
+
+
+def get_code_blocks(html):
+    return re.findall(r"<pre>.*?</pre>", html, re.DOTALL)
+
+
+def test_render_markdown():
+    html = render.render_markdown("# Title\n\n```python\nprint(1)\n```\n")
+    assert "<h1>Title</h1>" in html
+    assert '<code class="language-python">print(1)' in html
+
+
+def test_render_markdown_cached():
+    render.render_cache.clear()
+    md = "some *markdown*"
+
+    assert render.render_markdown_cached(md) == render.render_markdown(md)
+    assert render.render_markdown_cached(md) == render.render_markdown(md)
+    assert len(render.render_cache) == 1
+
+
+def test_get_code_languages():
+    md = "\n".join([
+        "```python",
+        "print(1)",
+        "```",
+        "",
+        "~~~~ {.HTML .feather}",
+        "```js",
+        "~~~~",
+        "",
+        "```",
+        "no language",
+        "```",
+        "",
+        "```python title",
+        "```",
+    ])
+    assert render.get_code_languages(md) == ["python", "html"]
+
+
+def test_unknown_renderer():
+    with pytest.raises(ValueError):
+        render.get_renderer("no-such-renderer")
+
+
+@pytest.mark.parametrize("name", sorted(render.renderers))
+@pytest.mark.parametrize(
+    "path", conformance_files, ids=lambda path: str(path.relative_to(root)))
+def test_renderer_conformance(name, path):
+    try:
+        render_fn = render.get_renderer(name)
+    except ImportError:
+        pytest.skip(f"renderer {name} is not installed")
+
+    md = path.read_text()
+    expected = get_code_blocks(render.get_renderer("python-markdown")(md))
+
+    assert get_code_blocks(render_fn(md)) == expected
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from riyaz.sandbox import Limits, QueueFull, SandboxPool
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = SandboxPool(workers=2, limits=Limits(timeout=1, output_bytes=1000))
+    yield pool
+    pool.close()
+
+
+def test_run(pool):
+    result = pool.run("print('hello')")
+    assert result.output == "hello\n"
+    assert result.exit_code == 0
+
+
+def test_args_env_and_files(pool):
+    code = "import os, sys; print(sys.argv[1:], os.environ['X'], open('a.txt').read())"
+    result = pool.run(code, args=["-v", "1"], env={"X": "y"}, files={"a.txt": "A"})
+    assert result.output == "['-v', '1'] y A\n"
+
+
+def test_error(pool):
+    result = pool.run("1 / 0")
+    assert result.exit_code == 1
+    assert result.output.startswith('Traceback (most recent call last):\n  File "main.py"')
+    assert "ZeroDivisionError" in result.output
+
+
+def test_exit_code(pool):
+    assert pool.run("raise SystemExit(3)").exit_code == 3
+
+
+def test_timeout(pool):
+    result = pool.run("print('start', flush=True)\nwhile True: pass")
+    assert result.timed_out
+    assert result.output.startswith("start\n")
+    assert "[killed after 1 seconds]" in result.output
+
+    # the worker is still usable
+    assert pool.run("print(1)").output == "1\n"
+
+
+def test_output_limit(pool):
+    result = pool.run("print('a' * 5000)")
+    assert result.output == "a" * 1000 + "\n[output truncated]\n"
+
+
+def test_memory_limit(pool):
+    result = pool.run("x = ' ' * (1 << 30)")
+    assert "MemoryError" in result.output
+
+
+def test_metrics(pool):
+    runs = pool.metrics.runs
+    pool.run("pass")
+
+    metrics = pool.metrics.to_dict()
+    assert metrics["runs"] == runs + 1
+    assert metrics["latency_p50"] > 0
+
+
+def test_queue_full():
+    pool = SandboxPool(workers=1, queue_size=0)
+    try:
+        pool.run("pass")  # wait for the worker to start
+        thread = threading.Thread(
+            target=pool.run, args=("import time; time.sleep(1)",))
+        thread.start()
+        time.sleep(0.2)
+
+        with pytest.raises(QueueFull):
+            pool.run("pass")
+        assert pool.metrics.rejected == 1
+        thread.join()
+    finally:
+        pool.close()
@@ -0,0 +1,38 @@
+from riyaz import db
+from riyaz.disk import CourseLoader, get_course_from_directory
+from riyaz.migrate import migrate
+from riyaz.synthetic import generate_course
+
+
+def test_generate_course(tmp_path):
+    course_dir = generate_course(
+        tmp_path, name="big", modules=3, lessons=4, authors=2,
+        lesson_size_kb=2)
+    course = get_course_from_directory(course_dir)
+
+    assert course.name == "big"
+    assert [len(chapter.lessons) for chapter in course.outline] == [4, 4, 4]
+    assert len(course.authors) == 2
+    lesson = course.outline[0].lessons[0]
+    assert lesson.title == "Lesson 1.1"
+    assert 2048 <= len(lesson.content) < 4096
+    assert "```python" in "".join(
+        lesson.content for chapter in course.outline
+        for lesson in chapter.lessons)
+
+
+def test_same_seed_same_course(tmp_path):
+    first = generate_course(tmp_path / "a", modules=2, lessons=2)
+    second = generate_course(tmp_path / "b", modules=2, lessons=2)
+
+    for path in first.rglob("*.md"):
+        assert path.read_text() == (second / path.relative_to(first)).read_text()
+
+
+def test_load(get_db, tmp_path):
+    migrate()
+    CourseLoader(generate_course(tmp_path, modules=2, lessons=3)).load()
+
+    course = db.Course.find(key="synthetic")
+    outline = course.get_outline()
+    assert [len(module["lessons"]) for module in outline] == [3, 3]
@@ -0,0 +1,45 @@
+import time
+
+from riyaz import timings
+
+
+def test_stages():
+    with timings.record() as t:
+        with timings.stage("parse", rows=1) as stage:
+            stage.bytes += 10
+            with timings.stage("read", rows=2, bytes=5):
+                time.sleep(0.02)
+        with timings.stage("read", rows=1):
+            pass
+
+    assert list(t.stages) == ["parse", "read"]
+    assert (t.stages["read"].count, t.stages["read"].rows,
+            t.stages["read"].bytes) == (2, 3, 5)
+    assert t.stages["parse"].bytes == 10
+
+    # the time of read isn't counted in parse
+    assert t.stages["read"].seconds >= 0.02
+    assert t.stages["parse"].seconds < 0.02
+    assert t.get_total() >= 0.02
+    assert t.to_dict()["parse"]["rows"] == 1
+
+
+def test_not_recording():
+    with timings.stage("parse", rows=1) as stage:
+        stage.bytes += 1
+
+    with timings.record() as t:
+        pass
+    assert t.stages == {}
+
+
+def test_record_into():
+    t = timings.Timings()
+    with timings.record(t):
+        with timings.stage("parse"):
+            pass
+    with timings.record(t):
+        with timings.stage("load"):
+            pass
+
+    assert list(t.stages) == ["parse", "load"]